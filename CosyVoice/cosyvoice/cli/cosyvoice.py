@@ -22,6 +22,7 @@ from cosyvoice.cli.frontend import CosyVoiceFrontEnd
 from cosyvoice.cli.model import CosyVoiceModel, CosyVoice2Model
 from cosyvoice.utils.file_utils import logging
 from cosyvoice.utils.class_utils import get_model_type
+from cosyvoice.utils.prompt_cache import PromptCache
 
 
 class CosyVoice:
@@ -75,6 +76,16 @@ class CosyVoice:
         self.frontend.spk2info[zero_shot_spk_id] = model_input
         return True
 
+    def enable_prompt_cache(self, cache_dir=None, max_entries=32, max_disk_entries=256):
+        self.frontend.prompt_cache = PromptCache(self.frontend.device, cache_dir, max_entries, max_disk_entries)
+
+    def add_cached_zero_shot_spk(self, prompt_text, prompt_speech_16k, text_frontend=True):
+        """return a zero_shot_spk_id for the prompt, running the onnx sessions only on cache miss"""
+        if self.frontend.prompt_cache is None:
+            self.enable_prompt_cache()
+        prompt_text = self.frontend.text_normalize(prompt_text, split=False, text_frontend=text_frontend)
+        return self.frontend.add_cached_zero_shot_spk(prompt_text, prompt_speech_16k, self.sample_rate)
+
     def save_spkinfo(self):
         torch.save(self.frontend.spk2info, '{}/spk2info.pt'.format(self.model_dir))
 
@@ -23,6 +23,7 @@ import torchaudio.compliance.kaldi as kaldi
 import torchaudio
 import os
 import re
+import hashlib
 import inflect
 try:
     import ttsfrd
@@ -33,6 +34,7 @@ except ImportError:
     from wetext import Normalizer as EnNormalizer
     use_ttsfrd = False
 from cosyvoice.utils.file_utils import logging
+from cosyvoice.utils.prompt_cache import prompt_cache_key
 from cosyvoice.utils.frontend_utils import contains_chinese, replace_blank, replace_corner_mark, remove_bracket, spell_out_number, split_paragraph, is_only_punctuation
 
 
@@ -71,6 +73,7 @@ class CosyVoiceFrontEnd:
             self.zh_tn_model = ZhNormalizer(remove_erhua=False)
             self.en_tn_model = EnNormalizer()
             self.inflect_parser = inflect.engine()
+        self.prompt_cache = None
 
     def _extract_text_token(self, text):
         if isinstance(text, Generator):
@@ -154,30 +157,62 @@ class CosyVoiceFrontEnd:
         model_input = {'text': tts_text_token, 'text_len': tts_text_token_len, 'llm_embedding': embedding, 'flow_embedding': embedding}
         return model_input
 
+    def _extract_prompt_speech(self, prompt_speech_16k, resample_rate):
+        prompt_speech_resample = torchaudio.transforms.Resample(orig_freq=16000, new_freq=resample_rate)(prompt_speech_16k)
+        speech_feat, speech_feat_len = self._extract_speech_feat(prompt_speech_resample)
+        speech_token, speech_token_len = self._extract_speech_token(prompt_speech_16k)
+        if resample_rate == 24000:
+            # cosyvoice2, force speech_feat % speech_token = 2
+            token_len = min(int(speech_feat.shape[1] / 2), speech_token.shape[1])
+            speech_feat, speech_feat_len[:] = speech_feat[:, :2 * token_len], 2 * token_len
+            speech_token, speech_token_len[:] = speech_token[:, :token_len], token_len
+        embedding = self._extract_spk_embedding(prompt_speech_16k)
+        return {'llm_prompt_speech_token': speech_token, 'llm_prompt_speech_token_len': speech_token_len,
+                'flow_prompt_speech_token': speech_token, 'flow_prompt_speech_token_len': speech_token_len,
+                'prompt_speech_feat': speech_feat, 'prompt_speech_feat_len': speech_feat_len,
+                'llm_embedding': embedding, 'flow_embedding': embedding}
+
     def frontend_zero_shot(self, tts_text, prompt_text, prompt_speech_16k, resample_rate, zero_shot_spk_id):
         tts_text_token, tts_text_token_len = self._extract_text_token(tts_text)
         if zero_shot_spk_id == '':
             prompt_text_token, prompt_text_token_len = self._extract_text_token(prompt_text)
-            prompt_speech_resample = torchaudio.transforms.Resample(orig_freq=16000, new_freq=resample_rate)(prompt_speech_16k)
-            speech_feat, speech_feat_len = self._extract_speech_feat(prompt_speech_resample)
-            speech_token, speech_token_len = self._extract_speech_token(prompt_speech_16k)
-            if resample_rate == 24000:
-                # cosyvoice2, force speech_feat % speech_token = 2
-                token_len = min(int(speech_feat.shape[1] / 2), speech_token.shape[1])
-                speech_feat, speech_feat_len[:] = speech_feat[:, :2 * token_len], 2 * token_len
-                speech_token, speech_token_len[:] = speech_token[:, :token_len], token_len
-            embedding = self._extract_spk_embedding(prompt_speech_16k)
-            model_input = {'prompt_text': prompt_text_token, 'prompt_text_len': prompt_text_token_len,
-                           'llm_prompt_speech_token': speech_token, 'llm_prompt_speech_token_len': speech_token_len,
-                           'flow_prompt_speech_token': speech_token, 'flow_prompt_speech_token_len': speech_token_len,
-                           'prompt_speech_feat': speech_feat, 'prompt_speech_feat_len': speech_feat_len,
-                           'llm_embedding': embedding, 'flow_embedding': embedding}
+            model_input = {'prompt_text': prompt_text_token, 'prompt_text_len': prompt_text_token_len}
+            model_input.update(self._extract_prompt_speech(prompt_speech_16k, resample_rate))
         else:
-            model_input = self.spk2info[zero_shot_spk_id]
+            # copy, callers delete keys from the returned dict (cross_lingual / instruct2)
+            model_input = dict(self.get_spk_info(zero_shot_spk_id))
         model_input['text'] = tts_text_token
         model_input['text_len'] = tts_text_token_len
         return model_input
 
+    def add_cached_zero_shot_spk(self, prompt_text, prompt_speech_16k, resample_rate):
+        """register the prompt and return its zero_shot_spk_id. the speech token / speech feat / speaker
+        embedding come from prompt_cache keyed by audio content, so the onnx sessions only run on a new voice"""
+        speech_key = prompt_cache_key(prompt_speech_16k, resample_rate)
+        zero_shot_spk_id = '{}_{}'.format(speech_key, hashlib.sha256(prompt_text.encode('utf-8')).hexdigest()[:12])
+        if self.prompt_cache.get(zero_shot_spk_id) is not None:
+            return zero_shot_spk_id
+        prompt_speech = self.prompt_cache.get(speech_key)
+        if prompt_speech is None:
+            logging.info('prompt cache miss {}, extract prompt speech'.format(speech_key))
+            prompt_speech = self._extract_prompt_speech(prompt_speech_16k, resample_rate)
+            self.prompt_cache.put(speech_key, prompt_speech)
+        prompt_text_token, prompt_text_token_len = self._extract_text_token(prompt_text)
+        model_input = {'prompt_text': prompt_text_token, 'prompt_text_len': prompt_text_token_len}
+        model_input.update(prompt_speech)
+        # text tokens are cheap, keep the combined entry in memory only
+        self.prompt_cache.put(zero_shot_spk_id, model_input, persist=False)
+        return zero_shot_spk_id
+
+    def get_spk_info(self, spk_id):
+        if spk_id in self.spk2info:
+            return self.spk2info[spk_id]
+        if self.prompt_cache is not None:
+            model_input = self.prompt_cache.get(spk_id)
+            if model_input is not None:
+                return model_input
+        raise KeyError('unknown zero_shot_spk_id {}'.format(spk_id))
+
     def frontend_cross_lingual(self, tts_text, prompt_speech_16k, resample_rate, zero_shot_spk_id):
         model_input = self.frontend_zero_shot(tts_text, '', prompt_speech_16k, resample_rate, zero_shot_spk_id)
         # in cross lingual mode, we remove prompt in llm
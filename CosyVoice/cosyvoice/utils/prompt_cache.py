@@ -0,0 +1,77 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import torch
+from cosyvoice.utils.file_utils import logging
+
+
+def prompt_cache_key(prompt_speech_16k, resample_rate):
+    """content hash of the (already trimmed and resampled to 16k) prompt audio"""
+    h = hashlib.sha256()
+    h.update(prompt_speech_16k.detach().cpu().contiguous().numpy().tobytes())
+    h.update(str(resample_rate).encode('utf-8'))
+    return 'prompt_{}'.format(h.hexdigest()[:32])
+
+
+class PromptCache:
+    """LRU cache of prompt-derived model inputs (speech token, speech feat, speaker embedding),
+    kept in memory and optionally persisted as one .pt file per entry in cache_dir."""
+
+    def __init__(self, device, cache_dir=None, max_entries=32, max_disk_entries=256):
+        self.device = device
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '{}.pt'.format(key))
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if self.cache_dir is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            model_input = torch.load(self._path(key), map_location=self.device)
+        except Exception as e:
+            logging.warning('failed to load prompt cache {}: {}'.format(key, e))
+            return None
+        # touch so disk eviction follows access order
+        os.utime(self._path(key))
+        self._put_memory(key, model_input)
+        return model_input
+
+    def put(self, key, model_input, persist=True):
+        self._put_memory(key, model_input)
+        if self.cache_dir is None or persist is False:
+            return
+        tmp_path = '{}.tmp.{}'.format(self._path(key), os.getpid())
+        torch.save({k: v.cpu() for k, v in model_input.items()}, tmp_path)
+        os.replace(tmp_path, self._path(key))
+        self._evict_disk()
+
+    def _put_memory(self, key, model_input):
+        with self.lock:
+            self.entries[key] = model_input
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _evict_disk(self):
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                 if f.startswith('prompt_') and f.endswith('.pt')]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for f in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
@@ -3,6 +3,16 @@ set -e
 
 # Usage:
 #   ./run_cosyvoice.sh --model_dir <dir> --prompt_wav <wav> --prompt_text <text> --tts_text <text> --language <zh|en> --speed <speed> --output_file <file>
+#
+# Resident synthesis server (model stays loaded between requests):
+#   ./run_cosyvoice.sh serve --port 50001 [--model_dir <dir>]
+
+if [ "$1" = "serve" ]; then
+  shift
+  SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+  cd "$SCRIPT_DIR"
+  exec conda run -n cosyvoice --no-capture-output python ./tts_server.py "$@"
+fi
 
 # Parse arguments
 MODEL_DIR=""
@@ -13,6 +13,37 @@ from cosyvoice.cli.cosyvoice import CosyVoice2
 from cosyvoice.utils.file_utils import load_wav
 
 
+def synthesize(cosyvoice, tts_text, prompt_text, prompt_speech_16k, language='en', speed=1.0, stream=False):
+    """
+    按语言选择推理方式，逐段产出合成语音 (1, T) 张量
+    - zh: inference_zero_shot，需要 prompt_text
+    - en: inference_cross_lingual，文本加 <|en|> 语言标记
+    启用了提示音频缓存（enable_prompt_cache）时，同一参考音频只提取一次语音 token / 说话人向量
+    """
+    if language != 'zh':
+        prompt_text = ''
+    zero_shot_spk_id = ''
+    if cosyvoice.frontend.prompt_cache is not None:
+        zero_shot_spk_id = cosyvoice.add_cached_zero_shot_spk(prompt_text, prompt_speech_16k)
+
+    if language == 'zh':
+        model_output = cosyvoice.inference_zero_shot(
+            tts_text,
+            prompt_text,
+            prompt_speech_16k,
+            zero_shot_spk_id=zero_shot_spk_id,
+            stream=stream,
+            speed=speed)
+    else:
+        model_output = cosyvoice.inference_cross_lingual(
+            f'<|en|>{tts_text}',
+            prompt_speech_16k,
+            zero_shot_spk_id=zero_shot_spk_id,
+            stream=stream,
+            speed=speed)
+    for j in model_output:
+        yield j['tts_speech']
+
 
 def main():
     parser = argparse.ArgumentParser(description='CosyVoice 语音克隆工具')
@@ -44,6 +75,9 @@ def main():
     parser.add_argument('--output_file',
                         default='cloned_voice.wav',
                         help='输出文件名')
+    parser.add_argument('--prompt_cache_dir',
+                        default='./prompt_cache',
+                        help='参考音频特征缓存目录，置空则不缓存')
 
     args = parser.parse_args()
 
@@ -59,6 +93,8 @@ def main():
     # 加载模型
     print("正在加载模型...")
     cosyvoice = CosyVoice2(args.model_dir, load_jit=False, load_trt=False, load_vllm=False, fp16=False)
+    if args.prompt_cache_dir:
+        cosyvoice.enable_prompt_cache(os.path.join(args.prompt_cache_dir, os.path.basename(os.path.normpath(args.model_dir))))
 
     # 加载参考音频
     print("正在加载参考音频...")
@@ -77,32 +113,12 @@ def main():
     
     # 执行语音克隆
     output_files = []
-    if args.language == 'zh':
-        # 中文使用 inference_zero_shot 方法
-        for i, j in enumerate(cosyvoice.inference_zero_shot(
-            tts_text,
-            args.prompt_text,
-            prompt_speech_16k,
-            stream=False,
-            speed=args.speed)):
-            
-            output_filename = f'{os.path.splitext(output_filepath)[0]}_{i}.wav'
-            torchaudio.save(output_filename, j['tts_speech'], cosyvoice.sample_rate)
-            output_files.append(output_filename)
-            print(f"已保存: {output_filename}")
-    else:
-        # 英文使用 inference_cross_lingual 方法，添加语言标记
-        tts_text_with_tag = f'<|en|>{tts_text}'
-        for i, j in enumerate(cosyvoice.inference_cross_lingual(
-            tts_text_with_tag,
-            prompt_speech_16k,
-            stream=False,
-            speed=args.speed)):
-            
-            output_filename = f'{os.path.splitext(output_filepath)[0]}_{i}.wav'
-            torchaudio.save(output_filename, j['tts_speech'], cosyvoice.sample_rate)
-            output_files.append(output_filename)
-            print(f"已保存: {output_filename}")
+    for i, speech in enumerate(synthesize(cosyvoice, tts_text, args.prompt_text, prompt_speech_16k,
+                                          language=args.language, speed=args.speed)):
+        output_filename = f'{os.path.splitext(output_filepath)[0]}_{i}.wav'
+        torchaudio.save(output_filename, speech, cosyvoice.sample_rate)
+        output_files.append(output_filename)
+        print(f"已保存: {output_filename}")
     
     if output_files:
         print(f"语音克隆完成，共生成 {len(output_files)} 个文件:")
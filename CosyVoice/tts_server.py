@@ -0,0 +1,176 @@
+"""
+CosyVoice2 常驻合成服务
+
+run_cosyvoice.sh 每次合成都会重新构造 CosyVoice2（LLM、flow、HiFT、campplus/speech_tokenizer
+ONNX 会话以及文本归一化器全部重新加载），模型加载时间远大于短句的合成时间。
+本服务按模型目录只加载一次，启动时做一次预热合成，之后通过本地 HTTP 提交合成任务。
+
+启动（需在 cosyvoice 环境中）：
+    bash run_cosyvoice.sh serve --port 50001
+    或：python tts_server.py --port 50001 --model_dir ./pretrained_models/CosyVoice2-0.5B
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import logging
+logging.getLogger('matplotlib').setLevel(logging.WARNING)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(SCRIPT_DIR)
+sys.path.append('{}/third_party/Matcha-TTS'.format(SCRIPT_DIR))
+sys.path.append(SCRIPT_DIR)
+
+import torch
+import torchaudio
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from cosyvoice.cli.cosyvoice import CosyVoice2
+from cosyvoice.utils.file_utils import load_wav
+from test_cosyvoice import synthesize
+
+DEFAULT_MODEL_DIR = os.path.join(SCRIPT_DIR, 'pretrained_models', 'CosyVoice2-0.5B')
+WARMUP_PROMPT_WAV = os.path.join(SCRIPT_DIR, 'asset', 'zero_shot_prompt.wav')
+WARMUP_PROMPT_TEXT = '希望你以后能够做的比我还好呦。'
+# 参考音频特征缓存（与 test_cosyvoice.py 共用同一目录）
+PROMPT_CACHE_DIR = os.path.join(SCRIPT_DIR, 'prompt_cache')
+
+app = FastAPI()
+
+
+class ModelPool:
+    """按模型目录缓存 CosyVoice2 实例；同一模型的推理串行执行"""
+
+    def __init__(self):
+        self._models = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_dir):
+        model_dir = os.path.abspath(model_dir)
+        with self._lock:
+            if model_dir not in self._models:
+                start = time.time()
+                print(f"[tts_server] 正在加载模型: {model_dir}")
+                cosyvoice = CosyVoice2(model_dir, load_jit=False, load_trt=False, load_vllm=False, fp16=False)
+                cosyvoice.enable_prompt_cache(os.path.join(PROMPT_CACHE_DIR, os.path.basename(model_dir)))
+                self._models[model_dir] = cosyvoice
+                self._locks[model_dir] = threading.Lock()
+                print(f"[tts_server] 模型加载完成 ({time.time() - start:.1f}s)")
+                warmup(cosyvoice, self._locks[model_dir])
+            return self._models[model_dir], self._locks[model_dir]
+
+    def loaded(self):
+        return list(self._models.keys())
+
+
+pool = ModelPool()
+
+
+def warmup(cosyvoice, lock):
+    """用自带的提示音频合成一句短文本，触发 CUDA 初始化与算子编译"""
+    if not os.path.exists(WARMUP_PROMPT_WAV):
+        print(f"[tts_server] 预热音频不存在，跳过预热: {WARMUP_PROMPT_WAV}")
+        return
+    start = time.time()
+    prompt_speech_16k = load_wav(WARMUP_PROMPT_WAV, 16000)
+    with lock, torch.no_grad():
+        for _ in synthesize(cosyvoice, '你好。', WARMUP_PROMPT_TEXT, prompt_speech_16k, language='zh'):
+            pass
+    print(f"[tts_server] 预热完成 ({time.time() - start:.1f}s)")
+
+
+class SynthesizeRequest(BaseModel):
+    tts_text: str
+    prompt_wav: str
+    output_file: str = ''
+    prompt_text: str = ''
+    language: str = 'zh'
+    speed: float = 1.0
+    model_dir: str = DEFAULT_MODEL_DIR
+
+
+def _check_request(req):
+    if not os.path.exists(req.prompt_wav):
+        raise HTTPException(status_code=400, detail=f"参考音频不存在: {req.prompt_wav}")
+    if not os.path.exists(req.model_dir):
+        raise HTTPException(status_code=400, detail=f"模型目录不存在: {req.model_dir}")
+    if req.speed < 0.5 or req.speed > 2.0:
+        print(f"[tts_server] 警告: speed={req.speed} 不在有效范围 [0.5, 2.0] 内，使用默认值 1.0")
+        return 1.0
+    return req.speed
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "models": pool.loaded()}
+
+
+@app.post("/synthesize")
+def synthesize_endpoint(req: SynthesizeRequest):
+    """合成整段文本并写入 output_file（各分句拼接为单个 wav）"""
+    if not req.output_file:
+        raise HTTPException(status_code=400, detail="缺少 output_file")
+    speed = _check_request(req)
+
+    cosyvoice, lock = pool.get(req.model_dir)
+    prompt_speech_16k = load_wav(req.prompt_wav, 16000)
+
+    start = time.time()
+    with lock, torch.no_grad():
+        segments = list(synthesize(cosyvoice, req.tts_text, req.prompt_text, prompt_speech_16k,
+                                   language=req.language, speed=speed))
+    if not segments:
+        raise HTTPException(status_code=500, detail="合成失败，未生成任何音频")
+
+    speech = torch.concat(segments, dim=1)
+    os.makedirs(os.path.dirname(os.path.abspath(req.output_file)), exist_ok=True)
+    torchaudio.save(req.output_file, speech, cosyvoice.sample_rate)
+    duration = speech.shape[1] / cosyvoice.sample_rate
+    print(f"[tts_server] 合成 {duration:.2f}s 音频，用时 {time.time() - start:.2f}s: {req.output_file}")
+    return {"status": "success", "output_file": req.output_file, "duration": duration}
+
+
+@app.post("/synthesize_stream")
+def synthesize_stream_endpoint(req: SynthesizeRequest):
+    """
+    流式合成：以 stream=True 推理，边生成边返回 16bit 单声道 PCM（采样率见响应头 X-Sample-Rate）。
+    用于流式对话，首个音频块在整句合成完成前即可送往渲染。
+    """
+    speed = _check_request(req)
+    cosyvoice, lock = pool.get(req.model_dir)
+    prompt_speech_16k = load_wav(req.prompt_wav, 16000)
+
+    def generate():
+        start = time.time()
+        first = True
+        with lock, torch.no_grad():
+            for speech in synthesize(cosyvoice, req.tts_text, req.prompt_text, prompt_speech_16k,
+                                     language=req.language, speed=speed, stream=True):
+                if first:
+                    print(f"[tts_server] 首个音频块用时 {time.time() - start:.2f}s")
+                    first = False
+                yield (speech.numpy() * (2 ** 15)).clip(-2 ** 15, 2 ** 15 - 1).astype('int16').tobytes()
+
+    return StreamingResponse(generate(), media_type='application/octet-stream',
+                             headers={'X-Sample-Rate': str(cosyvoice.sample_rate)})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CosyVoice2 常驻合成服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50001)
+    parser.add_argument('--model_dir', action='append', default=[],
+                        help='启动时预加载的模型目录，可重复；默认 pretrained_models/CosyVoice2-0.5B')
+    args = parser.parse_args()
+
+    for model_dir in args.model_dir or [DEFAULT_MODEL_DIR]:
+        pool.get(model_dir)
+
+    # 同步路由在线程池中执行，同一模型由 ModelPool 中的锁串行化
+    uvicorn.run(app, host=args.host, port=args.port)
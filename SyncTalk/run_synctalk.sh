@@ -307,6 +307,7 @@ train() {
 infer() {
     local model_dir=""
     local audio_path=""
+    local output_path=""
     local gpu_arg="GPU0"
     
     while [[ $# -gt 0 ]]; do
@@ -319,6 +320,10 @@ infer() {
                 audio_path="$2"
                 shift 2
                 ;;
+            --output)
+                output_path="$2"
+                shift 2
+                ;;
             --gpu)
                 gpu_arg="$2"
                 shift 2
@@ -412,19 +417,31 @@ infer() {
     # 创建results目录
     mkdir -p "$results_dir"
     
-    # 复制音频文件到数据目录（确保容器内可以访问）
-    echo "复制音频文件到数据目录..."
-    rsync -u "$audio_path" "$audio_dir/"
-    local audio_filename=$(basename "$audio_path")
-    
     # 获取SyncTalk目录的绝对路径
     local synctalk_abs=$(realpath "$SYNCTALK_DIR")
+    local audio_filename=$(basename "$audio_path")
+    local request_mounts=()
+    local container_audio="$WORKSPACE/audio/${audio_filename}"
+
+    if [ -n "$output_path" ]; then
+        # 指定 --output：本次推理使用独立的结果目录与音频挂载，
+        # 并发请求不会共用 results/test_audio.mp4 或 audio/ 下的同名文件
+        results_dir=$(mktemp -d "$results_dir/run_XXXXXX")
+        request_mounts=(-v "$(realpath "$results_dir"):$WORKSPACE/model/${model_dir_name}/results"
+                        -v "$(realpath "$audio_path"):$WORKSPACE/request_audio/${audio_filename}:ro")
+        container_audio="$WORKSPACE/request_audio/${audio_filename}"
+    else
+        # 复制音频文件到数据目录（确保容器内可以访问）
+        echo "复制音频文件到数据目录..."
+        rsync -u "$audio_path" "$audio_dir/"
+    fi
     
     # 执行推理
     mock_docker run --rm $gpu_param \
         -v "$synctalk_abs/data:$WORKSPACE/data" \
         -v "$synctalk_abs/model:$WORKSPACE/model" \
         -v "$synctalk_abs/audio:$WORKSPACE/audio" \
+        "${request_mounts[@]}" \
         $IMAGE_NAME \
         python main.py "$WORKSPACE/data/${video_name}" \
         --workspace "$WORKSPACE/model/${model_dir_name}" \
@@ -432,13 +449,13 @@ infer() {
         --test \
         --test_train \
         --asr_model ave \
-        --aud "$WORKSPACE/audio/${audio_filename}" \
+        --aud "$container_audio" \
         --portrait \
         --ckpt "$WORKSPACE/model/${model_dir_name}/checkpoints/${checkpoint_file}"
     
     # 检查是否生成了默认输出文件并重命名
     local default_output="$results_dir/test_audio.mp4"
-    local final_output="$results_dir/$output_filename"
+    local final_output="${output_path:-$results_dir/$output_filename}"
     
     if [ -f "$default_output" ]; then
         echo "重命名输出文件..."
@@ -451,6 +468,10 @@ infer() {
         if [ -n "$found_output" ]; then
             local found_filename=$(basename "$found_output")
             echo "警告: 未找到默认输出文件 test_audio.mp4，但发现了其他输出文件: $found_filename"
+            if [ -n "$output_path" ]; then
+                mv "$found_output" "$final_output"
+                found_output="$final_output"
+            fi
             echo "输出视频: $found_output"
         else
             echo "错误: 推理完成但未找到输出视频文件"
@@ -458,6 +479,11 @@ infer() {
             exit 1
         fi
     fi
+
+    # 本次推理的独立结果目录只是中转
+    if [ -n "$output_path" ]; then
+        rm -rf "$results_dir"
+    fi
 }
 
 usage() {
@@ -473,6 +499,7 @@ usage() {
     echo "  $0 preprocess_only --video_path ./video.mp4 --gpu GPU1"
     echo "  $0 train_only --video_name video --gpu GPU0 --epochs 100"
     echo "  $0 infer --model_dir video_ep50 --source_image face.jpg --driven_audio speech.wav"
+    echo "  $0 infer --model_dir ./SyncTalk/model/video_ep50 --audio_path speech.wav --output out.mp4"
     echo "  $0 list"
 }
 
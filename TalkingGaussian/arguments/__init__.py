@@ -57,6 +57,15 @@ class ModelParams(ParamGroup):
         self.audio = ""
         self.init_num = 10_000
         self.audio_extractor = "deepspeech"
+        # 训练帧默认按需读取：内存/设备 LRU 缓存的帧数与预取视角数；--preload 恢复全部预加载
+        self.preload = False
+        self.host_cache = 256
+        self.device_cache = 32
+        self.prefetch = 8
+        self.loader_workers = 4
+        # 点云检查点保存为 point_cloud.gsb（scene/gaussian_io.py）；--export_ply 同时导出 PLY，--half_checkpoint 以 fp16 保存 SH/不透明度/尺度/旋转
+        self.export_ply = False
+        self.half_checkpoint = False
         super().__init__(parser, "Loading Parameters", sentinel)
 
     def extract(self, args):
@@ -95,8 +104,9 @@ class OptimizationParams(ParamGroup):
         self.random_background = False
         super().__init__(parser, "Optimization Parameters")
 
-def get_combined_args(parser : ArgumentParser):
-    cmdlne_string = sys.argv[1:]
+def get_combined_args(parser : ArgumentParser, cmdlne_string = None):
+    if cmdlne_string is None:
+        cmdlne_string = sys.argv[1:]
     cfgfile_string = "Namespace()"
     args_cmdline = parser.parse_args(cmdlne_string)
 
@@ -0,0 +1,216 @@
+#
+# 训练后的高斯压缩：按训练视角上的累计贡献剪枝、降低 SH 阶数、fp16 / 向量量化，
+# 并用 metrics.py 的 PSNR / SSIM 指标与渲染 fps 对比压缩前后，结果导出为模型包（scene/bundle.py）。
+#
+# 贡献度：用全 1 的逐高斯颜色（colors_precomp）代替 SH 渲染，图像所有像素求和后反传，
+# 颜色的梯度即该高斯在各像素上的 alpha * 透射率之和，在所选训练视角上累计。
+# 不对 SH 系数求导：SH -> RGB 在 0 处截断，颜色被截断的高斯（深色头发、瞳孔、口腔）梯度为 0，会被误剪。
+#
+# 用法：python compact.py -S <dataset> -M <model_path> --prune_ratio 0.4 --quantize vq
+#
+
+import os
+import json
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+from PIL import Image
+from tqdm import tqdm
+
+from arguments import ModelParams, PipelineParams, get_combined_args
+from gaussian_renderer import render_motion, render_motion_mouth
+from scene.inference_cache import load_inference_cameras
+from scene.bundle import export_bundle, BUNDLE_EXT
+from synthesize_fuse import load_fuse_models, render_frames
+from metrics import PSNRMeter, SSIMMeter
+from utils.general_utils import safe_state
+
+
+def evenly(views, num):
+    if num <= 0 or num >= len(views):
+        return views
+    return [views[i] for i in np.linspace(0, len(views) - 1, num).astype(int)]
+
+
+def contribution(views, gaussians, motion_net, render_fn, pipeline, background):
+    """每个高斯在 views 上的累计贡献（alpha * 透射率之和）"""
+    params = (gaussians._xyz, gaussians._features_dc, gaussians._features_rest, gaussians._opacity,
+              gaussians._scaling, gaussians._rotation, *motion_net.parameters())
+    for p in params:
+        p.requires_grad_(False)
+    xyz = gaussians.get_xyz
+    ones = torch.ones(xyz.shape[0], 3, device=xyz.device, requires_grad=True)
+
+    score = torch.zeros(xyz.shape[0], device=xyz.device)
+    for view in tqdm(views, desc="contribution", ascii=True):
+        ones.grad = None
+        render_pkg = render_fn(view, gaussians, motion_net, pipeline, background, frame_idx=0, override_color=ones)
+        render_pkg["render"].sum().backward()
+        # 三个通道的权重相同，取一个通道
+        score += ones.grad[:, 0]
+    return score
+
+
+def prune(gaussians, score, ratio, min_opacity):
+    """去掉贡献最低的 ratio 比例以及从未贡献、不透明度低于 min_opacity 的高斯，返回保留数"""
+    keep = score > 0
+    if min_opacity > 0:
+        keep &= gaussians.get_opacity[:, 0] >= min_opacity
+    if ratio > 0:
+        threshold = torch.quantile(score[keep], ratio) if keep.sum() > 0 else 0
+        keep &= score >= threshold
+    gaussians.keep_points(keep)
+    return int(keep.sum())
+
+
+def reduce_sh(gaussians, target_sh_degree, energy):
+    """
+    target_sh_degree: 全局截断到该阶（高于该阶的系数置零并降低 active_sh_degree，光栅化时少算系数）
+    energy: 高阶能量与 DC 之比低于该值的高斯，去掉全部视角相关颜色
+    """
+    rest = gaussians._features_rest.data
+    if target_sh_degree is not None and target_sh_degree < gaussians.active_sh_degree:
+        rest[:, (target_sh_degree + 1) ** 2 - 1:] = 0
+        gaussians.active_sh_degree = target_sh_degree
+    if energy > 0:
+        ratio = rest.norm(dim=(1, 2)) / gaussians._features_dc.data.norm(dim=(1, 2)).clamp_min(1e-8)
+        rest[ratio < energy] = 0
+        return int((ratio < energy).sum())
+    return 0
+
+
+def kmeans(x, k, iters=10, chunk=65536):
+    """x: [N, D]，返回 (codebook [k, D], index [N])"""
+    k = min(k, x.shape[0])
+    codebook = x[torch.randperm(x.shape[0], device=x.device)[:k]].clone()
+    index = torch.zeros(x.shape[0], dtype=torch.long, device=x.device)
+    for _ in range(iters):
+        for start in range(0, x.shape[0], chunk):
+            index[start:start + chunk] = torch.cdist(x[start:start + chunk], codebook).argmin(dim=1)
+        sums = torch.zeros_like(codebook).index_add_(0, index, x)
+        counts = torch.bincount(index, minlength=k).clamp_min(1)[:, None]
+        # 空簇保持原中心
+        used = torch.bincount(index, minlength=k) > 0
+        codebook[used] = (sums / counts)[used]
+    for start in range(0, x.shape[0], chunk):
+        index[start:start + chunk] = torch.cdist(x[start:start + chunk], codebook).argmin(dim=1)
+    return codebook, index
+
+
+def quantize(gaussians, mode, codebook_size):
+    """
+    fp16: 除 xyz 外的属性经 fp16 往返（与 --half 模型包一致）
+    vq:   features_rest（体积最大的 SH 高阶系数）用 k-means 码本量化，其余同 fp16
+    返回写入模型包的码本 {name: (codebook, index)}
+    """
+    codebooks = {}
+    if mode == 'none':
+        return codebooks
+    if mode == 'vq':
+        rest = gaussians._features_rest.data
+        codebook, index = kmeans(rest.flatten(1), codebook_size)
+        codebook = codebook.view(-1, *rest.shape[1:])
+        rest.copy_(codebook[index])
+        codebooks['features_rest'] = (codebook.cpu().numpy(), index.cpu().numpy())
+    for name in ('_features_dc', '_features_rest', '_opacity', '_scaling', '_rotation'):
+        param = getattr(gaussians, name).data
+        param.copy_(param.half().float())
+    return codebooks
+
+
+def read_gt(view):
+    image = np.array(Image.open(view.image_path).convert("RGB"), dtype=np.float32) / 255.0
+    return torch.from_numpy(image)[None]
+
+
+def evaluate(views, models, pipeline, background, batch_size):
+    """返回 (PSNR, SSIM, fps)"""
+    psnr_meter, ssim_meter = PSNRMeter(), SSIMMeter()
+    images = []
+    torch.cuda.synchronize()
+    start = time.time()
+    for out in render_frames(views, *models, pipeline, background, False, batch_size):
+        images.append(out["image"].clamp(0, 1))
+    torch.cuda.synchronize()
+    fps = len(views) / max(time.time() - start, 1e-6)
+    for view, image in zip(views, images):
+        pred = image.permute(1, 2, 0)[None]
+        truth = read_gt(view).to(pred.device)
+        psnr_meter.update(pred, truth)
+        ssim_meter.update(pred, truth)
+    return psnr_meter.measure(), ssim_meter.measure(), fps
+
+
+def compact(dataset, pipeline, args):
+    bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+
+    models = load_fuse_models(dataset)
+    gaussians, motion_net, gaussians_mouth, motion_net_mouth = models
+    train_views = evenly(load_inference_cameras(dataset.source_path, "transforms_train.json",
+                                                audio_extractor=dataset.audio_extractor, data_device=dataset.data_device),
+                         args.num_views)
+    eval_views = evenly(load_inference_cameras(dataset.source_path, "transforms_val.json",
+                                               audio_extractor=dataset.audio_extractor, data_device=dataset.data_device),
+                        args.num_eval)
+
+    report = {'before': {'face': gaussians.get_xyz.shape[0], 'mouth': gaussians_mouth.get_xyz.shape[0]}}
+    with torch.no_grad():
+        # 预热，排除 CUDA 初始化
+        evaluate(eval_views[:2], models, pipeline, background, args.batch_size)
+        report['before'].update(zip(('psnr', 'ssim', 'fps'), evaluate(eval_views, models, pipeline, background, args.batch_size)))
+
+    codebooks = []
+    for name, pc, net, render_fn in (('face', gaussians, motion_net, render_motion),
+                                     ('mouth', gaussians_mouth, motion_net_mouth, render_motion_mouth)):
+        score = contribution(train_views, pc, net, render_fn, pipeline, background)
+        with torch.no_grad():
+            kept = prune(pc, score, args.prune_ratio, args.min_opacity)
+            sh_zeroed = reduce_sh(pc, args.target_sh_degree, args.sh_energy)
+            codebooks.append(quantize(pc, args.quantize, args.codebook_size))
+            net.clear_static_cache()
+            net.cache_static(pc.get_xyz)
+        print(f"[INFO] {name}: {report['before'][name]} -> {kept} gaussians, SH rest removed for {sh_zeroed}")
+        report.setdefault('after', {})[name] = kept
+
+    with torch.no_grad():
+        report['after'].update(zip(('psnr', 'ssim', 'fps'), evaluate(eval_views, models, pipeline, background, args.batch_size)))
+
+    output = args.output or os.path.join(dataset.model_path, "model_compact" + BUNDLE_EXT)
+    export_bundle(dataset, output, half=args.quantize != 'none', models=models, codebooks=tuple(codebooks))
+    report['bundle'] = output
+    report['bundle_mb'] = os.path.getsize(output) / 2 ** 20
+    report['settings'] = {k: getattr(args, k) for k in ('prune_ratio', 'min_opacity', 'target_sh_degree', 'sh_energy', 'quantize', 'codebook_size')}
+
+    before, after = report['before'], report['after']
+    print(f"[INFO] gaussians: face {before['face']} -> {after['face']}, mouth {before['mouth']} -> {after['mouth']}")
+    print(f"[INFO] PSNR {before['psnr']:.3f} -> {after['psnr']:.3f} ({after['psnr'] - before['psnr']:+.3f} dB)")
+    print(f"[INFO] SSIM {before['ssim']:.4f} -> {after['ssim']:.4f} ({after['ssim'] - before['ssim']:+.4f})")
+    print(f"[INFO] fps  {before['fps']:.1f} -> {after['fps']:.1f} (x{after['fps'] / before['fps']:.2f})")
+    with open(os.path.join(dataset.model_path, "compact_report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Post-training gaussian compaction")
+    model = ModelParams(parser)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--prune_ratio", default=0.4, type=float, help="按累计贡献去掉的高斯比例")
+    parser.add_argument("--min_opacity", default=0.005, type=float)
+    # ModelParams 已有 --sh_degree（模型的 SH 阶数）
+    parser.add_argument("--target_sh_degree", default=None, type=int, help="全局截断的 SH 阶数")
+    parser.add_argument("--sh_energy", default=0.0, type=float, help="高阶/DC 能量比低于该值的高斯去掉视角相关颜色")
+    parser.add_argument("--quantize", default="fp16", choices=["none", "fp16", "vq"])
+    parser.add_argument("--codebook_size", default=4096, type=int)
+    parser.add_argument("--num_views", default=300, type=int, help="统计贡献度的训练视角数")
+    parser.add_argument("--num_eval", default=200, type=int, help="评估 PSNR/SSIM/fps 的验证帧数")
+    parser.add_argument("--batch_size", default=8, type=int)
+    parser.add_argument("--output", default=None, type=str, help="缺省为 <model_path>/model_compact.tgb")
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    safe_state(args.quiet)
+
+    compact(model.extract(args), pipeline.extract(args), args)
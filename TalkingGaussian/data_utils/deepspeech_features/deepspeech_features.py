@@ -3,7 +3,7 @@
     NB: Based on VOCA code. See the corresponding license restrictions.
 """
 
-__all__ = ['conv_audios_to_deepspeech']
+__all__ = ['conv_audios_to_deepspeech', 'DeepSpeechExtractor']
 
 import numpy as np
 import warnings
@@ -61,17 +61,79 @@ def conv_audios_to_deepspeech(audios,
                         input_node_ph: x[np.newaxis, ...],
                         input_lengths_ph: [x.shape[0]]}))
 
-            net_output = ds_features.reshape(-1, 29)
-            win_size = 16
-            zero_pad = np.zeros((int(win_size / 2), net_output.shape[1]))
-            net_output = np.concatenate(
-                (zero_pad, net_output, zero_pad), axis=0)
-            windows = []
-            for window_index in range(0, net_output.shape[0] - win_size, 2):
-                windows.append(
-                    net_output[window_index:window_index + win_size])
-            print(np.array(windows).shape)
-            np.save(out_file_path, np.array(windows))
+            windows = make_video_windows(ds_features.reshape(-1, 29))
+            print(windows.shape)
+            np.save(out_file_path, windows)
+
+
+def make_video_windows(net_output, win_size=16):
+    """
+    Group 50 FPS DeepSpeech logits into one window per 25 FPS video frame.
+
+    Parameters
+    ----------
+    net_output : np.array
+        DeepSpeech logits of shape (num_ds_frames, 29).
+    win_size : int, default 16
+        Window size in DeepSpeech frames.
+
+    Returns
+    -------
+    np.array
+        Windows of shape (num_video_frames, win_size, 29).
+    """
+    zero_pad = np.zeros((int(win_size / 2), net_output.shape[1]))
+    net_output = np.concatenate(
+        (zero_pad, net_output, zero_pad), axis=0)
+    windows = []
+    for window_index in range(0, net_output.shape[0] - win_size, 2):
+        windows.append(
+            net_output[window_index:window_index + win_size])
+    return np.array(windows)
+
+
+class DeepSpeechExtractor(object):
+    """
+    DeepSpeech network kept loaded for repeated extraction (e.g. a resident render server).
+
+    Parameters
+    ----------
+    deepspeech_pb_path : str
+        Path to DeepSpeech 0.1.0 frozen model.
+    """
+    def __init__(self, deepspeech_pb_path):
+        self.graph, self.logits_ph, self.input_node_ph, self.input_lengths_ph = prepare_deepspeech_net(
+            deepspeech_pb_path)
+        self.sess = tf.compat.v1.Session(graph=self.graph)
+
+    def __call__(self, audio, audio_sample_rate=16000):
+        """
+        Extract features of one audio clip.
+
+        Parameters
+        ----------
+        audio : np.array
+            Mono audio data (int16 range).
+        audio_sample_rate : int, default 16000
+            Audio sample rate.
+
+        Returns
+        -------
+        np.array
+            Features of shape (num_video_frames, 16, 29), as saved by conv_audios_to_deepspeech.
+        """
+        ds_features = pure_conv_audio_to_deepspeech(
+            audio=audio,
+            audio_sample_rate=audio_sample_rate,
+            audio_window_size=1,
+            audio_window_stride=1,
+            num_frames=None,
+            net_fn=lambda x: self.sess.run(
+                self.logits_ph,
+                feed_dict={
+                    self.input_node_ph: x[np.newaxis, ...],
+                    self.input_lengths_ph: [x.shape[0]]}))
+        return make_video_windows(ds_features.reshape(-1, 29))
 
 
 def prepare_deepspeech_net(deepspeech_pb_path):
@@ -2,32 +2,109 @@
 from argparse import ArgumentParser
 
 from mmseg.apis import inference_segmentor, init_segmentor, show_result_pyplot
+from mmseg.apis.inference import LoadImage
+from mmseg.datasets.pipelines import Compose
+from mmcv.parallel import collate, scatter
 
 import os
+import sys
 import glob
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import numpy as np
+import torch
+
+class FrameDataset(torch.utils.data.Dataset):
+    """ runs the test pipeline (load, resize, normalize) in the loader workers """
+
+    def __init__(self, files, pipeline, store_dir=None):
+        self.files = files
+        self.pipeline = pipeline
+        self.store_dir = store_dir
+        self.frames = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, idx):
+        file = self.files[idx]
+        img = file
+        if self.store_dir is not None:
+            # opened lazily so that each loader worker maps the file itself
+            if self.frames is None:
+                from frame_store import FrameStore
+                self.frames = FrameStore(self.store_dir).open('ori')
+            img = np.asarray(self.frames[frame_id(file)])
+        data = self.pipeline(dict(img=img))
+        data['file'] = file
+        return data
+
+
+def frame_id(file):
+    return int(os.path.splitext(os.path.basename(file))[0])
+
 
 def main():
     parser = ArgumentParser()
     parser.add_argument('datset', help='Image file')
     parser.add_argument('--config', default="./data_utils/easyportrait/local_configs/easyportrait_experiments_v2/fpn-fp/fpn-fp.py", help='Config file')
     parser.add_argument('--checkpoint', default="./data_utils/easyportrait/fpn-fp-512.pth", help='Checkpoint file')
+    parser.add_argument('--store', action='store_true', help='read frames from the frame store (frames/ori.bin) and write frames/teeth.bin')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--num_workers', type=int, default=4, help='data loader workers / result writer threads')
+    parser.add_argument('--device', default=None, help='cuda:0 or cpu, default: cuda:0 if available')
 
     args = parser.parse_args()
+    device = args.device or ('cuda:0' if torch.cuda.is_available() else 'cpu')
 
     # build the model from a config file and a checkpoint file
-    model = init_segmentor(args.config, args.checkpoint, device='cuda:0')
+    model = init_segmentor(args.config, args.checkpoint, device=device)
+    pipeline = Compose([LoadImage()] + model.cfg.data.test.pipeline[1:])
 
-    # test a single image
     dataset_path = os.path.join(args.datset, 'ori_imgs')
     out_path = os.path.join(args.datset, 'teeth_mask')
     os.makedirs(out_path, exist_ok=True)
 
-    for file in tqdm(glob.glob(os.path.join(dataset_path, '*.jpg'))):
-        result = inference_segmentor(model, file)
-        result[0][result[0]!=7] = 0
-        np.save(file.replace('jpg', 'npy').replace('ori_imgs', 'teeth_mask'), result[0].astype(np.bool_))
+    files = glob.glob(os.path.join(dataset_path, '*.jpg'))
+    store_dir, teeth = None, None
+    if args.store:
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from frame_store import FrameStore
+        store = FrameStore(args.datset)
+        store_dir = args.datset
+        teeth = store.create('teeth', store.open('ori').shape[:3], np.bool_)
+
+    loader = torch.utils.data.DataLoader(
+        FrameDataset(files, pipeline, store_dir), batch_size=args.batch_size, num_workers=args.num_workers,
+        collate_fn=partial(collate, samples_per_gpu=args.batch_size))
+
+    def save(file, mask):
+        np.save(file.replace('jpg', 'npy').replace('ori_imgs', 'teeth_mask'), mask)
+        if teeth is not None:
+            teeth[frame_id(file)] = mask
+
+    with ThreadPoolExecutor(max(1, args.num_workers)) as pool, tqdm(total=len(files)) as pbar:
+        pending = []
+        for data in loader:
+            batch_files = data.pop('file')
+            # same as inference_segmentor, for a whole batch
+            if next(model.parameters()).is_cuda:
+                data = scatter(data, [torch.device(device)])[0]
+            else:
+                data['img_metas'] = [i.data[0] for i in data['img_metas']]
+            with torch.no_grad():
+                results = model(return_loss=False, rescale=True, **data)
+            for file, result in zip(batch_files, results):
+                pending.append(pool.submit(save, file, result == 7))
+            while len(pending) > 4 * args.batch_size:
+                pending.pop(0).result()
+            pbar.update(len(batch_files))
+        for future in pending:
+            future.result()
+
+    if teeth is not None:
+        teeth.flush()
 
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@ from model import BiSeNet
 import torch
 
 import os
+import sys
 import os.path as osp
 
 from PIL import Image
@@ -14,13 +15,12 @@ import cv2
 from pathlib import Path
 import configargparse
 import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 # import ttach as tta
 
 def vis_parsing_maps(im, parsing_anno, stride, save_im=False, save_path='vis_results/parsing_map_on_im.jpg',
                      img_size=(512, 512)):
-    im = np.array(im)
-    vis_im = im.copy().astype(np.uint8)
     vis_parsing_anno = parsing_anno.copy().astype(np.uint8)
     vis_parsing_anno = cv2.resize(
         vis_parsing_anno, None, fx=stride, fy=stride, interpolation=cv2.INTER_NEAREST)
@@ -56,44 +56,94 @@ def vis_parsing_maps(im, parsing_anno, stride, save_im=False, save_path='vis_res
                         interpolation=cv2.INTER_NEAREST)
     if save_im:
         cv2.imwrite(save_path, vis_im)
-
-
-def evaluate(respth='./res/test_res', dspth='./data', cp='model_final_diss.pth'):
+    return vis_im
+
+
+class FrameDataset(torch.utils.data.Dataset):
+    """ frames (image files or the frame store) resized and normalized for BiSeNet """
+
+    def __init__(self, dspth, image_paths, store_dir=None):
+        self.dspth = dspth
+        self.image_paths = image_paths
+        self.store_dir = store_dir
+        self.frames = None
+        self.to_tensor = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+        ])
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        image_path = self.image_paths[idx]
+        frame_id = int(image_path[:-4])
+        if self.store_dir is not None:
+            # opened lazily so that each loader worker maps the file itself
+            if self.frames is None:
+                from frame_store import FrameStore
+                self.frames = FrameStore(self.store_dir).open('ori')
+            img = Image.fromarray(np.ascontiguousarray(self.frames[frame_id][..., ::-1]))
+        else:
+            img = Image.open(osp.join(self.dspth, image_path))
+        w, h = img.size
+        image = img.resize((512, 512), Image.BILINEAR)
+        image = image.convert("RGB")
+        return frame_id, self.to_tensor(image), w, h
+
+
+def evaluate(respth='./res/test_res', dspth='./data', cp='model_final_diss.pth', store_dir=None,
+             batch_size=16, num_workers=4, device=None):
 
     Path(respth).mkdir(parents=True, exist_ok=True)
 
+    device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+
     print(f'[INFO] loading model...')
     n_classes = 19
     net = BiSeNet(n_classes=n_classes)
-    net.cuda()
-    net.load_state_dict(torch.load(cp))
+    net.to(device)
+    net.load_state_dict(torch.load(cp, map_location=device))
     net.eval()
 
-    to_tensor = transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
-    ])
-
-    image_paths = sorted(os.listdir(dspth))
-
-    with torch.no_grad():
-        for image_path in tqdm.tqdm(image_paths):
-            if image_path.endswith('.jpg') or image_path.endswith('.png'):
-                img = Image.open(osp.join(dspth, image_path))
-                ori_size = img.size
-                image = img.resize((512, 512), Image.BILINEAR)
-                image = image.convert("RGB")
-                img = to_tensor(image)
-
-                # test-time augmentation.
-                inputs = torch.unsqueeze(img, 0) # [1, 3, 512, 512]
-                outputs = net(inputs.cuda())
-                parsing = outputs.mean(0).cpu().numpy().argmax(0)
-
-                image_path = int(image_path[:-4])
-                image_path = str(image_path) + '.png'
-
-                vis_parsing_maps(image, parsing, stride=1, save_im=True, save_path=osp.join(respth, image_path), img_size=ori_size)
+    image_paths = sorted(p for p in os.listdir(dspth) if p.endswith('.jpg') or p.endswith('.png'))
+
+    # read decoded frames from the frame store and also write the label maps into it
+    parsing_out = None
+    if store_dir is not None:
+        sys.path.append(osp.dirname(osp.dirname(osp.abspath(__file__))))
+        from frame_store import FrameStore
+        store = FrameStore(store_dir)
+        shape = store.open('ori').shape
+        parsing_out = store.create('parsing', shape)
+        image_paths = [f'{i}.jpg' for i in range(shape[0])]
+
+    loader = torch.utils.data.DataLoader(
+        FrameDataset(dspth, image_paths, store_dir), batch_size=batch_size, num_workers=num_workers,
+        pin_memory=device.type == 'cuda')
+
+    def save(parsing, frame_id, img_size):
+        vis_im = vis_parsing_maps(None, parsing, stride=1, save_im=True,
+                                  save_path=osp.join(respth, f'{frame_id}.png'), img_size=img_size)
+        if parsing_out is not None:
+            parsing_out[frame_id] = vis_im
+
+    # colorize / write results on a thread pool while the device runs the next batch
+    pending = []
+    with torch.no_grad(), ThreadPoolExecutor(max(1, num_workers)) as pool:
+        for frame_ids, imgs, ws, hs in tqdm.tqdm(loader):
+            outputs = net(imgs.to(device, non_blocking=True))
+            parsings = outputs.argmax(1).to(torch.uint8).cpu().numpy()
+            for k in range(len(frame_ids)):
+                pending.append(pool.submit(save, parsings[k], int(frame_ids[k]), (int(ws[k]), int(hs[k]))))
+            # bound the number of label maps waiting to be written
+            while len(pending) > 4 * batch_size:
+                pending.pop(0).result()
+        for future in pending:
+            future.result()
+
+    if parsing_out is not None:
+        parsing_out.flush()
 
 
 if __name__ == "__main__":
@@ -101,5 +151,10 @@ if __name__ == "__main__":
     parser.add_argument('--respath', type=str, default='./result/', help='result path for label')
     parser.add_argument('--imgpath', type=str, default='./imgs/', help='path for input images')
     parser.add_argument('--modelpath', type=str, default='data_utils/face_parsing/79999_iter.pth')
+    parser.add_argument('--store', type=str, default=None, help='dataset dir with a frame store (frames/ori.bin)')
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--num_workers', type=int, default=4, help='data loader workers / post-processing threads')
+    parser.add_argument('--device', type=str, default=None, help='cuda or cpu, default: cuda if available')
     args = parser.parse_args()
-    evaluate(respth=args.respath, dspth=args.imgpath, cp=args.modelpath)
+    evaluate(respth=args.respath, dspth=args.imgpath, cp=args.modelpath, store_dir=args.store,
+             batch_size=args.batch_size, num_workers=args.num_workers, device=args.device)
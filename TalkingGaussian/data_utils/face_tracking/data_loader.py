@@ -4,6 +4,14 @@ import numpy as np
 
 
 def load_dir(path, start, end):
+    # prefer the consolidated <dataset>/lms.npy (NaN rows: no face) over the per-frame .lms files
+    packed = os.path.join(os.path.dirname(os.path.normpath(path)), "lms.npy")
+    if os.path.isfile(packed):
+        lms_all = np.load(packed, mmap_mode="r")
+        ids = [i for i in range(start, min(end, lms_all.shape[0])) if not np.isnan(lms_all[i, 0, 0])]
+        lmss = torch.as_tensor(np.ascontiguousarray(lms_all[ids], dtype=np.float32)).cuda()
+        return lmss, [os.path.join(path, str(i) + ".jpg") for i in ids]
+
     lmss = []
     imgs_paths = []
     for i in range(start, end):
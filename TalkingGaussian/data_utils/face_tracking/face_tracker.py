@@ -28,12 +28,20 @@ parser.add_argument(
 parser.add_argument("--img_h", type=int, default=512, help="image height")
 parser.add_argument("--img_w", type=int, default=512, help="image width")
 parser.add_argument("--frame_num", type=int, default=11000, help="image number")
+parser.add_argument("--store", type=str, default=None, help="dataset dir with a frame store (frames/ori.bin)")
 args = parser.parse_args()
 
 start_id = 0
 end_id = args.frame_num
 
 lms, img_paths = load_dir(args.path, start_id, end_id)
+
+if args.store is not None:
+    sys.path.append(os.path.dirname(dir_path))
+    from frame_store import frame_reader
+    read_img = frame_reader(args.store, 'ori', cv2.imread)
+else:
+    read_img = cv2.imread
 num_frames = lms.shape[0]
 h, w = args.img_h, args.img_w
 cxy = torch.tensor((w / 2.0, h / 2.0), dtype=torch.float).cuda()
@@ -186,7 +194,7 @@ renderer = Render_3DMM(arg_focal, h, w, batch_size, device_render)
 sel_ids = np.arange(0, num_frames, int(num_frames / batch_size))[:batch_size]
 imgs = []
 for sel_id in sel_ids:
-    imgs.append(cv2.imread(img_paths[sel_id])[:, :, ::-1])
+    imgs.append(read_img(img_paths[sel_id])[:, :, ::-1])
 imgs = np.stack(imgs)
 sel_imgs = torch.as_tensor(imgs).cuda()
 sel_lms = lms[sel_ids]
@@ -269,7 +277,7 @@ for i in range(int((num_frames - 1) / batch_size + 1)):
 
     imgs = []
     for sel_id in sel_ids:
-        imgs.append(cv2.imread(img_paths[sel_id])[:, :, ::-1])
+        imgs.append(read_img(img_paths[sel_id])[:, :, ::-1])
     imgs = np.stack(imgs)
     sel_imgs = torch.as_tensor(imgs).cuda()
     sel_lms = lms[sel_ids]
@@ -0,0 +1,107 @@
+"""
+Frame store for preprocessing.
+
+The training video is decoded once into a memory-mapped uint8 array
+(<dataset>/frames/ori.bin, [N, H, W, 3], BGR like cv2.imread) indexed by frame
+id, so the preprocessing stages read frames zero-copy instead of re-decoding
+ori_imgs/*.jpg. Stages can store their per-frame outputs as sibling arrays
+(e.g. parsing.bin, teeth.bin). Each array has a <name>.json sidecar holding its
+shape and dtype.
+
+ori_imgs/*.jpg are still written (in the same ffmpeg pass) because the
+training data loader and external tools read them.
+"""
+
+import os
+import json
+import subprocess
+
+import numpy as np
+
+STORE_DIR = 'frames'
+
+
+class FrameStore:
+    def __init__(self, base_dir):
+        self.root = os.path.join(base_dir, STORE_DIR)
+
+    def path(self, name):
+        return os.path.join(self.root, name + '.bin')
+
+    def has(self, name):
+        return os.path.exists(self.path(name)) and os.path.exists(self._meta_path(name))
+
+    def _meta_path(self, name):
+        return os.path.join(self.root, name + '.json')
+
+    def _write_meta(self, name, shape, dtype):
+        with open(self._meta_path(name), 'w') as f:
+            json.dump({'shape': list(shape), 'dtype': np.dtype(dtype).str}, f)
+
+    def create(self, name, shape, dtype=np.uint8):
+        """ allocate a writable array; call flush() on it when done """
+        os.makedirs(self.root, exist_ok=True)
+        arr = np.memmap(self.path(name), dtype=dtype, mode='w+', shape=tuple(shape))
+        self._write_meta(name, shape, dtype)
+        return arr
+
+    def open(self, name, mode='r'):
+        with open(self._meta_path(name)) as f:
+            meta = json.load(f)
+        return np.memmap(self.path(name), dtype=np.dtype(meta['dtype']), mode=mode,
+                         shape=tuple(meta['shape']))
+
+    def __len__(self):
+        return self.open('ori').shape[0] if self.has('ori') else 0
+
+
+def probe_size(video_path):
+    out = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                          '-show_entries', 'stream=width,height', '-of', 'csv=p=0', video_path],
+                         capture_output=True, text=True, check=True).stdout
+    w, h = out.strip().splitlines()[0].split(',')[:2]
+    return int(h), int(w)
+
+
+def decode_video(video_path, base_dir, fps=25, jpg_dir=None):
+    """
+    Decode the video once into frames/ori.bin; if jpg_dir is given the same
+    decoded frames are also written as %d.jpg (start_number 0) there.
+    Returns the number of frames.
+    """
+    store = FrameStore(base_dir)
+    os.makedirs(store.root, exist_ok=True)
+    h, w = probe_size(video_path)
+    raw_path = store.path('ori')
+
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-i', video_path]
+    if jpg_dir is not None:
+        cmd += ['-filter_complex', f'[0:v]fps={fps},split=2[jpg][raw]',
+                '-map', '[jpg]', '-qmin', '1', '-q:v', '1', '-start_number', '0',
+                os.path.join(jpg_dir, '%d.jpg'),
+                '-map', '[raw]']
+    else:
+        cmd += ['-vf', f'fps={fps}']
+    cmd += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', raw_path]
+    subprocess.run(cmd, check=True)
+
+    num = os.path.getsize(raw_path) // (h * w * 3)
+    store._write_meta('ori', (num, h, w, 3), np.uint8)
+    return num
+
+
+def frame_id(image_path):
+    """ ori_imgs/<id>.jpg -> id """
+    return int(os.path.splitext(os.path.basename(image_path))[0])
+
+
+def frame_reader(base_dir, name, fallback):
+    """
+    Returns read(image_path) -> frame for ori_imgs/<id>.jpg, taken from the store
+    array `name` when it exists, otherwise from fallback(image_path).
+    """
+    store = FrameStore(base_dir)
+    if not store.has(name):
+        return fallback
+    frames = store.open(name)
+    return lambda image_path: np.asarray(frames[frame_id(image_path)])
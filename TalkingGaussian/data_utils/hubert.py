@@ -71,24 +71,28 @@ def make_even_first_dim(tensor):
         return tensor[:size[0]]
     return tensor
 
-import soundfile as sf
-import numpy as np
-import torch
-from argparse import ArgumentParser
-import librosa
 
-parser = ArgumentParser()
-parser.add_argument('--wav', type=str, help='')
-args = parser.parse_args()
+def get_hubert_features(speech_16k):
+    """16k 音频 -> [T, 2, 1024]，与脚本输出的 <wav>_hu.npy 相同（每个 25fps 视频帧对应 2 个 HuBERT 帧）"""
+    hubert_hidden = get_hubert_from_16k_speech(speech_16k)
+    return make_even_first_dim(hubert_hidden).reshape(-1, 2, 1024).detach().numpy()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    import librosa
+
+    parser = ArgumentParser()
+    parser.add_argument('--wav', type=str, help='')
+    args = parser.parse_args()
 
-wav_name = args.wav
+    wav_name = args.wav
 
-speech_16k, sr = librosa.load(wav_name, sr=16000)
-# speech_16k = librosa.resample(speech, orig_sr=sr, target_sr=16000)
-# print("SR: {} to {}".format(sr, 16000))
-# print(speech.shape, speech_16k.shape)
+    speech_16k, sr = librosa.load(wav_name, sr=16000)
+    # speech_16k = librosa.resample(speech, orig_sr=sr, target_sr=16000)
+    # print("SR: {} to {}".format(sr, 16000))
+    # print(speech.shape, speech_16k.shape)
 
-hubert_hidden = get_hubert_from_16k_speech(speech_16k)
-hubert_hidden = make_even_first_dim(hubert_hidden).reshape(-1, 2, 1024)
-np.save(wav_name.replace('.wav', '_hu.npy'), hubert_hidden.detach().numpy())
-print(hubert_hidden.detach().numpy().shape)
\ No newline at end of file
+    hubert_features = get_hubert_features(speech_16k)
+    np.save(wav_name.replace('.wav', '_hu.npy'), hubert_features)
+    print(hubert_features.shape)
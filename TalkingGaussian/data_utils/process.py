@@ -1,31 +1,51 @@
 import os
 import sys
 import glob
+import time
 import tqdm
 import json
+import shutil
+import hashlib
 import argparse
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import cv2
 import numpy as np
 
+from frame_store import FrameStore, decode_video, frame_reader
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.dirname(current_dir)
 
+# consolidated landmarks of all frames (see pack_landmarks)
+LMS_FILE = 'lms.npy'
+
+
+def run_cmd(cmd, cwd=None, env=None):
+    # fail the task on a non-zero exit code instead of silently continuing
+    ret = subprocess.run(cmd, shell=True, cwd=cwd, env=env).returncode
+    if ret != 0:
+        raise RuntimeError(f'command failed ({ret}): {cmd}')
+
 def extract_audio(path, out_path, sample_rate=16000):
     
     print(f'[INFO] ===== extract audio from {path} to {out_path} =====')
     cmd = f'ffmpeg -y -i {path} -f wav -ar {sample_rate} {out_path}'
-    os.system(cmd)
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted audio =====')
 
 
-def extract_audio_features(path, mode='wav2vec'):
+def extract_audio_features(path, mode='wav2vec', out_path=None):
 
     print(f'[INFO] ===== extract audio labels for {path} =====')
     if mode == 'wav2vec':
         cmd = f'python {os.path.join(root_dir, "nerf/asr.py")} --wav {path} --save_feats'
     else: # deepspeech
         cmd = f'python {os.path.join(current_dir, "deepspeech_features/extract_ds_features.py")} --input {path}'
-    os.system(cmd)
+        if out_path is not None:
+            cmd += f' --output {out_path}'
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted audio labels =====')
 
 
@@ -33,58 +53,171 @@ def extract_audio_features(path, mode='wav2vec'):
 def extract_images(path, out_path, fps=25):
 
     print(f'[INFO] ===== extract images from {path} to {out_path} =====')
-    cmd = f'ffmpeg -y -i {path} -vf fps={fps} -qmin 1 -q:v 1 -start_number 0 {os.path.join(out_path, "%d.jpg")}'
-    os.system(cmd)
+    # decode once: frames/ori.bin for the preprocessing stages, %d.jpg for training
+    num = decode_video(path, os.path.dirname(out_path), fps=fps, jpg_dir=out_path)
+    print(f'[INFO] decoded {num} frames')
     print(f'[INFO] ===== extracted images =====')
 
 
-def extract_semantics(ori_imgs_dir, parsing_dir):
+def extract_semantics(ori_imgs_dir, parsing_dir, batch_size=16, num_workers=4):
 
     print(f'[INFO] ===== extract semantics from {ori_imgs_dir} to {parsing_dir} =====')
     cmd = f'python {os.path.join(current_dir, "face_parsing/test.py")} --respath={parsing_dir} --imgpath={ori_imgs_dir} --modelpath={os.path.join(current_dir, "face_parsing/79999_iter.pth")}'
-    os.system(cmd)
+    cmd += f' --batch_size={batch_size} --num_workers={num_workers}'
+    base_dir = os.path.dirname(ori_imgs_dir)
+    if FrameStore(base_dir).has('ori'):
+        cmd += f' --store={base_dir}'
+    run_cmd(cmd)
     print(f'[INFO] ===== extracted semantics =====')
 
 
-def extract_landmarks(ori_imgs_dir):
+class _FrameList:
+    """ map-style dataset of RGB frames as uint8 [3, H, W] tensors """
+
+    def __init__(self, base_dir, image_paths):
+        self.base_dir = base_dir
+        self.image_paths = image_paths
+        self.read = None
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        import torch
+        # the frame store is mapped lazily inside each loader worker
+        if self.read is None:
+            self.read = frame_reader(self.base_dir, 'ori', lambda p: cv2.imread(p, cv2.IMREAD_UNCHANGED))
+        image = cv2.cvtColor(self.read(self.image_paths[idx]), cv2.COLOR_BGR2RGB)
+        return idx, torch.from_numpy(image.transpose(2, 0, 1).copy())
+
+
+def extract_landmarks(ori_imgs_dir, batch_size=16, num_workers=4, device=None):
 
     print(f'[INFO] ===== extract face landmarks from {ori_imgs_dir} =====')
 
+    import torch
     import face_alignment
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
     try:
-        fa = face_alignment.FaceAlignment(face_alignment.LandmarksType._2D, flip_input=False)
+        fa = face_alignment.FaceAlignment(face_alignment.LandmarksType._2D, flip_input=False, device=device)
     except:
-        fa = face_alignment.FaceAlignment(face_alignment.LandmarksType.TWO_D, flip_input=False)
+        fa = face_alignment.FaceAlignment(face_alignment.LandmarksType.TWO_D, flip_input=False, device=device)
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
-    for image_path in tqdm.tqdm(image_paths):
-        input = cv2.imread(image_path, cv2.IMREAD_UNCHANGED) # [H, W, 3]
-        input = cv2.cvtColor(input, cv2.COLOR_BGR2RGB)
-        preds = fa.get_landmarks(input)
-        if len(preds) > 0:
-            lands = preds[0].reshape(-1, 2)[:,:2]
-            np.savetxt(image_path.replace('jpg', 'lms'), lands, '%f')
+    # loader workers cannot be started from a daemonic process (e.g. a multiprocessing.Pool worker)
+    if multiprocessing.current_process().daemon:
+        num_workers = 0
+    # frames are decoded / converted by the loader workers; face detection runs per batch
+    # (older face_alignment without get_landmarks_from_batch falls back to one call per image)
+    loader = torch.utils.data.DataLoader(_FrameList(os.path.dirname(ori_imgs_dir), image_paths),
+                                         batch_size=batch_size, num_workers=num_workers,
+                                         pin_memory=device.startswith('cuda'))
+    batched = hasattr(fa, 'get_landmarks_from_batch')
+    with tqdm.tqdm(total=len(image_paths)) as pbar:
+        for ids, images in loader:
+            if batched:
+                preds = fa.get_landmarks_from_batch(images.to(device, non_blocking=True))
+            else:
+                preds = [fa.get_landmarks(image.numpy().transpose(1, 2, 0)) for image in images]
+            for idx, pred in zip(ids.tolist(), preds):
+                if pred is not None and len(pred) > 0:
+                    lands = np.asarray(pred[0] if isinstance(pred, list) else pred[:68]).reshape(-1, 2)[:, :2]
+                    np.savetxt(image_paths[idx].replace('jpg', 'lms'), lands, '%f')
+            pbar.update(len(ids))
     del fa
     print(f'[INFO] ===== extracted face landmarks =====')
 
 
-def extract_background(base_dir, ori_imgs_dir):
+def pack_landmarks(ori_imgs_dir):
+    # consolidate the per-frame .lms text files into <dataset>/lms.npy, float32 [N, 68, 2],
+    # NaN for frames without a detected face; readers load it with mmap_mode='r'.
+    # also the converter for datasets preprocessed before: process.py <video> --task pack_lms
+
+    print(f'[INFO] ===== pack face landmarks of {ori_imgs_dir} =====')
+
+    base_dir = os.path.dirname(ori_imgs_dir)
+    num_frames = len(glob.glob(os.path.join(ori_imgs_dir, '*.jpg')))
+    lms_paths = glob.glob(os.path.join(ori_imgs_dir, '*.lms'))
+    ids = [int(os.path.basename(p)[:-4]) for p in lms_paths]
+    lms = np.full((max([num_frames] + [i + 1 for i in ids]), 68, 2), np.nan, dtype=np.float32)
+    for i, lms_path in zip(ids, tqdm.tqdm(lms_paths)):
+        lms[i] = np.loadtxt(lms_path).reshape(-1, 2)[:68]
+
+    out_path = os.path.join(base_dir, LMS_FILE)
+    with open(out_path + '.tmp', 'wb') as f:
+        np.save(f, lms)
+    os.replace(out_path + '.tmp', out_path)
+    print(f'[INFO] ===== packed {len(ids)} / {lms.shape[0]} frames to {out_path} =====')
+
+
+def extract_background(base_dir, ori_imgs_dir, workers=4, method='edt'):
     
+    if method == 'knn':
+        return extract_background_knn(base_dir, ori_imgs_dir)
+
     print(f'[INFO] ===== extract background image from {ori_imgs_dir} =====')
 
+    from concurrent.futures import ThreadPoolExecutor
+    from scipy.ndimage import distance_transform_edt
+
+    read_ori = frame_reader(base_dir, 'ori', lambda p: cv2.imread(p, cv2.IMREAD_UNCHANGED))
+    read_parsing = frame_reader(base_dir, 'parsing', lambda p: cv2.imread(p.replace('ori_imgs', 'parsing').replace('.jpg', '.png')))
+
+    image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
+    # only use 1/20 image_paths 
+    image_paths = image_paths[::20]
+    # read one image to get H/W
+    tmp_image = read_ori(image_paths[0]) # [H, W, 3]
+    h, w = tmp_image.shape[:2]
+
+    def fg_distance(image_path):
+        # exact euclidean distance of every pixel to the nearest foreground pixel
+        parse_img = read_parsing(image_path)
+        bg = (parse_img[..., 0] == 255) & (parse_img[..., 1] == 255) & (parse_img[..., 2] == 255)
+        return distance_transform_edt(bg)
+
+    # stream the frames keeping only the running max distance and the color of
+    # the frame it came from (strict '>' keeps the first max, like np.argmax)
+    max_dist = np.full((h, w), -1.0)
+    bc_img = np.zeros((h, w, 3), dtype=np.uint8)
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        for image_path, dist in zip(image_paths, tqdm.tqdm(pool.map(fg_distance, image_paths), total=len(image_paths))):
+            update = dist > max_dist
+            max_dist[update] = dist[update]
+            bc_img[update] = read_ori(image_path)[update]
+
+    # pixels that are never far enough from the person take the color of the nearest background pixel
+    bc_pixs = max_dist > 5
+    if bc_pixs.any():
+        _, (iy, ix) = distance_transform_edt(~bc_pixs, return_indices=True)
+        bc_img = bc_img[iy, ix]
+
+    cv2.imwrite(os.path.join(base_dir, 'bc.jpg'), bc_img)
+
+    print(f'[INFO] ===== extracted background image =====')
+
+
+def extract_background_knn(base_dir, ori_imgs_dir):
+    # original implementation: a KD-tree per sampled frame, O(frames * H * W) memory
+    
+    print(f'[INFO] ===== extract background image from {ori_imgs_dir} (knn) =====')
+
     from sklearn.neighbors import NearestNeighbors
 
+    read_ori = frame_reader(base_dir, 'ori', lambda p: cv2.imread(p, cv2.IMREAD_UNCHANGED))
+    read_parsing = frame_reader(base_dir, 'parsing', lambda p: cv2.imread(p.replace('ori_imgs', 'parsing').replace('.jpg', '.png')))
+
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
     # only use 1/20 image_paths 
     image_paths = image_paths[::20]
     # read one image to get H/W
-    tmp_image = cv2.imread(image_paths[0], cv2.IMREAD_UNCHANGED) # [H, W, 3]
+    tmp_image = read_ori(image_paths[0]) # [H, W, 3]
     h, w = tmp_image.shape[:2]
 
     # nearest neighbors
     all_xys = np.mgrid[0:h, 0:w].reshape(2, -1).transpose()
     distss = []
     for image_path in tqdm.tqdm(image_paths):
-        parse_img = cv2.imread(image_path.replace('ori_imgs', 'parsing').replace('.jpg', '.png'))
+        parse_img = read_parsing(image_path)
         bg = (parse_img[..., 0] == 255) & (parse_img[..., 1] == 255) & (parse_img[..., 2] == 255)
         fg_xys = np.stack(np.nonzero(~bg)).transpose(1, 0)
         nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(fg_xys)
@@ -102,7 +235,7 @@ def extract_background(base_dir, ori_imgs_dir):
     imgs = []
     num_pixs = distss.shape[1]
     for image_path in image_paths:
-        img = cv2.imread(image_path)
+        img = read_ori(image_path)
         imgs.append(img)
     imgs = np.stack(imgs).reshape(-1, num_pixs, 3)
 
@@ -124,141 +257,143 @@ def extract_background(base_dir, ori_imgs_dir):
     print(f'[INFO] ===== extracted background image =====')
 
 
-def extract_torso_and_gt(base_dir, ori_imgs_dir):
+def _column_tops(part):
+    # top-most pixel and pixel count of every column that contains `part`
+    # (same result as lexsort + np.unique over the nonzero coords)
+    cols = np.nonzero(part.any(0))[0]
+    return part.argmax(0)[cols], cols, part.sum(0)[cols]
+
+
+def _vertical_inpaint(image, rows, cols, colors, L):
+    # paint L pixels upwards from (rows, cols), darkening the color by 0.98 per pixel
+    offsets = np.arange(L)
+    ys = (rows[None] - offsets[:, None]).reshape(-1) # [Lm]
+    xs = np.broadcast_to(cols[None], (L, len(cols))).reshape(-1) # [Lm]
+    darken_scaler = 0.98 ** offsets.reshape(L, 1, 1) # [L, 1, 1]
+    image[ys, xs] = (colors[None] * darken_scaler).reshape(-1, 3)
+    return ys, xs
+
+
+def torso_and_gt_frame(ori_image, seg, bg_image):
+    """ returns (gt_image [H, W, 3], torso_image [H, W, 4]) for one frame """
+
+    from scipy.ndimage import binary_dilation
+
+    head_part = (seg[..., 0] == 255) & (seg[..., 1] == 0) & (seg[..., 2] == 0)
+    neck_part = (seg[..., 0] == 0) & (seg[..., 1] == 255) & (seg[..., 2] == 0)
+    torso_part = (seg[..., 0] == 0) & (seg[..., 1] == 0) & (seg[..., 2] == 255)
+    bg_part = (seg[..., 0] == 255) & (seg[..., 1] == 255) & (seg[..., 2] == 255)
+
+    # get gt image
+    gt_image = ori_image.copy()
+    gt_image[bg_part] = bg_image[bg_part]
+
+    # get torso image
+    torso_image = gt_image.copy() # rgb
+    torso_image[head_part] = bg_image[head_part]
+    torso_alpha = 255 * np.ones((gt_image.shape[0], gt_image.shape[1], 1), dtype=np.uint8) # alpha
+
+    # torso part "vertical" in-painting: only columns whose top pixel is right below the head
+    rows, cols, _ = _column_tops(torso_part)
+    keep = head_part[rows - 1, cols]
+    if keep.any():
+        rows, cols = rows[keep], cols[keep]
+        ys, xs = _vertical_inpaint(torso_image, rows, cols, gt_image[rows, cols], 8 + 1)
+        inpaint_torso_mask = np.zeros_like(torso_image[..., 0]).astype(bool)
+        inpaint_torso_mask[ys, xs] = True
+    else:
+        inpaint_torso_mask = None
+
+    # neck part "vertical" in-painting...
+    push_down = 4
+    neck_part = binary_dilation(neck_part, structure=np.array([[0, 1, 0], [0, 1, 0], [0, 1, 0]], dtype=bool), iterations=3)
+    rows, cols, counts = _column_tops(neck_part)
+    keep = head_part[rows - 1, cols]
+    rows, cols, counts = rows[keep], cols[keep], counts[keep]
+    # push these top down for 4 pixels to make the neck inpainting more natural...
+    rows = rows + np.minimum(counts - 1, push_down)
+    ys, xs = _vertical_inpaint(torso_image, rows, cols, gt_image[rows, cols], 48 + push_down + 1)
+
+    # apply blurring to the inpaint area to avoid vertical-line artifects...
+    inpaint_mask = np.zeros_like(torso_image[..., 0]).astype(bool)
+    inpaint_mask[ys, xs] = True
+
+    blur_img = cv2.GaussianBlur(torso_image, (5, 5), cv2.BORDER_DEFAULT)
+    torso_image[inpaint_mask] = blur_img[inpaint_mask]
+
+    # set mask
+    mask = (neck_part | torso_part | inpaint_mask)
+    if inpaint_torso_mask is not None:
+        mask = mask | inpaint_torso_mask
+    torso_image[~mask] = 0
+    torso_alpha[~mask] = 0
+
+    return gt_image, np.concatenate([torso_image, torso_alpha], axis=-1)
+
+
+def _torso_and_gt_chunk(base_dir, image_paths):
+    # one chunk of frames in a pool worker; PNG/JPEG encoding runs on a small bounded writer pool
+    from concurrent.futures import ThreadPoolExecutor
+
+    bg_image = cv2.imread(os.path.join(base_dir, 'bc.jpg'), cv2.IMREAD_UNCHANGED)
+    read_ori = frame_reader(base_dir, 'ori', lambda p: cv2.imread(p, cv2.IMREAD_UNCHANGED))
+    read_parsing = frame_reader(base_dir, 'parsing', lambda p: cv2.imread(p.replace('ori_imgs', 'parsing').replace('.jpg', '.png')))
+
+    def write(image_path, gt_image, torso_image):
+        cv2.imwrite(image_path.replace('ori_imgs', 'gt_imgs'), gt_image)
+        cv2.imwrite(image_path.replace('ori_imgs', 'torso_imgs').replace('.jpg', '.png'), torso_image)
+
+    pending = []
+    with ThreadPoolExecutor(2) as writer:
+        for image_path in image_paths:
+            gt_image, torso_image = torso_and_gt_frame(read_ori(image_path), read_parsing(image_path), bg_image)
+            pending.append(writer.submit(write, image_path, gt_image, torso_image))
+            while len(pending) > 8:
+                pending.pop(0).result()
+        for future in pending:
+            future.result()
+    return len(image_paths)
+
+
+def extract_torso_and_gt(base_dir, ori_imgs_dir, workers=None, chunk_size=32):
 
     print(f'[INFO] ===== extract torso and gt images for {base_dir} =====')
 
-    from scipy.ndimage import binary_erosion, binary_dilation
+    from concurrent.futures import as_completed
 
-    # load bg
-    bg_image = cv2.imread(os.path.join(base_dir, 'bc.jpg'), cv2.IMREAD_UNCHANGED)
-    
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
+    chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+    workers = workers or os.cpu_count() or 1
 
-    for image_path in tqdm.tqdm(image_paths):
-        # read ori image
-        ori_image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED) # [H, W, 3]
-
-        # read semantics
-        seg = cv2.imread(image_path.replace('ori_imgs', 'parsing').replace('.jpg', '.png'))
-        head_part = (seg[..., 0] == 255) & (seg[..., 1] == 0) & (seg[..., 2] == 0)
-        neck_part = (seg[..., 0] == 0) & (seg[..., 1] == 255) & (seg[..., 2] == 0)
-        torso_part = (seg[..., 0] == 0) & (seg[..., 1] == 0) & (seg[..., 2] == 255)
-        bg_part = (seg[..., 0] == 255) & (seg[..., 1] == 255) & (seg[..., 2] == 255)
-
-        # get gt image
-        gt_image = ori_image.copy()
-        gt_image[bg_part] = bg_image[bg_part]
-        cv2.imwrite(image_path.replace('ori_imgs', 'gt_imgs'), gt_image)
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool, \
+            tqdm.tqdm(total=len(image_paths)) as pbar:
+        for future in as_completed([pool.submit(_torso_and_gt_chunk, base_dir, chunk) for chunk in chunks]):
+            pbar.update(future.result())
 
-        # get torso image
-        torso_image = gt_image.copy() # rgb
-        torso_image[head_part] = bg_image[head_part]
-        torso_alpha = 255 * np.ones((gt_image.shape[0], gt_image.shape[1], 1), dtype=np.uint8) # alpha
-        
-        # torso part "vertical" in-painting...
-        L = 8 + 1
-        torso_coords = np.stack(np.nonzero(torso_part), axis=-1) # [M, 2]
-        # lexsort: sort 2D coords first by y then by x, 
-        # ref: https://stackoverflow.com/questions/2706605/sorting-a-2d-numpy-array-by-multiple-axes
-        inds = np.lexsort((torso_coords[:, 0], torso_coords[:, 1]))
-        torso_coords = torso_coords[inds]
-        # choose the top pixel for each column
-        u, uid, ucnt = np.unique(torso_coords[:, 1], return_index=True, return_counts=True)
-        top_torso_coords = torso_coords[uid] # [m, 2]
-        # only keep top-is-head pixels
-        top_torso_coords_up = top_torso_coords.copy() - np.array([1, 0])
-        mask = head_part[tuple(top_torso_coords_up.T)] 
-        if mask.any():
-            top_torso_coords = top_torso_coords[mask]
-            # get the color
-            top_torso_colors = gt_image[tuple(top_torso_coords.T)] # [m, 3]
-            # construct inpaint coords (vertically up, or minus in x)
-            inpaint_torso_coords = top_torso_coords[None].repeat(L, 0) # [L, m, 2]
-            inpaint_offsets = np.stack([-np.arange(L), np.zeros(L, dtype=np.int32)], axis=-1)[:, None] # [L, 1, 2]
-            inpaint_torso_coords += inpaint_offsets
-            inpaint_torso_coords = inpaint_torso_coords.reshape(-1, 2) # [Lm, 2]
-            inpaint_torso_colors = top_torso_colors[None].repeat(L, 0) # [L, m, 3]
-            darken_scaler = 0.98 ** np.arange(L).reshape(L, 1, 1) # [L, 1, 1]
-            inpaint_torso_colors = (inpaint_torso_colors * darken_scaler).reshape(-1, 3) # [Lm, 3]
-            # set color
-            torso_image[tuple(inpaint_torso_coords.T)] = inpaint_torso_colors
-
-            inpaint_torso_mask = np.zeros_like(torso_image[..., 0]).astype(bool)
-            inpaint_torso_mask[tuple(inpaint_torso_coords.T)] = True
-        else:
-            inpaint_torso_mask = None
-            
-
-        # neck part "vertical" in-painting...
-        push_down = 4
-        L = 48 + push_down + 1
-
-        neck_part = binary_dilation(neck_part, structure=np.array([[0, 1, 0], [0, 1, 0], [0, 1, 0]], dtype=bool), iterations=3)
-
-        neck_coords = np.stack(np.nonzero(neck_part), axis=-1) # [M, 2]
-        # lexsort: sort 2D coords first by y then by x, 
-        # ref: https://stackoverflow.com/questions/2706605/sorting-a-2d-numpy-array-by-multiple-axes
-        inds = np.lexsort((neck_coords[:, 0], neck_coords[:, 1]))
-        neck_coords = neck_coords[inds]
-        # choose the top pixel for each column
-        u, uid, ucnt = np.unique(neck_coords[:, 1], return_index=True, return_counts=True)
-        top_neck_coords = neck_coords[uid] # [m, 2]
-        # only keep top-is-head pixels
-        top_neck_coords_up = top_neck_coords.copy() - np.array([1, 0])
-        mask = head_part[tuple(top_neck_coords_up.T)] 
-        
-        top_neck_coords = top_neck_coords[mask]
-        # push these top down for 4 pixels to make the neck inpainting more natural...
-        offset_down = np.minimum(ucnt[mask] - 1, push_down)
-        top_neck_coords += np.stack([offset_down, np.zeros_like(offset_down)], axis=-1)
-        # get the color
-        top_neck_colors = gt_image[tuple(top_neck_coords.T)] # [m, 3]
-        # construct inpaint coords (vertically up, or minus in x)
-        inpaint_neck_coords = top_neck_coords[None].repeat(L, 0) # [L, m, 2]
-        inpaint_offsets = np.stack([-np.arange(L), np.zeros(L, dtype=np.int32)], axis=-1)[:, None] # [L, 1, 2]
-        inpaint_neck_coords += inpaint_offsets
-        inpaint_neck_coords = inpaint_neck_coords.reshape(-1, 2) # [Lm, 2]
-        inpaint_neck_colors = top_neck_colors[None].repeat(L, 0) # [L, m, 3]
-        darken_scaler = 0.98 ** np.arange(L).reshape(L, 1, 1) # [L, 1, 1]
-        inpaint_neck_colors = (inpaint_neck_colors * darken_scaler).reshape(-1, 3) # [Lm, 3]
-        # set color
-        torso_image[tuple(inpaint_neck_coords.T)] = inpaint_neck_colors
-
-        # apply blurring to the inpaint area to avoid vertical-line artifects...
-        inpaint_mask = np.zeros_like(torso_image[..., 0]).astype(bool)
-        inpaint_mask[tuple(inpaint_neck_coords.T)] = True
-
-        blur_img = torso_image.copy()
-        blur_img = cv2.GaussianBlur(blur_img, (5, 5), cv2.BORDER_DEFAULT)
-
-        torso_image[inpaint_mask] = blur_img[inpaint_mask]
-
-        # set mask
-        mask = (neck_part | torso_part | inpaint_mask)
-        if inpaint_torso_mask is not None:
-            mask = mask | inpaint_torso_mask
-        torso_image[~mask] = 0
-        torso_alpha[~mask] = 0
-
-        cv2.imwrite(image_path.replace('ori_imgs', 'torso_imgs').replace('.jpg', '.png'), np.concatenate([torso_image, torso_alpha], axis=-1))
-
-    print(f'[INFO] ===== extracted torso and gt images =====')
+    elapsed = time.time() - t0
+    print(f'[INFO] ===== extracted torso and gt images: {len(image_paths)} frames, '
+          f'{len(image_paths) / max(elapsed, 1e-6):.1f} fps with {workers} workers =====')
+    return len(image_paths)
 
 
 def face_tracking(ori_imgs_dir):
 
     print(f'[INFO] ===== perform face tracking =====')
 
+    base_dir = os.path.dirname(ori_imgs_dir)
+    read_ori = frame_reader(base_dir, 'ori', lambda p: cv2.imread(p, cv2.IMREAD_UNCHANGED))
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
     
     # read one image to get H/W
-    tmp_image = cv2.imread(image_paths[0], cv2.IMREAD_UNCHANGED) # [H, W, 3]
+    tmp_image = read_ori(image_paths[0]) # [H, W, 3]
     h, w = tmp_image.shape[:2]
 
     cmd = f'python {os.path.join(current_dir, "face_tracking/face_tracker.py")} --path={ori_imgs_dir} --img_h={h} --img_w={w} --frame_num={len(image_paths)}'
+    if FrameStore(base_dir).has('ori'):
+        cmd += f' --store={base_dir}'
 
-    os.system(cmd)
+    run_cmd(cmd)
 
     print(f'[INFO] ===== finished face tracking =====')
 
@@ -268,10 +403,11 @@ def save_transforms(base_dir, ori_imgs_dir):
 
     import torch
 
+    read_ori = frame_reader(base_dir, 'ori', lambda p: cv2.imread(p, cv2.IMREAD_UNCHANGED))
     image_paths = glob.glob(os.path.join(ori_imgs_dir, '*.jpg'))
     
     # read one image to get H/W
-    tmp_image = cv2.imread(image_paths[0], cv2.IMREAD_UNCHANGED) # [H, W, 3]
+    tmp_image = read_ori(image_paths[0]) # [H, W, 3]
     h, w = tmp_image.shape[:2]
 
     params_dict = torch.load(os.path.join(base_dir, 'track_params.pt'))
@@ -349,11 +485,254 @@ def save_transforms(base_dir, ori_imgs_dir):
     print(f'[INFO] ===== finished saving transforms =====')
 
 
+def extract_teeth_mask(base_dir, batch_size=8, num_workers=4):
+
+    print(f'[INFO] ===== extract teeth masks for {base_dir} =====')
+    # create_teeth_mask.py resolves its config/checkpoint relative to the TalkingGaussian root
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, ['data_utils/easyportrait', env.get('PYTHONPATH')]))
+    cmd = f'python data_utils/easyportrait/create_teeth_mask.py {os.path.abspath(base_dir)} --batch_size={batch_size} --num_workers={num_workers}'
+    if FrameStore(base_dir).has('ori'):
+        cmd += ' --store'
+    run_cmd(cmd, cwd=root_dir, env=env)
+    print(f'[INFO] ===== extracted teeth masks =====')
+
+
+# ---------------------------------------------------------------------------
+# task graph
+#
+# Each task declares its dependencies, the files it reads and the files it
+# writes (paths relative to the dataset dir, glob patterns allowed). A task is
+# skipped when its outputs exist and the fingerprint of its inputs matches the
+# one recorded after its last successful run, so re-running after a failure
+# only redoes the failed task and what depends on it. Independent branches
+# (audio / parsing -> bg -> torso / landmarks -> tracking / teeth) run in
+# parallel worker processes.
+# ---------------------------------------------------------------------------
+
+STATE_FILE = '.process_state.json'
+TIMING_FILE = 'process_timing.json'
+
+
+class Task:
+    def __init__(self, name, func, deps=(), inputs=(), outputs=(), params=None, per_frame=False):
+        self.name = name
+        # per-frame stages report their throughput in frames per second
+        self.per_frame = per_frame
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+
+def _task_audio(ctx):
+    extract_audio(ctx['video'], ctx['wav_path'])
+
+def _task_audio_features(ctx):
+    extract_audio_features(ctx['wav_path'], mode=ctx['asr'])
+
+def _task_audio_ds(ctx):
+    # deepspeech features under the name the training scripts expect
+    src = os.path.join(ctx['base_dir'], 'aud.npy')
+    dst = os.path.join(ctx['base_dir'], 'aud_ds.npy')
+    if ctx['asr'] != 'wav2vec':
+        shutil.copy2(src, dst)
+    else:
+        extract_audio_features(ctx['wav_path'], mode='deepspeech', out_path=dst)
+
+def _task_images(ctx):
+    extract_images(ctx['video'], ctx['ori_imgs_dir'])
+
+def _task_parsing(ctx):
+    extract_semantics(ctx['ori_imgs_dir'], ctx['parsing_dir'], ctx['batch_size'], ctx['num_workers'])
+
+def _task_background(ctx):
+    extract_background(ctx['base_dir'], ctx['ori_imgs_dir'], ctx['num_workers'], ctx['bg_method'])
+
+def _task_torso(ctx):
+    extract_torso_and_gt(ctx['base_dir'], ctx['ori_imgs_dir'], ctx['cpu_workers'])
+
+def _task_landmarks(ctx):
+    extract_landmarks(ctx['ori_imgs_dir'], ctx['batch_size'], ctx['num_workers'])
+
+def _task_pack_lms(ctx):
+    pack_landmarks(ctx['ori_imgs_dir'])
+
+def _task_tracking(ctx):
+    face_tracking(ctx['ori_imgs_dir'])
+
+def _task_transforms(ctx):
+    save_transforms(ctx['base_dir'], ctx['ori_imgs_dir'])
+
+def _task_teeth(ctx):
+    extract_teeth_mask(ctx['base_dir'], max(1, ctx['batch_size'] // 2), ctx['num_workers'])
+
+
+def build_tasks(opt):
+    video = os.path.basename(opt.path)
+    # extract_audio_features falls back to deepspeech for anything but wav2vec
+    aud_feat = 'aud_eo.npy' if opt.asr == 'wav2vec' else 'aud.npy'
+    tasks = [
+        Task('audio', _task_audio, inputs=[video], outputs=['aud.wav']),
+        Task('audio_features', _task_audio_features, deps=['audio'],
+             inputs=['aud.wav'], outputs=[aud_feat], params={'asr': opt.asr}),
+        Task('images', _task_images, inputs=[video], outputs=['ori_imgs/*.jpg', 'frames/ori.bin'],
+             per_frame=True),
+        Task('parsing', _task_parsing, deps=['images'],
+             inputs=['ori_imgs/*.jpg', 'frames/ori.bin'], outputs=['parsing/*.png', 'frames/parsing.bin'],
+             per_frame=True),
+        Task('background', _task_background, deps=['parsing'],
+             inputs=['frames/ori.bin', 'frames/parsing.bin'], outputs=['bc.jpg'],
+             params={'bg_method': opt.bg_method}),
+        Task('torso', _task_torso, deps=['background'],
+             inputs=['ori_imgs/*.jpg', 'frames/ori.bin', 'frames/parsing.bin', 'bc.jpg'],
+             outputs=['gt_imgs/*.jpg', 'torso_imgs/*.png'], per_frame=True),
+        Task('landmarks', _task_landmarks, deps=['images'],
+             inputs=['ori_imgs/*.jpg', 'frames/ori.bin'], outputs=['ori_imgs/*.lms'], per_frame=True),
+        Task('pack_lms', _task_pack_lms, deps=['landmarks'],
+             inputs=['ori_imgs/*.lms'], outputs=[LMS_FILE]),
+        Task('tracking', _task_tracking, deps=['pack_lms'],
+             inputs=[LMS_FILE], outputs=['track_params.pt'], per_frame=True),
+        Task('transforms', _task_transforms, deps=['tracking'],
+             inputs=['track_params.pt'], outputs=['transforms_train.json', 'transforms_val.json']),
+    ]
+    if opt.teeth:
+        tasks.append(Task('teeth', _task_teeth, deps=['images'],
+                          inputs=['ori_imgs/*.jpg', 'frames/ori.bin'], outputs=['teeth_mask/*.npy', 'frames/teeth.bin'],
+                          per_frame=True))
+    if opt.aud_ds:
+        # unless --asr wav2vec, aud.npy already holds the same features, just copy it
+        if opt.asr != 'wav2vec':
+            tasks.append(Task('audio_ds', _task_audio_ds, deps=['audio_features'],
+                              inputs=['aud.npy'], outputs=['aud_ds.npy']))
+        else:
+            tasks.append(Task('audio_ds', _task_audio_ds, deps=['audio'],
+                              inputs=['aud.wav'], outputs=['aud_ds.npy']))
+    return {t.name: t for t in tasks}
+
+
+# legacy --task ids; 7 also repacks lms.npy, which the readers prefer over the .lms files
+TASK_IDS = {1: ['audio'], 2: ['audio_features'], 3: ['images'], 4: ['parsing'], 5: ['background'],
+            6: ['torso'], 7: ['landmarks', 'pack_lms'], 8: ['tracking'], 9: ['transforms']}
+
+
+def fingerprint(base_dir, patterns, params):
+    # cheap content fingerprint: file names, sizes and mtimes
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for pattern in patterns:
+        h.update(pattern.encode())
+        for path in sorted(glob.glob(os.path.join(base_dir, pattern))):
+            st = os.stat(path)
+            h.update(f'{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns};'.encode())
+    return h.hexdigest()
+
+
+def outputs_exist(base_dir, patterns):
+    return all(glob.glob(os.path.join(base_dir, p)) for p in patterns)
+
+
+def load_state(base_dir):
+    try:
+        with open(os.path.join(base_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(base_dir, state):
+    path = os.path.join(base_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _run_task(task, ctx):
+    t0 = time.time()
+    task.func(ctx)
+    frames = len(glob.glob(os.path.join(ctx['ori_imgs_dir'], '*.jpg'))) if task.per_frame else 0
+    return time.time() - t0, frames
+
+
+def run_graph(tasks, ctx, selected=None, force=False, jobs=2):
+    """
+    Run the selected tasks (default: all) in dependency order, independent
+    branches in parallel. Returns {name: (status, seconds, frames)}.
+    """
+    base_dir = ctx['base_dir']
+    names = list(selected or tasks)
+    state = load_state(base_dir)
+    report = {}
+    pending = {n: [d for d in tasks[n].deps if d in names] for n in names}
+    running = {}
+
+    def is_fresh(task):
+        if force or not outputs_exist(base_dir, task.outputs):
+            return False
+        return state.get(task.name) == fingerprint(base_dir, task.inputs, task.params)
+
+    # spawn: workers may initialize CUDA
+    with ProcessPoolExecutor(max_workers=max(1, jobs),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        while pending or running:
+            failed = [n for n, s in report.items() if s[0] in ('failed', 'blocked')]
+            for n in [n for n, deps in pending.items() if any(d in failed for d in deps)]:
+                report[n] = ('blocked', 0.0, 0)
+                del pending[n]
+            for n in [n for n, deps in pending.items() if all(d in report for d in deps)]:
+                del pending[n]
+                task = tasks[n]
+                if is_fresh(task):
+                    print(f'[INFO] ===== {n}: up to date, skipped =====')
+                    report[n] = ('skipped', 0.0, 0)
+                    continue
+                running[pool.submit(_run_task, task, ctx)] = n
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                n = running.pop(future)
+                task = tasks[n]
+                try:
+                    elapsed, frames = future.result()
+                except Exception as e:
+                    print(f'[ERROR] ===== {n} failed: {e} =====')
+                    report[n] = ('failed', 0.0, 0)
+                    state.pop(n, None)
+                else:
+                    report[n] = ('done', elapsed, frames)
+                    state[n] = fingerprint(base_dir, task.inputs, task.params)
+                save_state(base_dir, state)
+    return report
+
+
+def print_report(base_dir, report, total):
+    print('[INFO] ===== preprocessing timing =====')
+    for name, (status, seconds, frames) in report.items():
+        fps = f'{frames / seconds:8.1f} fps' if frames and seconds > 0 else ''
+        print(f'  {name:<16s} {status:<8s} {seconds:9.1f}s {fps}')
+    print(f'  {"total (wall)":<16s} {"":<8s} {total:9.1f}s')
+    with open(os.path.join(base_dir, TIMING_FILE), 'w') as f:
+        json.dump({'tasks': {n: {'status': s, 'seconds': round(t, 2), 'frames': k,
+                                 'fps': round(k / t, 2) if k and t > 0 else None}
+                             for n, (s, t, k) in report.items()},
+                   'total': round(total, 2)}, f, indent=2)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('path', type=str, help="path to video file")
-    parser.add_argument('--task', type=int, default=-1, help="-1 means all")
+    parser.add_argument('--task', type=str, default='-1',
+                        help="-1 means all; a legacy id 1-9 or comma separated task names")
     parser.add_argument('--asr', type=str, default='deepspeech', help="wav2vec or deepspeech")
+    parser.add_argument('--teeth', action='store_true', help="also extract teeth masks (easyportrait)")
+    parser.add_argument('--aud_ds', action='store_true', help="also extract deepspeech features to aud_ds.npy")
+    parser.add_argument('--jobs', type=int, default=2, help="max tasks running in parallel")
+    parser.add_argument('--force', action='store_true', help="ignore fingerprints and rerun every task")
+    parser.add_argument('--batch_size', type=int, default=16, help="batch size for parsing / landmarks (teeth uses half)")
+    parser.add_argument('--num_workers', type=int, default=4, help="data loader workers per batched stage")
+    parser.add_argument('--cpu_workers', type=int, default=None, help="processes for the torso/gt stage, default: all cores")
+    parser.add_argument('--bg_method', type=str, default='edt', help="edt (distance transform) or knn (original kd-tree)")
 
     opt = parser.parse_args()
 
@@ -370,40 +749,26 @@ if __name__ == '__main__':
     os.makedirs(gt_imgs_dir, exist_ok=True)
     os.makedirs(torso_imgs_dir, exist_ok=True)
 
-
-    # extract audio
-    if opt.task == -1 or opt.task == 1:
-        extract_audio(opt.path, wav_path)
-
-    # extract audio features
-    if opt.task == -1 or opt.task == 2:
-        extract_audio_features(wav_path, mode=opt.asr)
-
-    # extract images
-    if opt.task == -1 or opt.task == 3:
-        extract_images(opt.path, ori_imgs_dir)
-
-    # face parsing
-    if opt.task == -1 or opt.task == 4:
-        extract_semantics(ori_imgs_dir, parsing_dir)
-
-    # extract bg
-    if opt.task == -1 or opt.task == 5:
-        extract_background(base_dir, ori_imgs_dir)
-
-    # extract torso images and gt_images
-    if opt.task == -1 or opt.task == 6:
-        extract_torso_and_gt(base_dir, ori_imgs_dir)
-
-    # extract face landmarks
-    if opt.task == -1 or opt.task == 7:
-        extract_landmarks(ori_imgs_dir)
-
-    # face tracking
-    if opt.task == -1 or opt.task == 8:
-        face_tracking(ori_imgs_dir)
-
-    # save transforms.json
-    if opt.task == -1 or opt.task == 9:
-        save_transforms(base_dir, ori_imgs_dir)
-
+    tasks = build_tasks(opt)
+    ctx = {'video': opt.path, 'asr': opt.asr, 'base_dir': base_dir, 'wav_path': wav_path,
+           'ori_imgs_dir': ori_imgs_dir, 'parsing_dir': parsing_dir,
+           'batch_size': opt.batch_size, 'num_workers': opt.num_workers, 'bg_method': opt.bg_method,
+           'cpu_workers': opt.cpu_workers}
+
+    if opt.task == '-1':
+        selected, force = None, opt.force
+    else:
+        # an explicitly requested task always runs, without its dependencies
+        selected = [name for t in opt.task.split(',')
+                    for name in (TASK_IDS[int(t)] if t.strip().isdigit() else [t.strip()])]
+        unknown = [t for t in selected if t not in tasks]
+        if unknown:
+            parser.error(f'unknown task(s): {unknown}, available: {list(tasks)}')
+        force = True
+
+    t0 = time.time()
+    report = run_graph(tasks, ctx, selected, force=force, jobs=opt.jobs)
+    print_report(base_dir, report, time.time() - t0)
+
+    if any(status in ('failed', 'blocked') for status, _, _ in report.values()):
+        sys.exit(1)
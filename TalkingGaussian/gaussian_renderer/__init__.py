@@ -11,20 +11,37 @@
 
 import torch
 import math
-from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+try:
+    from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer as _CudaRasterizer
+    _cuda_import_error = None
+except ImportError as e:
+    # CUDA rasterizer not built: only CPU tensors can be rendered (torch_rasterizer, smoke runs)
+    from gaussian_renderer.torch_rasterizer import GaussianRasterizationSettings
+    _CudaRasterizer = None
+    _cuda_import_error = e
+from gaussian_renderer.torch_rasterizer import GaussianRasterizer as _TorchRasterizer
 from scene.gaussian_model import GaussianModel
 from scene.motion_net import MotionNetwork, MouthMotionNetwork
 from utils.sh_utils import eval_sh
 
+def GaussianRasterizer(raster_settings):
+    """CUDA rasterizer for GPU tensors; the PyTorch one only for CPU tensors (CPU smoke runs)"""
+    if not raster_settings.bg.is_cuda:
+        return _TorchRasterizer(raster_settings=raster_settings)
+    if _CudaRasterizer is None:
+        raise ImportError("diff_gaussian_rasterization is required to render on the GPU "
+                          f"(build submodules/diff-gaussian-rasterization): {_cuda_import_error}")
+    return _CudaRasterizer(raster_settings=raster_settings)
+
 def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None):
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the same device as the gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -103,15 +120,15 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
             "radii": radii}
 
 
-def render_motion(viewpoint_camera, pc : GaussianModel, motion_net : MotionNetwork, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, frame_idx = None, return_attn = False):
+def render_motion(viewpoint_camera, pc : GaussianModel, motion_net : MotionNetwork, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, frame_idx = None, return_attn = False, override_color = None):
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the same device as the gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -138,8 +155,8 @@ def render_motion(viewpoint_camera, pc : GaussianModel, motion_net : MotionNetwo
 
     rasterizer = GaussianRasterizer(raster_settings=raster_settings)
     
-    audio_feat = viewpoint_camera.talking_dict["auds"].cuda()
-    exp_feat = viewpoint_camera.talking_dict["au_exp"].cuda()
+    audio_feat = viewpoint_camera.talking_dict["auds"].to(pc.get_xyz.device)
+    exp_feat = viewpoint_camera.talking_dict["au_exp"].to(pc.get_xyz.device)
 
     # ind_code = motion_net.individual_codes[frame_idx if frame_idx is not None else viewpoint_camera.talking_dict["img_id"]]
     ind_code = None
@@ -156,6 +173,9 @@ def render_motion(viewpoint_camera, pc : GaussianModel, motion_net : MotionNetwo
 
     colors_precomp = None
     shs = pc.get_features
+    if override_color is not None:
+        colors_precomp = override_color
+        shs = None
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     rendered_image, radii, rendered_depth, rendered_alpha = rasterizer(
@@ -198,15 +218,15 @@ def render_motion(viewpoint_camera, pc : GaussianModel, motion_net : MotionNetwo
 
 
 
-def render_motion_mouth(viewpoint_camera, pc : GaussianModel, motion_net : MouthMotionNetwork, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, frame_idx = None, return_attn = False):
+def render_motion_mouth(viewpoint_camera, pc : GaussianModel, motion_net : MouthMotionNetwork, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, frame_idx = None, return_attn = False, override_color = None):
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the same device as the gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -233,7 +253,7 @@ def render_motion_mouth(viewpoint_camera, pc : GaussianModel, motion_net : Mouth
 
     rasterizer = GaussianRasterizer(raster_settings=raster_settings)
     
-    audio_feat = viewpoint_camera.talking_dict["auds"].cuda()
+    audio_feat = viewpoint_camera.talking_dict["auds"].to(pc.get_xyz.device)
 
     motion_preds = motion_net(pc.get_xyz, audio_feat)
     means3D = pc.get_xyz + motion_preds['d_xyz']
@@ -246,6 +266,9 @@ def render_motion_mouth(viewpoint_camera, pc : GaussianModel, motion_net : Mouth
 
     colors_precomp = None
     shs = pc.get_features
+    if override_color is not None:
+        colors_precomp = override_color
+        shs = None
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     rendered_image, radii, rendered_depth, rendered_alpha = rasterizer(
@@ -269,3 +292,94 @@ def render_motion_mouth(viewpoint_camera, pc : GaussianModel, motion_net : Mouth
             "radii": radii,
             "motion": motion_preds}
 
+
+
+
+def _raster_settings(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0):
+    tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
+    tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
+
+    return GaussianRasterizationSettings(
+        image_height=int(viewpoint_camera.image_height),
+        image_width=int(viewpoint_camera.image_width),
+        tanfovx=tanfovx,
+        tanfovy=tanfovy,
+        bg=bg_color,
+        scale_modifier=scaling_modifier,
+        viewmatrix=viewpoint_camera.world_view_transform,
+        projmatrix=viewpoint_camera.full_proj_transform,
+        sh_degree=pc.active_sh_degree,
+        campos=viewpoint_camera.camera_center,
+        prefiltered=False,
+        debug=pipe.debug
+    )
+
+
+@torch.no_grad()
+def render_motion_batch(viewpoint_cameras, pc : GaussianModel, motion_net : MotionNetwork, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0):
+    """
+    Inference-only batched variant of render_motion.
+
+    The motion network is evaluated for all frames in one call (the static xyz encoding is shared),
+    then every frame is rasterized with the per-model tensors (features, opacity, means2D) reused.
+    """
+    audio_feat = torch.stack([cam.talking_dict["auds"] for cam in viewpoint_cameras]).to(pc.get_xyz.device)
+    exp_feat = torch.stack([cam.talking_dict["au_exp"] for cam in viewpoint_cameras]).to(pc.get_xyz.device)
+    motion_preds = motion_net.forward_batch(pc.get_xyz, audio_feat, exp_feat)
+
+    xyz = pc.get_xyz
+    means2D = torch.zeros_like(xyz)
+    opacity = pc.get_opacity
+    shs = pc.get_features
+
+    outputs = []
+    for i, viewpoint_camera in enumerate(viewpoint_cameras):
+        rasterizer = GaussianRasterizer(raster_settings=_raster_settings(viewpoint_camera, pc, pipe, bg_color, scaling_modifier))
+        rendered_image, radii, rendered_depth, rendered_alpha = rasterizer(
+            means3D = xyz + motion_preds['d_xyz'][i],
+            means2D = means2D,
+            shs = shs,
+            colors_precomp = None,
+            opacities = opacity,
+            scales = pc.scaling_activation(pc._scaling + motion_preds['d_scale'][i]),
+            rotations = pc.rotation_activation(pc._rotation + motion_preds['d_rot'][i]),
+            cov3D_precomp = None)
+        outputs.append({"render": rendered_image,
+                        "depth": rendered_depth,
+                        "alpha": rendered_alpha,
+                        "radii": radii})
+    return outputs
+
+
+@torch.no_grad()
+def render_motion_mouth_batch(viewpoint_cameras, pc : GaussianModel, motion_net : MouthMotionNetwork, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0):
+    """
+    Inference-only batched variant of render_motion_mouth, see render_motion_batch.
+    """
+    audio_feat = torch.stack([cam.talking_dict["auds"] for cam in viewpoint_cameras]).to(pc.get_xyz.device)
+    motion_preds = motion_net.forward_batch(pc.get_xyz, audio_feat)
+
+    xyz = pc.get_xyz
+    means2D = torch.zeros_like(xyz)
+    opacity = pc.get_opacity
+    scales = pc.get_scaling
+    rotations = pc.get_rotation
+    shs = pc.get_features
+
+    outputs = []
+    for i, viewpoint_camera in enumerate(viewpoint_cameras):
+        rasterizer = GaussianRasterizer(raster_settings=_raster_settings(viewpoint_camera, pc, pipe, bg_color, scaling_modifier))
+        rendered_image, radii, rendered_depth, rendered_alpha = rasterizer(
+            means3D = xyz + motion_preds['d_xyz'][i],
+            means2D = means2D,
+            shs = shs,
+            colors_precomp = None,
+            opacities = opacity,
+            scales = scales,
+            rotations = rotations,
+            cov3D_precomp = None)
+        outputs.append({"render": rendered_image,
+                        "depth": rendered_depth,
+                        "alpha": rendered_alpha,
+                        "radii": radii})
+    return outputs
@@ -0,0 +1,141 @@
+#
+# 纯 PyTorch 高斯光栅化（diff_gaussian_rasterization 的 CPU 替代）
+#
+# 接口与输出和 CUDA 光栅化器一致：(image [3, H, W], radii [P], depth [1, H, W], alpha [1, H, W])。
+# 按 3DGS 前向公式（EWA 投影、0.3 低通、3σ 半径、按深度排序的 alpha 合成、T < 1e-4 提前终止）
+# 对每个像素合成全部可见高斯，不分 tile，复杂度 O(P * H * W)，
+# 只用于没有 GPU 时的冒烟测试（几次迭代、低分辨率），不用于正式训练或推理。
+# means2D 按 NDC 坐标叠加到投影位置上，其梯度与 CUDA 版本一样可用于致密化统计。
+#
+
+from typing import NamedTuple
+
+import torch
+
+from utils.sh_utils import eval_sh
+from utils.general_utils import build_scaling_rotation
+
+
+class GaussianRasterizationSettings(NamedTuple):
+    image_height: int
+    image_width: int
+    tanfovx: float
+    tanfovy: float
+    bg: torch.Tensor
+    scale_modifier: float
+    viewmatrix: torch.Tensor
+    projmatrix: torch.Tensor
+    sh_degree: int
+    campos: torch.Tensor
+    prefiltered: bool
+    debug: bool
+
+
+def _unpack_cov3D(cov):
+    """[P, 6]（xx, xy, xz, yy, yz, zz）-> [P, 3, 3]"""
+    return torch.stack([cov[:, 0], cov[:, 1], cov[:, 2],
+                        cov[:, 1], cov[:, 3], cov[:, 4],
+                        cov[:, 2], cov[:, 4], cov[:, 5]], dim=1).view(-1, 3, 3)
+
+
+def rasterize_gaussians(settings, means3D, means2D, opacities, shs=None, colors_precomp=None,
+                        scales=None, rotations=None, cov3D_precomp=None, max_elements=2 ** 24):
+    H, W = settings.image_height, settings.image_width
+    device = means3D.device
+    bg = settings.bg.to(device)
+
+    # 投影（矩阵为行向量约定，与 Camera.world_view_transform / full_proj_transform 一致）
+    hom = torch.cat([means3D, torch.ones_like(means3D[:, :1])], dim=1)
+    p_view = hom @ settings.viewmatrix
+    p_proj = hom @ settings.projmatrix
+    ndc = p_proj[:, :2] / (p_proj[:, 3:4] + 1e-7) + means2D[:, :2]
+    depth = p_view[:, 2]
+    in_frustum = depth > 0.2
+
+    # 3D 协方差 -> 屏幕空间 2D 协方差（EWA）
+    if cov3D_precomp is not None:
+        cov3D = _unpack_cov3D(cov3D_precomp)
+    else:
+        L = build_scaling_rotation(scales * settings.scale_modifier, rotations)
+        cov3D = L @ L.transpose(1, 2)
+    focal_x = W / (2 * settings.tanfovx)
+    focal_y = H / (2 * settings.tanfovy)
+    tz = torch.where(in_frustum, depth, torch.ones_like(depth))
+    limx, limy = 1.3 * settings.tanfovx, 1.3 * settings.tanfovy
+    tx = (p_view[:, 0] / tz).clamp(-limx, limx) * tz
+    ty = (p_view[:, 1] / tz).clamp(-limy, limy) * tz
+    zeros = torch.zeros_like(tz)
+    J = torch.stack([focal_x / tz, zeros, -focal_x * tx / tz ** 2,
+                     zeros, focal_y / tz, -focal_y * ty / tz ** 2], dim=1).view(-1, 2, 3)
+    T = J @ settings.viewmatrix[:3, :3].T
+    cov2D = T @ cov3D @ T.transpose(1, 2)
+    a = cov2D[:, 0, 0] + 0.3
+    b = cov2D[:, 0, 1]
+    c = cov2D[:, 1, 1] + 0.3
+    det = a * c - b * b
+
+    px = ((ndc[:, 0] + 1) * W - 1) * 0.5
+    py = ((ndc[:, 1] + 1) * H - 1) * 0.5
+    with torch.no_grad():
+        mid = 0.5 * (a + c)
+        radius = torch.ceil(3 * torch.sqrt(mid + torch.sqrt((mid * mid - det).clamp_min(0.1))))
+        on_screen = (px + radius >= 0) & (px - radius < W) & (py + radius >= 0) & (py - radius < H)
+        visible = in_frustum & (det > 0) & (radius > 0) & on_screen
+        radii = torch.where(visible, radius, torch.zeros_like(radius)).int()
+
+    if colors_precomp is None:
+        dirs = means3D - settings.campos.to(device)
+        dirs = dirs / dirs.norm(dim=1, keepdim=True)
+        colors_precomp = torch.clamp_min(eval_sh(settings.sh_degree, shs.transpose(1, 2), dirs) + 0.5, 0.0)
+
+    # 可见高斯按深度由近到远
+    idx = torch.nonzero(visible).squeeze(1)
+    idx = idx[torch.argsort(depth[idx])]
+    if idx.numel() == 0:
+        image = bg[:, None, None].expand(-1, H, W) + 0 * means3D.sum()
+        return image, radii, torch.zeros(1, H, W, device=device), torch.zeros(1, H, W, device=device)
+
+    det_v = det[idx]
+    conic = torch.stack([c[idx] / det_v, -b[idx] / det_v, a[idx] / det_v], dim=1)
+    xy = torch.stack([px[idx], py[idx]], dim=1)
+    opacity = opacities[idx, 0]
+    color = colors_precomp[idx]
+    z = depth[idx]
+
+    ys, xs = torch.meshgrid(torch.arange(H, device=device, dtype=xy.dtype),
+                            torch.arange(W, device=device, dtype=xy.dtype), indexing='ij')
+    pixels = torch.stack([xs.reshape(-1), ys.reshape(-1)], dim=1)
+    chunk = max(1, max_elements // idx.numel())
+    out_color, out_depth, out_alpha = [], [], []
+    for start in range(0, pixels.shape[0], chunk):
+        d = xy[None] - pixels[start:start + chunk, None]
+        power = -0.5 * (conic[:, 0] * d[..., 0] ** 2 + conic[:, 2] * d[..., 1] ** 2) - conic[:, 1] * d[..., 0] * d[..., 1]
+        alpha = (opacity * torch.exp(power)).clamp_max(0.99)
+        alpha = torch.where((power <= 0) & (alpha >= 1.0 / 255.0), alpha, torch.zeros_like(alpha))
+        trans = torch.cumprod(1 - alpha, dim=1)
+        # 与 CUDA 一样：透射率将降到 1e-4 以下时停止合成
+        weight = alpha * torch.cat([torch.ones_like(trans[:, :1]), trans[:, :-1]], dim=1) * (trans >= 1e-4)
+        final_t = 1 - weight.sum(dim=1, keepdim=True)
+        out_color.append(weight @ color + final_t * bg[None])
+        out_depth.append(weight @ z)
+        out_alpha.append(1 - final_t[:, 0])
+
+    image = torch.cat(out_color).T.reshape(-1, H, W)
+    rendered_depth = torch.cat(out_depth).reshape(1, H, W)
+    rendered_alpha = torch.cat(out_alpha).reshape(1, H, W)
+    return image, radii, rendered_depth, rendered_alpha
+
+
+class GaussianRasterizer(torch.nn.Module):
+    def __init__(self, raster_settings):
+        super().__init__()
+        self.raster_settings = raster_settings
+
+    def forward(self, means3D, means2D, opacities, shs=None, colors_precomp=None, scales=None, rotations=None, cov3D_precomp=None):
+        if (shs is None) == (colors_precomp is None):
+            raise Exception('Please provide exactly one of either SHs or precomputed colors!')
+        if ((scales is None or rotations is None) and cov3D_precomp is None) or \
+                ((scales is not None or rotations is not None) and cov3D_precomp is not None):
+            raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
+        return rasterize_gaussians(self.raster_settings, means3D, means2D, opacities, shs, colors_precomp,
+                                   scales, rotations, cov3D_precomp)
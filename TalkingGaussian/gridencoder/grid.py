@@ -9,7 +9,12 @@ from torch.cuda.amp import custom_bwd, custom_fwd
 try:
     import _gridencoder as _backend
 except ImportError:
-    from .backend import _backend
+    try:
+        from .backend import _backend
+    except Exception as e:
+        # no CUDA toolchain (CPU-only machine): only grid_encode_torch below is available
+        print(f'[WARN] gridencoder CUDA backend unavailable ({e}), using the PyTorch implementation')
+        _backend = None
 
 _gridtype_to_id = {
     'hash': 0,
@@ -93,6 +98,64 @@ class _grid_encode(Function):
 grid_encode = _grid_encode.apply
 
 
+_primes = (1, 2654435761, 805459861, 3674653429, 2097192037, 1434869437, 2165219737)
+
+
+def _grid_index(corner, gridtype, align_corners, hashmap_size, resolution):
+    # same indexing as get_grid_index in src/gridencoder.cu, so embeddings are interchangeable
+    stride = 1
+    index = 0
+    for d in range(len(corner)):
+        if stride > hashmap_size:
+            break
+        index = index + corner[d] * stride
+        stride *= resolution if align_corners else resolution + 1
+    if gridtype == 0 and stride > hashmap_size:
+        index = 0
+        for d in range(len(corner)):
+            index = index ^ ((corner[d] * _primes[d]) & 0xFFFFFFFF)
+    return index % hashmap_size
+
+
+def grid_encode_torch(inputs, embeddings, offsets, per_level_scale, base_resolution, gridtype=0, align_corners=False, interpolation=0):
+    # PyTorch version of grid_encode (forward of kernel_grid), gradients come from autograd.
+    # inputs: [B, D] in [0, 1], RETURN: [B, L * C]
+    B, D = inputs.shape
+    offsets = offsets.tolist()
+    S = np.float32(np.log2(per_level_scale))
+    outputs = []
+    for level in range(len(offsets) - 1):
+        grid = embeddings[offsets[level]:offsets[level + 1]]
+        hashmap_size = offsets[level + 1] - offsets[level]
+        scale = float(np.exp2(np.float32(level) * S) * np.float32(base_resolution) - np.float32(1.0))
+        resolution = int(np.ceil(scale)) + 1
+
+        pos = inputs.float() * scale + (0.0 if align_corners else 0.5)
+        pos_grid = torch.floor(pos)
+        pos = pos - pos_grid
+        pos_grid = pos_grid.long()
+        if interpolation == 1:
+            pos = pos * pos * (3 - 2 * pos)
+
+        result = 0
+        for idx in range(1 << D):
+            w = 1
+            corner = []
+            for d in range(D):
+                if idx & (1 << d) == 0:
+                    w = w * (1 - pos[:, d])
+                    corner.append(pos_grid[:, d])
+                else:
+                    w = w * pos[:, d]
+                    corner.append(pos_grid[:, d] + 1)
+            result = result + w[:, None] * grid[_grid_index(corner, gridtype, align_corners, hashmap_size, resolution)]
+        outputs.append(result)
+
+    # out of bound inputs are encoded as 0
+    oob = ((inputs < 0) | (inputs > 1)).any(dim=1, keepdim=True)
+    return torch.cat(outputs, dim=1).masked_fill(oob, 0).to(embeddings.dtype)
+
+
 class GridEncoder(nn.Module):
     def __init__(self, input_dim=3, num_levels=16, level_dim=2, per_level_scale=2, base_resolution=16, log2_hashmap_size=19, desired_resolution=None, gridtype='hash', align_corners=False, interpolation='linear'):
         super().__init__()
@@ -153,7 +216,10 @@ class GridEncoder(nn.Module):
         prefix_shape = list(inputs.shape[:-1])
         inputs = inputs.view(-1, self.input_dim)
 
-        outputs = grid_encode(inputs, self.embeddings, self.offsets, self.per_level_scale, self.base_resolution, inputs.requires_grad, self.gridtype_id, self.align_corners, self.interp_id)
+        if inputs.is_cuda and _backend is not None:
+            outputs = grid_encode(inputs, self.embeddings, self.offsets, self.per_level_scale, self.base_resolution, inputs.requires_grad, self.gridtype_id, self.align_corners, self.interp_id)
+        else:
+            outputs = grid_encode_torch(inputs, self.embeddings, self.offsets, self.per_level_scale, self.base_resolution, self.gridtype_id, self.align_corners, self.interp_id)
         outputs = outputs.view(prefix_shape + [self.output_dim])
 
         #print('outputs', outputs.shape, outputs.dtype, outputs.min().item(), outputs.max().item())
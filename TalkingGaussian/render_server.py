@@ -0,0 +1,317 @@
+"""
+TalkingGaussian 常驻渲染服务
+
+与 run_talkinggaussian.sh（bash → conda run → test_talkinggaussian.py → synthesize_fuse.py）
+每次请求都重新加载模型不同，本服务在进程内常驻：
+  - 每个 (模型目录, 数据目录, 特征提取器, sh_degree) 只加载一次高斯模型、运动网络与相机模板；
+  - 渲染任务通过本地 HTTP 提交（wav 或特征 .npy 输入，mp4 输出）。
+
+启动（需在 talking_gaussian 环境中）：
+    bash run_talkinggaussian.sh serve --port 5010
+    或：python render_server.py --port 5010 --preload output/talking_May:data/May
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+import threading
+import traceback
+from argparse import ArgumentParser
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 特征提取脚本等均使用相对 TalkingGaussian 目录的路径
+os.chdir(SCRIPT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+import numpy as np
+import torch
+from flask import Flask, request, jsonify
+
+from arguments import ModelParams, PipelineParams, get_combined_args
+from scene.inference_cache import load_inference_cameras
+from scene.bundle import RenderBundle, is_bundle, bundle_info
+from utils.audio_utils import get_audio_windows
+from utils.feature_stream import FeatureStream
+from utils.video_writer import FFmpegFrameWriter
+from synthesize_fuse import load_fuse_models, render_frames, to_uint8
+from test_talkinggaussian import extract_audio_features, fix_feature_length
+
+app = Flask(__name__)
+
+
+def _resolve(path):
+    """相对路径按 TalkingGaussian 目录解析，找不到再按项目根目录解析"""
+    if not path or os.path.isabs(path):
+        return path
+    candidate = os.path.join(SCRIPT_DIR, path)
+    if os.path.exists(candidate):
+        return os.path.abspath(candidate)
+    return os.path.abspath(os.path.join(os.path.dirname(SCRIPT_DIR), path))
+
+
+class WarmRenderer:
+    """常驻内存的单个 TalkingGaussian 模型：高斯、运动网络与训练相机模板只加载一次"""
+
+    def __init__(self, model_path, dataset_path, audio_extractor='deepspeech', sh_degree=2, batch_size=8):
+        parser = ArgumentParser()
+        model = ModelParams(parser)
+        pipeline = PipelineParams(parser)
+        if is_bundle(model_path):
+            # 模型包自带所有推理数据，不读取 cfg_args 与数据集
+            self.bundle = RenderBundle(model_path)
+            args = parser.parse_args(['-M', os.path.dirname(model_path),
+                                      '--audio_extractor', self.bundle.audio_extractor])
+        else:
+            self.bundle = None
+            args = get_combined_args(parser, [
+                '-S', dataset_path,
+                '-M', model_path,
+                '--audio_extractor', audio_extractor,
+                '--sh_degree', str(sh_degree),
+            ])
+        self.dataset = model.extract(args)
+        self.pipeline = pipeline.extract(args)
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+
+        start = time.time()
+        with torch.no_grad():
+            if self.bundle is not None:
+                (self.gaussians, self.motion_net,
+                 self.gaussians_mouth, self.motion_net_mouth) = self.bundle.load_models()
+                self.dataset.white_background = self.bundle.white_background
+            else:
+                (self.gaussians, self.motion_net,
+                 self.gaussians_mouth, self.motion_net_mouth) = load_fuse_models(self.dataset, persist_static=True)
+
+            bg_color = [1, 1, 1] if self.dataset.white_background else [0, 0, 0]
+            # 与高斯在同一设备上（光栅化要求）
+            self.background = torch.tensor(bg_color, dtype=torch.float32, device=self.gaussians.get_xyz.device)
+
+            # 相机模板：训练集每帧的位姿、背景、AU 与嘴部范围；音频窗口在每个任务中替换
+            # 从推理缓存（或模型包）读取，不加载 gt 图像与掩码，背景渲染时按帧读取
+            if self.bundle is not None:
+                self.template = self.bundle.cameras(data_device=self.dataset.data_device)
+            else:
+                self.template = load_inference_cameras(self.dataset.source_path, "transforms_train.json",
+                                                       data_device=self.dataset.data_device, load_audio=False)
+        print(f"[render_server] 模型已加载: {model_path} ({len(self.template)} 帧模板, {time.time() - start:.1f}s)")
+
+    def build_views(self, auds, start_frame=0, num_frames=None):
+        """
+        按新音频帧数从模板中取相机（镜像循环，与 readCamerasFromTransforms 扩展策略一致）
+        start_frame: 流式分段渲染时本段在整段回复中的起始帧，保证相邻分段的头部姿态连续
+        num_frames: 给定时 auds 为整段回复累积的特征（见 utils/feature_stream.py），只渲染其中
+                    [start_frame, start_frame + num_frames) 的帧，音频窗口在分段接缝处取真实的前后帧而非补零
+        """
+        if num_frames is None:
+            aud_offset, count = 0, auds.shape[0]
+        else:
+            aud_offset, count = start_frame, min(num_frames, auds.shape[0] - start_frame)
+        template_frames = len(self.template)
+        if start_frame > 0 or count > template_frames:
+            cycle_ids = list(range(template_frames)) + list(range(template_frames - 2, 0, -1))
+        else:
+            cycle_ids = list(range(template_frames))
+
+        aud_windows = get_audio_windows(auds, device=self.dataset.data_device)
+        views = []
+        for idx in range(count):
+            src = self.template[cycle_ids[(start_frame + idx) % len(cycle_ids)]]
+            view = copy.copy(src)
+            view.talking_dict = dict(src.talking_dict)
+            view.talking_dict['auds'] = aud_windows[aud_offset + idx]
+            view.talking_dict['img_id'] = idx
+            views.append(view)
+        return views
+
+    def render(self, feature_file, out_mp4, dilate=False, start_frame=0, audio=None, num_frames=None):
+        """audio: 可选 wav，与渲染同一次编码合成音轨；num_frames 见 build_views"""
+        aud_features = torch.from_numpy(np.load(feature_file))
+        auds = aud_features.float().permute(0, 2, 1)
+
+        os.makedirs(os.path.dirname(out_mp4), exist_ok=True)
+        with self.lock, torch.no_grad():
+            start = time.time()
+            # 边渲染边编码，不在内存中累积整段视频
+            with FFmpegFrameWriter(out_mp4, fps=25, audio=audio) as writer:
+                for out in render_frames(self.build_views(auds, start_frame, num_frames), self.gaussians, self.motion_net,
+                                         self.gaussians_mouth, self.motion_net_mouth, self.pipeline,
+                                         self.background, dilate, self.batch_size):
+                    writer.write(to_uint8(out["image"]))
+            elapsed = time.time() - start
+
+        print(f"[render_server] 渲染 {writer.num_frames} 帧，用时 {elapsed:.2f}s ({writer.num_frames / max(elapsed, 1e-6):.1f} fps)")
+        return writer.num_frames
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+# 每个模型各自的加载锁：冷加载一个模型时不阻塞其它已加载模型的渲染
+_loading_locks = {}
+# 运动网络批量推理的帧数，由 --batch_size 设置
+RENDER_BATCH_SIZE = 8
+
+
+def get_renderer(model_path, dataset_path, audio_extractor='deepspeech', sh_degree=2):
+    key = (os.path.abspath(model_path), os.path.abspath(dataset_path), audio_extractor, int(sh_degree))
+    with _renderers_lock:
+        renderer = _renderers.get(key)
+        if renderer is not None:
+            return renderer
+        loading_lock = _loading_locks.setdefault(key, threading.Lock())
+    # 同一模型的并发请求只加载一次，后到的请求等待加载完成
+    with loading_lock:
+        with _renderers_lock:
+            renderer = _renderers.get(key)
+        if renderer is None:
+            renderer = WarmRenderer(*key, batch_size=RENDER_BATCH_SIZE)
+            with _renderers_lock:
+                _renderers[key] = renderer
+                _loading_locks.pop(key, None)
+    return renderer
+
+
+_feature_streams = {}
+_feature_streams_lock = threading.Lock()
+# 未收到 final 的流（会话中途出错等）超过该时长后丢弃
+FEATURE_STREAM_TTL = 3600
+
+
+def get_feature_stream(stream_id, work_dir, audio_extractor):
+    with _feature_streams_lock:
+        now = time.time()
+        for key in [k for k, (_, created) in _feature_streams.items() if now - created > FEATURE_STREAM_TTL]:
+            del _feature_streams[key]
+        entry = _feature_streams.get(stream_id)
+        if entry is None:
+            os.makedirs(work_dir, exist_ok=True)
+            feature_file = os.path.join(work_dir, f"{stream_id}_{audio_extractor}.npy")
+            entry = (FeatureStream(feature_file, audio_extractor), now)
+            _feature_streams[stream_id] = entry
+        return entry[0]
+
+
+@app.get("/health")
+def health():
+    with _renderers_lock:
+        models = [k[0] for k in _renderers.keys()]
+    return {"status": "ok", "models": models}
+
+
+@app.post("/render")
+def render():
+    """
+    请求 JSON：
+      - wav 或 feature_file: 二选一，输入音频 / 已提取的音频特征 (.npy)
+      - out: 输出 mp4 路径（提供 wav 时为带音轨的最终视频）
+      - model_path, dataset_path, audio_extractor, sh_degree
+        model_path 为 .tgb 模型包（python -m scene.bundle 导出）时不需要 dataset_path，audio_extractor 取自模型包
+      - start_frame: 可选，流式分段渲染时本段的起始帧
+      - num_frames: 可选，与 start_frame 一起只渲染 feature_file 中 [start_frame, start_frame + num_frames) 的帧
+        （feature_file 为 /features 累积的整段特征，同时提供的 wav 只作为本段音轨）
+      - work_dir: 可选，音频特征等中间文件目录（请求工作目录），缺省为 test_result
+    """
+    data = request.get_json(force=True) or {}
+    wav = _resolve(data.get('wav'))
+    feature_file = _resolve(data.get('feature_file'))
+    out = _resolve(data.get('out'))
+    model_path = _resolve(data.get('model_path', 'output/talking_May'))
+    dataset_path = _resolve(data.get('dataset_path', 'data/May'))
+    audio_extractor = data.get('audio_extractor', 'deepspeech')
+    sh_degree = int(data.get('sh_degree', 2))
+    start_frame = int(data.get('start_frame', 0))
+    num_frames = int(data['num_frames']) if data.get('num_frames') is not None else None
+    work_dir = _resolve(data.get('work_dir')) or os.path.join(SCRIPT_DIR, 'test_result')
+
+    if not out or not (wav or feature_file):
+        return jsonify({"status": "error", "message": "缺少 out 以及 wav/feature_file"}), 400
+    if is_bundle(model_path):
+        audio_extractor = bundle_info(model_path)['audio_extractor']
+        dataset_path = ''
+    for path in (wav or feature_file, feature_file or wav, model_path, dataset_path or model_path):
+        if not os.path.exists(path):
+            return jsonify({"status": "error", "message": f"路径不存在: {path}"}), 400
+
+    try:
+        renderer = get_renderer(model_path, dataset_path, audio_extractor, sh_degree)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+        if wav and not feature_file:
+            # 特征文件放在请求的工作目录（缺省与 run_talkinggaussian.sh 一样放在 test_result）
+            os.makedirs(work_dir, exist_ok=True)
+            ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+            basename = os.path.splitext(os.path.basename(wav))[0]
+            feature_file = extract_audio_features(wav, work_dir, basename, audio_extractor, ts)
+            if feature_file is None:
+                return jsonify({"status": "error", "message": "音频特征提取失败"}), 500
+            fix_feature_length(feature_file, wav)
+
+        # 帧数已与音频对齐，渲染、编码与合成音轨（提供 wav 时）一次完成
+        rendered = renderer.render(feature_file, out, start_frame=start_frame, audio=wav, num_frames=num_frames)
+        return jsonify({"status": "success", "video_path": out, "frames": rendered})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": f"渲染失败: {e}"}), 500
+
+
+@app.post("/features")
+def features():
+    """
+    流式对话的增量音频特征（模型常驻，不再逐段启动提取脚本）
+    请求 JSON：
+      - stream_id: 会话 id，同一会话的音频依次追加
+      - wav: 本次新增的音频（16 bit 单声道 wav）；final: 音频已结束
+      - work_dir: 累积特征文件所在目录
+      - audio_extractor，或 model_path 为 .tgb 模型包时取自模型包
+    返回 feature_file（整段累积的特征）与 frames（已定稿、之后不再改变的帧数）
+    """
+    data = request.get_json(force=True) or {}
+    stream_id = data.get('stream_id')
+    wav = _resolve(data.get('wav'))
+    work_dir = _resolve(data.get('work_dir')) or os.path.join(SCRIPT_DIR, 'test_result')
+    final = bool(data.get('final', False))
+    audio_extractor = data.get('audio_extractor', 'deepspeech')
+    model_path = _resolve(data.get('model_path'))
+    if is_bundle(model_path):
+        audio_extractor = bundle_info(model_path)['audio_extractor']
+    if not stream_id or os.path.basename(stream_id) != stream_id:
+        return jsonify({"status": "error", "message": "缺少或非法的 stream_id"}), 400
+    if wav and not os.path.exists(wav):
+        return jsonify({"status": "error", "message": f"路径不存在: {wav}"}), 400
+
+    try:
+        stream = get_feature_stream(stream_id, work_dir, audio_extractor)
+        if wav:
+            stream.append_wav(wav)
+        frames = stream.update(final)
+        if final:
+            with _feature_streams_lock:
+                _feature_streams.pop(stream_id, None)
+        return jsonify({"status": "success", "feature_file": stream.feature_file, "frames": frames})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": f"特征提取失败: {e}"}), 500
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='TalkingGaussian 常驻渲染服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5010)
+    parser.add_argument('--audio_extractor', default='deepspeech')
+    parser.add_argument('--sh_degree', type=int, default=2)
+    parser.add_argument('--batch_size', type=int, default=8, help='运动网络批量推理的帧数，1 为逐帧渲染')
+    parser.add_argument('--preload', action='append', default=[],
+                        help='启动时预加载的模型，格式 <model_path>:<dataset_path>，可重复')
+    opt = parser.parse_args()
+    RENDER_BATCH_SIZE = opt.batch_size
+
+    for item in opt.preload:
+        model_path, dataset_path = item.split(':', 1)
+        get_renderer(_resolve(model_path), _resolve(dataset_path), opt.audio_extractor, opt.sh_degree)
+
+    # 同一模型的渲染由 WarmRenderer.lock 串行化，不同模型可并发
+    app.run(host=opt.host, port=opt.port, threaded=True)
@@ -8,11 +8,22 @@ set -e
 #   --dataset  data/May
 #   --model    output/talking_May
 #   --sh_degree 0|1|2|3            (default 2, rendering quality level)
+#   --workdir  <dir>               per-request scratch dir; intermediates go there and the
+#                                  final video is written to exactly --out (no timestamped copies)
+#
+# Resident render server (models stay loaded between requests):
+#   ./run_talkinggaussian.sh serve --port 5010 --preload output/talking_May:data/May
 
 MODE="$1"; shift || true
 
+if [ "$MODE" = "serve" ]; then
+  SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+  cd "$SCRIPT_DIR" || exit 1
+  exec conda run -n talking_gaussian --no-capture-output python render_server.py "$@"
+fi
+
 if [ "$MODE" != "infer" ]; then
-  echo "Only infer is supported."
+  echo "Only infer and serve are supported."
   exit 1
 fi
 
@@ -22,6 +33,7 @@ EXTRACTOR="deepspeech"
 DATASET="data/May"
 MODEL="output/talking_May"
 SH_DEGREE="2"
+WORKDIR=""
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -31,6 +43,7 @@ while [[ $# -gt 0 ]]; do
     --dataset) DATASET="$2"; shift 2;;
     --model) MODEL="$2"; shift 2;;
     --sh_degree) SH_DEGREE="$2"; shift 2;;
+    --workdir) WORKDIR="$2"; shift 2;;
     *) echo "Unknown arg: $1"; exit 1;;
   esac
 done
@@ -40,7 +53,7 @@ if [ -z "$WAV" ] || [ -z "$OUT" ]; then
   exit 1
 fi
 
-# We reuse your tested Python pipeline (feature -> synthesize -> trim -> mux)
+# We reuse your tested Python pipeline (feature -> synthesize with audio muxed in one encode)
 # It creates final mp4 in test_result/<basename>_final.mp4
 # Use conda run to switch to talking_gaussian environment
 # Note: Need to change to TalkingGaussian directory before running Python script
@@ -77,18 +90,37 @@ if [[ "$AUDIO_ARG" != /* ]]; then
   fi
 fi
 
+OUTPUT_DIR="test_result"
+if [ -n "$WORKDIR" ]; then
+  OUTPUT_DIR="$WORKDIR"
+fi
+
 conda run -n talking_gaussian --no-capture-output \
     python test_talkinggaussian.py \
     --audio_file "$AUDIO_ARG" \
     --audio_extractor "$EXTRACTOR" \
     --dataset_path "$DATASET" \
     --model_path "$MODEL" \
-    --output_dir "test_result" \
+    --output_dir "$OUTPUT_DIR" \
     --sh_degree "$SH_DEGREE"
 
-# Find final file and copy to OUT
 BASENAME="$(basename "$WAV_REL")"
 NAME="${BASENAME%.*}"
+
+# Per-request workdir: the final file name is known, copy it to exactly OUT
+if [ -n "$WORKDIR" ]; then
+  FINAL="$WORKDIR/${NAME}_final.mp4"
+  if [ ! -f "$FINAL" ]; then
+    echo "Final mp4 not found: $FINAL"
+    exit 1
+  fi
+  mkdir -p "$(dirname "$OUT")"
+  cp -f "$FINAL" "$OUT"
+  echo "OK: $OUT"
+  exit 0
+fi
+
+# Find final file and copy to OUT
 FINAL="test_result/${NAME}_final.mp4"
 
 if [ ! -f "$FINAL" ]; then
@@ -18,7 +18,8 @@ from scene.dataset_readers import sceneLoadTypeCallbacks
 from scene.gaussian_model import GaussianModel
 from scene.motion_net import MotionNetwork, MouthMotionNetwork
 from arguments import ModelParams
-from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON
+from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON, loadCamOnTheFly, copyCamera
+from scene.frame_loader import FrameLoader, ViewpointSampler
 
 class Scene:
 
@@ -75,19 +76,42 @@ class Scene:
             self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args)
 
         if self.loaded_iter:
-            self.gaussians.load_ply(os.path.join(self.model_path,
-                                                           "point_cloud",
-                                                           "iteration_" + str(self.loaded_iter),
-                                                           "point_cloud.ply"))
+            point_cloud_path = os.path.join(self.model_path, "point_cloud", "iteration_" + str(self.loaded_iter))
+            if os.path.exists(os.path.join(point_cloud_path, "point_cloud.gsb")):
+                self.gaussians.load_gsb(os.path.join(point_cloud_path, "point_cloud.gsb"))
+            else:
+                self.gaussians.load_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
         else:
             self.gaussians.create_from_pcd(scene_info.point_cloud, self.cameras_extent)
 
         gc.collect()
+
+        self.frame_loader = None
+        if not getattr(args, 'preload', True):
+            self.frame_loader = FrameLoader(args.source_path, args.data_device, args.host_cache,
+                                            args.device_cache, args.loader_workers)
+        self.prefetch = getattr(args, 'prefetch', 0)
+        self.export_ply = getattr(args, 'export_ply', False)
+        self.half_checkpoint = getattr(args, 'half_checkpoint', False)
+
+    def load_view(self, camera):
+        """返回带 gt 图像、背景与掩码的相机；预加载的相机原样返回"""
+        if camera.original_image is not None:
+            return camera
+        if self.frame_loader is not None:
+            return self.frame_loader.load(camera)
+        return loadCamOnTheFly(copyCamera(camera))
+
+    def train_sampler(self):
+        return ViewpointSampler(self.getTrainCameras(), self.frame_loader, self.prefetch)
         
 
     def save(self, iteration):
         point_cloud_path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration))
-        self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+        self.gaussians.save_gsb(os.path.join(point_cloud_path, "point_cloud.gsb"), self.half_checkpoint)
+        if self.export_ply:
+            # 供外部查看器使用，也可事后用 python -m scene.gaussian_io convert 导出
+            self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
 
     def getTrainCameras(self, scale=1.0):
         return self.train_cameras[scale]
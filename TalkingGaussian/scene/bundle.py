@@ -0,0 +1,192 @@
+#
+# 推理模型包（.tgb）
+#
+# 把渲染所需的全部数据打包为一个可 mmap 的块文件（格式同 scene/gaussian_io.py 的 write_blocks，
+# 每块带 crc32），渲染节点只需这一个文件，无需 chkpnt_fuse_latest.pth 与 data/<ID> 数据集：
+#   face.* / mouth.*                脸部、嘴部高斯参数
+#   face_net.* / mouth_net.*        运动网络权重
+#   face_static.* / mouth_static.*  预计算的哈希网格编码等静态张量（只依赖训练后固定的高斯位置）
+#   cam.*                           逐帧位姿、FoV、AU 与嘴部范围（来自推理缓存，见 scene/inference_cache.py）
+#   bg.data / bg.offsets            逐帧背景，JPEG/PNG 编码后首尾相接，渲染时按帧解码
+# JSON 头记录 SH 阶数、音频特征类型、帧名等元数据。
+#
+# 导出：python -m scene.bundle -S <dataset> -M <model_path> [--output <model_path>/model.tgb]
+#
+
+import io
+import os
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+
+from scene.gaussian_model import GaussianModel
+from scene.motion_net import MotionNetwork, MouthMotionNetwork
+from scene.gaussian_io import write_blocks, read_blocks, read_header, gaussian_blocks, dequantize
+from scene.inference_cache import read_inference_cache, make_cameras
+
+BUNDLE_MAGIC = b'TGBD'
+BUNDLE_VERSION = 1
+BUNDLE_EXT = '.tgb'
+CAMERA_KEYS = ('R', 'T', 'fovx', 'fovy', 'size', 'img_ids', 'blink', 'au25', 'au_exp',
+               'lips_rect', 'lhalf_rect', 'mouth_bound')
+
+
+def is_bundle(path):
+    return bool(path) and path.endswith(BUNDLE_EXT) and os.path.isfile(path)
+
+
+def bundle_info(path):
+    """只读取 JSON 头（音频特征类型、SH 阶数等）"""
+    return read_header(path, BUNDLE_MAGIC, BUNDLE_VERSION)
+
+
+def _encode_backgrounds(backgrounds, fmt='jpg', quality=95, workers=8):
+    def encode(idx):
+        buf = io.BytesIO()
+        image = Image.fromarray(np.asarray(backgrounds[idx]))
+        if fmt == 'png':
+            image.save(buf, format='PNG')
+        else:
+            image.save(buf, format='JPEG', quality=quality)
+        return buf.getvalue()
+
+    with ThreadPoolExecutor(workers) as pool:
+        encoded = list(pool.map(encode, range(len(backgrounds))))
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class EncodedFrames:
+    """bg.data / bg.offsets -> 按帧解码的 [H, W, 3] uint8 RGB"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return np.array(Image.open(io.BytesIO(self.data[start:end].tobytes())).convert("RGB"))
+
+
+def _tensor_blocks(prefix, tensors):
+    return [(prefix + key, value.detach().cpu().numpy()) for key, value in tensors.items()]
+
+
+def export_bundle(dataset, output, transformsfile="transforms_train.json", bg_format='jpg', bg_quality=95, half=False,
+                  models=None, codebooks=(None, None)):
+    """
+    models: 可选 (gaussians, motion_net, gaussians_mouth, motion_net_mouth)，缺省从检查点加载；
+            运动网络须已 cache_static（如 compact.py 剪枝后的模型）
+    codebooks: 脸部/嘴部高斯的向量量化码本，见 gaussian_io.gaussian_blocks
+    """
+    start = time.time()
+    if models is None:
+        # 延迟导入：synthesize_fuse 本身依赖 scene
+        from synthesize_fuse import load_fuse_models
+        with torch.no_grad():
+            models = load_fuse_models(dataset)
+    gaussians, motion_net, gaussians_mouth, motion_net_mouth = models
+    meta, backgrounds = read_inference_cache(dataset.source_path, transformsfile)
+    bg_data, bg_offsets = _encode_backgrounds(backgrounds, bg_format, bg_quality)
+
+    blocks = gaussian_blocks(gaussians.param_arrays(), 'face.', half, codebooks[0])
+    blocks += gaussian_blocks(gaussians_mouth.param_arrays(), 'mouth.', half, codebooks[1])
+    blocks += _tensor_blocks('face_net.', motion_net.state_dict())
+    blocks += _tensor_blocks('mouth_net.', motion_net_mouth.state_dict())
+    blocks += _tensor_blocks('face_static.', motion_net.static_cache['static'])
+    blocks += _tensor_blocks('mouth_static.', motion_net_mouth.static_cache['static'])
+    blocks += [('cam.' + key, meta[key]) for key in CAMERA_KEYS]
+    blocks += [('bg.data', bg_data), ('bg.offsets', bg_offsets)]
+
+    info = {
+        'format': 'talking-gaussian-bundle',
+        'sh_degree': dataset.sh_degree,
+        'active_sh_degree': [gaussians.active_sh_degree, gaussians_mouth.active_sh_degree],
+        'audio_extractor': dataset.audio_extractor,
+        'white_background': dataset.white_background,
+        'transforms': transformsfile,
+        'image_name': [str(n) for n in meta['image_name']],
+        'bg_format': bg_format,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    write_blocks(output, blocks, info, BUNDLE_MAGIC, BUNDLE_VERSION)
+    print(f"[INFO] bundle: {output} ({os.path.getsize(output) / 2 ** 20:.1f} MB, "
+          f"{len(bg_offsets) - 1} frames, {time.time() - start:.1f}s)")
+    return output
+
+
+class RenderBundle:
+    def __init__(self, path, verify=False):
+        # 渲染路径只 mmap 用到的块，不读整个文件做 crc32；导出后校验一次（见 __main__）
+        self.path = path
+        self.arrays, self.meta = read_blocks(path, BUNDLE_MAGIC, BUNDLE_VERSION, verify=verify)
+
+    def _group(self, prefix):
+        return {key[len(prefix):]: value for key, value in self.arrays.items() if key.startswith(prefix)}
+
+    @property
+    def audio_extractor(self):
+        return self.meta['audio_extractor']
+
+    @property
+    def white_background(self):
+        return self.meta['white_background']
+
+    def _gaussians(self, prefix, active_sh_degree):
+        gaussians = GaussianModel(self.meta['sh_degree'])
+        gaussians._load_arrays(dequantize(self._group(prefix + '.')))
+        gaussians.active_sh_degree = active_sh_degree
+        return gaussians
+
+    def _motion_net(self, cls, prefix, gaussians):
+        net = cls(args=Namespace(audio_extractor=self.audio_extractor)).cuda()
+        net.load_state_dict({k: torch.from_numpy(v) for k, v in self._group(prefix + '_net.').items()})
+        net.eval()
+        # 静态张量直接取自包内，不再重新计算哈希编码
+        static = {k: torch.from_numpy(v).cuda() for k, v in self._group(prefix + '_static.').items()}
+        net.static_cache = {'xyz': gaussians.get_xyz, 'static': static}
+        return net
+
+    def load_models(self):
+        """返回 (gaussians, motion_net, gaussians_mouth, motion_net_mouth)，与 load_fuse_models 相同"""
+        face_sh, mouth_sh = self.meta['active_sh_degree']
+        with torch.no_grad():
+            gaussians = self._gaussians('face', face_sh)
+            gaussians_mouth = self._gaussians('mouth', mouth_sh)
+            motion_net = self._motion_net(MotionNetwork, 'face', gaussians)
+            motion_net_mouth = self._motion_net(MouthMotionNetwork, 'mouth', gaussians_mouth)
+        return gaussians, motion_net, gaussians_mouth, motion_net_mouth
+
+    def cameras(self, auds=None, data_device="cpu"):
+        """按新音频构造相机（镜像循环扩展/截断）；auds 为 None 时返回全部帧作模板"""
+        meta = {key: np.asarray(value) for key, value in self._group('cam.').items()}
+        meta['image_name'] = self.meta['image_name']
+        meta['image_path'] = [os.path.join(self.path, name) for name in self.meta['image_name']]
+        backgrounds = EncodedFrames(self.arrays['bg.data'], self.arrays['bg.offsets'])
+        return make_cameras(meta, backgrounds, auds, False, data_device)
+
+
+if __name__ == "__main__":
+    from arguments import ModelParams, get_combined_args
+
+    parser = ArgumentParser(description="导出推理模型包")
+    model = ModelParams(parser)
+    parser.add_argument("--output", default=None, type=str, help="缺省为 <model_path>/model.tgb")
+    parser.add_argument("--transforms", default="transforms_train.json", type=str)
+    parser.add_argument("--bg_format", default="jpg", choices=["jpg", "png"])
+    parser.add_argument("--bg_quality", default=95, type=int)
+    parser.add_argument("--half", action="store_true", help="高斯参数（xyz 除外）以 float16 保存")
+    args = get_combined_args(parser)
+    dataset = model.extract(args)
+    output = args.output or os.path.join(dataset.model_path, "model" + BUNDLE_EXT)
+    export_bundle(dataset, output, args.transforms, args.bg_format, args.bg_quality, args.half)
+    RenderBundle(output, verify=True)
@@ -23,7 +23,7 @@ from tqdm import tqdm
 import pandas as pd
 
 from utils.sh_utils import SH2RGB
-from utils.audio_utils import get_audio_features
+from utils.audio_utils import get_audio_windows
 from scene.gaussian_model import BasicPointCloud
 
 class CameraInfo(NamedTuple):
@@ -95,7 +95,8 @@ def storePly(path, xyz, rgb):
     ply_data = PlyData([vertex_element])
     ply_data.write(path)
 
-def readCamerasFromTransforms(path, transformsfile, white_background, extension=".jpg", audio_file='', audio_extractor='deepspeech', preload=True):
+def readCamerasFromTransforms(path, transformsfile, white_background, extension=".jpg", audio_file='', audio_extractor='deepspeech', preload=True, load_audio=True, data_device="cpu"):
+    # load_audio=False: poses / AU / landmark rects only, no audio windows (used to build the inference cache)
     cam_infos = []
     postfix_dict = {"deepspeech": "ds", "esperanto": "eo", "hubert": "hu"}
 
@@ -106,13 +107,18 @@ def readCamerasFromTransforms(path, transformsfile, white_background, extension=
 
         frames = contents["frames"]
         
-        if audio_file == '':
-            aud_features = np.load(os.path.join(path, 'aud_{}.npy'.format(postfix_dict[audio_extractor])))
+        if not load_audio:
+            auds = None
         else:
-            aud_features = np.load(audio_file)
-        aud_features = torch.from_numpy(aud_features)
-        aud_features = aud_features.float().permute(0, 2, 1)
-        auds = aud_features
+            if audio_file == '':
+                aud_features = np.load(os.path.join(path, 'aud_{}.npy'.format(postfix_dict[audio_extractor])))
+            else:
+                aud_features = np.load(audio_file)
+            aud_features = torch.from_numpy(aud_features)
+            aud_features = aud_features.float().permute(0, 2, 1)
+            auds = aud_features
+            # 全部帧的音频窗口一次生成并放在 data_device，相机按帧取视图
+            aud_windows = get_audio_windows(auds, device=data_device)
 
         au_info=pd.read_csv(os.path.join(path, 'au.csv'))
         au_blink = au_info[' AU45_r'].values
@@ -134,7 +140,7 @@ def readCamerasFromTransforms(path, transformsfile, white_background, extension=
         original_num_frames = len(frames)
         
         # 当使用新音频文件时，根据音频特征帧数扩展 frames（镜像循环，避免僵尸定格）
-        if audio_file != '' and auds.shape[0] > len(frames):
+        if auds is not None and audio_file != '' and auds.shape[0] > len(frames):
             print(f"[INFO] 扩展 frames: 音频({auds.shape[0]}) > 视频({len(frames)})，使用镜像循环策略")
             # 镜像循环索引：0,1,...,N-1,N-2,...,1
             cycle_ids = list(range(original_num_frames)) + list(range(original_num_frames - 2, 0, -1))
@@ -152,14 +158,24 @@ def readCamerasFromTransforms(path, transformsfile, white_background, extension=
         ldmks_mouth = []
         ldmks_lhalf = []
         
+        # 优先读取预处理生成的 lms.npy（[N, 68, 2] float32，无人脸的帧为 NaN），避免逐帧 loadtxt
+        lms_file = os.path.join(path, 'lms.npy')
+        lms_all = np.load(lms_file, mmap_mode='r') if os.path.exists(lms_file) else None
+
+        def has_lms(img_id):
+            if lms_all is not None:
+                return img_id < lms_all.shape[0] and not np.isnan(lms_all[img_id, 0, 0])
+            return os.path.exists(os.path.join(path, 'ori_imgs', str(img_id) + '.lms'))
+
         for idx, frame in tqdm(enumerate(frames)):
             img_id = frame['img_id']
-            lms_path = os.path.join(path, 'ori_imgs', str(img_id) + '.lms')
-            if not os.path.exists(lms_path):
+            if not has_lms(img_id):
                 # 兜底：使用最后一帧的标注，避免缺失
                 img_id = frames[-1]['img_id']
-                lms_path = os.path.join(path, 'ori_imgs', str(img_id) + '.lms')
-            lms = np.loadtxt(lms_path) # [68, 2]
+            if lms_all is not None:
+                lms = lms_all[img_id] # [68, 2]
+            else:
+                lms = np.loadtxt(os.path.join(path, 'ori_imgs', str(img_id) + '.lms')) # [68, 2]
             lips = slice(48, 60)
             mouth = slice(60, 68)
             xmin, xmax = int(lms[lips, 1].min()), int(lms[lips, 1].max())
@@ -230,15 +246,17 @@ def readCamerasFromTransforms(path, transformsfile, white_background, extension=
 
 
             
-            if audio_file == '':
-                talking_dict['auds'] = get_audio_features(auds, 2, frame['img_id'])
+            if auds is None:
+                pass
+            elif audio_file == '':
                 if frame['img_id'] > auds.shape[0]:
                     print("[warnining] audio feature is too short")
                     break
+                talking_dict['auds'] = aud_windows[frame['img_id']]
             else:
-                talking_dict['auds'] = get_audio_features(auds, 2, idx)
                 if idx >= auds.shape[0]:
                     break
+                talking_dict['auds'] = aud_windows[idx]
 
             # 直接按循环后的 frame['img_id'] 取 AU，保证表情/眨眼也循环
             blink_val = np.clip(au_blink[frame['img_id']], 0, 2) / 2
@@ -286,11 +304,15 @@ def readCamerasFromTransforms(path, transformsfile, white_background, extension=
 def readNerfSyntheticInfo(path, white_background, eval, extension=".jpg", args=None):
     audio_file = args.audio
     audio_extractor = args.audio_extractor
+    preload = getattr(args, 'preload', True)
+    data_device = args.data_device
     if not eval:
         print("Reading Training Transforms")
-        train_cam_infos = readCamerasFromTransforms(path, "transforms_train.json", white_background, extension, audio_file, audio_extractor)
+        train_cam_infos = readCamerasFromTransforms(path, "transforms_train.json", white_background, extension, audio_file, audio_extractor, preload,
+                                                    data_device=data_device)
     print("Reading Test Transforms")
-    test_cam_infos = readCamerasFromTransforms(path, "transforms_val.json", white_background, extension, audio_file, audio_extractor)
+    test_cam_infos = readCamerasFromTransforms(path, "transforms_val.json", white_background, extension, audio_file, audio_extractor, preload,
+                                               data_device=data_device)
     
     # if not eval:
     #     train_cam_infos.extend(test_cam_infos)
@@ -0,0 +1,130 @@
+#
+# 训练帧的按需加载
+#
+# preload 会把每帧的 gt 图像、背景与掩码全部读入内存并放到 data_device，
+# 内存占用随视频长度线性增长（约 64GB / 5k 帧）。FrameLoader 只保存相机位姿与 AU 等元数据，
+# 帧数据在使用时从磁盘读取，并分别在内存（host_cache 帧）与设备（device_cache 帧）中做 LRU 缓存；
+# ViewpointSampler 预先生成随机顺序，后台线程提前读取接下来的 prefetch 个视角。
+# 峰值内存约为 (host_cache + device_cache + prefetch) 帧，与视频长度无关。
+#
+
+import os
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+import torch
+from PIL import Image
+
+from utils.general_utils import PILtoTorch
+from utils.camera_utils import loadFrameOnTheFly, applyFrame, copyCamera
+
+
+class FrameLoader:
+    def __init__(self, source_path, device="cuda", host_cache=256, device_cache=32, workers=4):
+        self.device = torch.device(device)
+        self.on_host = self.device.type == 'cpu'
+        # 预取的帧先放入内存缓存，容量过小时会在使用前被淘汰
+        self.host_cache = max(host_cache, 1)
+        self.device_cache = 0 if self.on_host else max(device_cache, 0)
+        self.pin = not self.on_host and torch.cuda.is_available()
+        self.bg_img = PILtoTorch(np.array(Image.open(os.path.join(source_path, 'bc.jpg')).convert("RGB")))
+
+        self.host = OrderedDict()
+        self.dev = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max(workers, 1))
+
+    def _read(self, image_path):
+        frame = loadFrameOnTheFly(image_path, self.bg_img)
+        if self.pin:
+            frame = {key: value.pin_memory() for key, value in frame.items()}
+        return frame
+
+    def _put_host(self, image_path, frame):
+        with self.lock:
+            self.host[image_path] = frame
+            self.host.move_to_end(image_path)
+            while len(self.host) > self.host_cache:
+                self.host.popitem(last=False)
+
+    def _load_host(self, image_path):
+        with self.lock:
+            frame = self.host.get(image_path)
+            if frame is not None:
+                self.host.move_to_end(image_path)
+                return frame
+            future = self.pending.get(image_path)
+        if future is not None:
+            return future.result()
+        frame = self._read(image_path)
+        self._put_host(image_path, frame)
+        return frame
+
+    def _prefetch_one(self, image_path):
+        try:
+            frame = self._read(image_path)
+            self._put_host(image_path, frame)
+            return frame
+        finally:
+            with self.lock:
+                self.pending.pop(image_path, None)
+
+    def prefetch(self, cameras):
+        """后台读取即将使用的视角"""
+        with self.lock:
+            for cam in cameras:
+                path = cam.image_path
+                if path in self.host or path in self.pending or path in self.dev:
+                    continue
+                self.pending[path] = self.pool.submit(self._prefetch_one, path)
+
+    def load(self, camera):
+        """返回填好 gt 图像、背景与掩码的相机副本（原相机不保存帧数据）"""
+        path = camera.image_path
+        frame = self.dev.get(path)
+        if frame is not None:
+            self.dev.move_to_end(path)
+        else:
+            frame = self._load_host(path)
+            if not self.on_host:
+                frame = {key: value.to(self.device, non_blocking=self.pin) for key, value in frame.items()}
+                if self.device_cache > 0:
+                    self.dev[path] = frame
+                    while len(self.dev) > self.device_cache:
+                        self.dev.popitem(last=False)
+
+        return applyFrame(copyCamera(camera), frame)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ViewpointSampler:
+    """
+    随机不放回地遍历训练视角，每轮重新打乱（与 viewpoint_stack.pop(randint(...)) 的分布一致）；
+    后续视角提前确定，交给 FrameLoader 预取
+    """
+
+    def __init__(self, cameras, loader=None, prefetch=8):
+        self.cameras = cameras
+        self.loader = loader
+        self.prefetch = prefetch
+        self.queue = deque()
+
+    def _refill(self):
+        order = list(self.cameras)
+        random.shuffle(order)
+        self.queue.extend(order)
+
+    def pop(self):
+        while len(self.queue) <= self.prefetch and self.cameras:
+            self._refill()
+        camera = self.queue.popleft()
+        if self.loader is not None and self.prefetch > 0:
+            self.loader.prefetch(list(islice(self.queue, self.prefetch)))
+        return camera
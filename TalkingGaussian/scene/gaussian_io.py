@@ -0,0 +1,300 @@
+#
+# 高斯点云的二进制格式（.gsb）
+#
+# 布局：
+#   magic b'TGGS' | uint32 版本 | uint32 头长度 | JSON 头 | 各数据块（64 字节对齐）
+# JSON 头记录点数、SH 阶数以及每个块的 name / dtype / shape / offset / crc32。
+# 同一块文件格式（write_blocks / read_blocks）也用于推理模型包（scene/bundle.py）。
+# 数据块按 GaussianModel 参数的内存布局保存（features 为 [N, C, 3]），
+# 读取时直接 np.memmap，整块交给 torch，无需逐列拷贝；写入为每块一次 tofile。
+# xyz 始终为 float32，其余块可选 float16（half=True）以减小体积。
+#
+# PLY 桥接（供外部查看器使用）同样按整块转换，不再逐点构造 tuple。
+#
+# 用法：
+#   python -m scene.gaussian_io convert point_cloud.ply point_cloud.gsb [--half]
+#   python -m scene.gaussian_io convert point_cloud.gsb point_cloud.ply
+#   python -m scene.gaussian_io benchmark --points 10000 100000 1000000
+#
+
+import os
+import json
+import time
+import zlib
+import struct
+from argparse import ArgumentParser
+
+import numpy as np
+from numpy.lib import recfunctions
+from plyfile import PlyData, PlyElement
+
+MAGIC = b'TGGS'
+VERSION = 1
+ALIGN = 64
+BLOCKS = ('xyz', 'features_dc', 'features_rest', 'opacity', 'scaling', 'rotation')
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _crc32(arr):
+    return zlib.crc32(np.ascontiguousarray(arr).reshape(-1).view(np.uint8)) & 0xffffffff
+
+
+def write_blocks(path, blocks, meta, magic=MAGIC, version=VERSION):
+    """
+    通用的块文件：blocks 为 [(name, 数组)]，meta 为写入 JSON 头的其他字段
+    每个块记录 dtype / shape / offset 与 crc32
+    """
+    # np.ascontiguousarray 会把 0 维数组变成 1 维，这里保留原形状
+    blocks = [(name, np.array(arr, order='C', copy=not np.asarray(arr).flags.c_contiguous)) for name, arr in blocks]
+    checksums = [_crc32(arr) for _, arr in blocks]
+
+    # 头长度依赖偏移量的位数，先按占位偏移估计长度，再整体对齐
+    def header(data_start):
+        offset, entries = data_start, []
+        for (name, arr), crc in zip(blocks, checksums):
+            offset = _aligned(offset)
+            entries.append({'name': name, 'dtype': arr.dtype.str, 'shape': list(arr.shape),
+                            'offset': offset, 'crc32': crc})
+            offset += arr.nbytes
+        return json.dumps(dict(meta, version=version, blocks=entries)).encode()
+
+    prefix = len(magic) + 8
+    data_start = _aligned(prefix + len(header(10 ** 12)))
+    head = header(data_start).ljust(data_start - prefix)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(magic + struct.pack('<II', version, len(head)) + head)
+        for entry, (_, arr) in zip(json.loads(head)['blocks'], blocks):
+            f.seek(entry['offset'])
+            arr.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_header(path, magic=MAGIC, version=VERSION):
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path}: unexpected file type (expected {magic.decode()})")
+        file_version, length = struct.unpack('<II', f.read(8))
+        if file_version > version:
+            raise ValueError(f"{path}: unsupported version {file_version}")
+        return json.loads(f.read(length))
+
+
+def read_blocks(path, magic=MAGIC, version=VERSION, mmap=True, verify=False):
+    """返回 (arrays, header)；mmap=True 时数组直接映射文件，verify=True 时校验 crc32"""
+    meta = read_header(path, magic, version)
+    arrays = {}
+    for entry in meta['blocks']:
+        shape, dtype = tuple(entry['shape']), np.dtype(entry['dtype'])
+        if int(np.prod(shape)) == 0:
+            arr = np.empty(shape, dtype=dtype)
+        elif mmap:
+            # copy-on-write 映射：不拷贝、可直接 torch.from_numpy，写入不会改动文件
+            arr = np.memmap(path, dtype=dtype, mode='c', offset=entry['offset'], shape=(int(np.prod(shape)),)).reshape(shape)
+        else:
+            with open(path, 'rb') as f:
+                f.seek(entry['offset'])
+                arr = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+        if verify and 'crc32' in entry and _crc32(arr) != entry['crc32']:
+            raise ValueError(f"{path}: checksum mismatch in block '{entry['name']}'")
+        arrays[entry['name']] = arr
+    return arrays, meta
+
+
+def gaussian_blocks(arrays, prefix='', half=False, codebooks=None):
+    """
+    GaussianModel 参数 -> [(name, 数组)]；xyz 始终为 float32
+    codebooks: {name: (codebook [K, ...], index [N])}，向量量化的属性保存为
+    <name>.codebook 与 <name>.index 两块，读取时由 dequantize 还原
+    """
+    codebooks = codebooks or {}
+    dtype = lambda name: np.float16 if half and name != 'xyz' else np.float32
+    blocks = []
+    for name in BLOCKS:
+        if name in codebooks:
+            codebook, index = codebooks[name]
+            index_dtype = np.uint16 if len(codebook) <= 2 ** 16 else np.int32
+            blocks.append((prefix + name + '.codebook', np.asarray(codebook, dtype=dtype(name))))
+            blocks.append((prefix + name + '.index', np.asarray(index, dtype=index_dtype)))
+        else:
+            blocks.append((prefix + name, np.asarray(arrays[name], dtype=dtype(name))))
+    return blocks
+
+
+def dequantize(arrays):
+    for name in BLOCKS:
+        if name not in arrays and name + '.codebook' in arrays:
+            arrays[name] = np.asarray(arrays.pop(name + '.codebook'))[np.asarray(arrays.pop(name + '.index')).astype(np.int64)]
+    return arrays
+
+
+def write_gaussians(path, arrays, sh_degree, half=False, codebooks=None):
+    """arrays: BLOCKS -> numpy 数组（features_* 为 [N, C, 3]）"""
+    write_blocks(path, gaussian_blocks(arrays, half=half, codebooks=codebooks),
+                 {'num_points': arrays['xyz'].shape[0], 'sh_degree': sh_degree})
+
+
+def read_gaussians(path, mmap=True, verify=False):
+    """返回 (arrays, header)，向量量化的属性已还原"""
+    arrays, meta = read_blocks(path, mmap=mmap, verify=verify)
+    return dequantize(arrays), meta
+
+
+def ply_attributes(num_rest, num_scale=3, num_rot=4):
+    """与 GaussianModel.construct_list_of_attributes 相同的属性顺序"""
+    names = ['x', 'y', 'z', 'nx', 'ny', 'nz'] + ['f_dc_{}'.format(i) for i in range(3)]
+    names += ['f_rest_{}'.format(i) for i in range(num_rest)]
+    names += ['opacity'] + ['scale_{}'.format(i) for i in range(num_scale)] + ['rot_{}'.format(i) for i in range(num_rot)]
+    return names
+
+
+def write_ply(path, arrays):
+    """导出为 3DGS 查看器使用的 PLY（f_dc / f_rest 按通道优先展开）"""
+    xyz = np.asarray(arrays['xyz'], dtype=np.float32)
+    num = xyz.shape[0]
+    f_dc = np.asarray(arrays['features_dc'], dtype=np.float32).transpose(0, 2, 1).reshape(num, -1)
+    f_rest = np.asarray(arrays['features_rest'], dtype=np.float32).transpose(0, 2, 1).reshape(num, -1)
+    scale = np.asarray(arrays['scaling'], dtype=np.float32)
+    rotation = np.asarray(arrays['rotation'], dtype=np.float32)
+    attributes = np.concatenate((xyz, np.zeros_like(xyz), f_dc, f_rest,
+                                 np.asarray(arrays['opacity'], dtype=np.float32), scale, rotation), axis=1)
+
+    dtype_full = [(attribute, 'f4') for attribute in ply_attributes(f_rest.shape[1], scale.shape[1], rotation.shape[1])]
+    elements = recfunctions.unstructured_to_structured(attributes, np.dtype(dtype_full))
+    PlyData([PlyElement.describe(elements, 'vertex')]).write(path)
+
+
+def _sorted_names(vertex, prefix):
+    names = [p.name for p in vertex.properties if p.name.startswith(prefix)]
+    return sorted(names, key=lambda x: int(x.split('_')[-1]))
+
+
+def read_ply(path):
+    """读取 3DGS PLY，返回与 read_gaussians 相同布局的 float32 数组"""
+    vertex = PlyData.read(path).elements[0]
+    data = vertex.data
+
+    def columns(names):
+        return recfunctions.structured_to_unstructured(data[names], dtype=np.float32)
+
+    num = len(data)
+    f_rest = columns(_sorted_names(vertex, 'f_rest_'))
+    return {
+        'xyz': columns(['x', 'y', 'z']),
+        'features_dc': columns(['f_dc_0', 'f_dc_1', 'f_dc_2']).reshape(num, 3, 1).transpose(0, 2, 1),
+        'features_rest': f_rest.reshape(num, 3, -1).transpose(0, 2, 1),
+        'opacity': columns(['opacity']),
+        'scaling': columns(_sorted_names(vertex, 'scale_')),
+        'rotation': columns(_sorted_names(vertex, 'rot')),
+    }
+
+
+def convert(src, dst, half=False):
+    if src.endswith('.ply'):
+        arrays = read_ply(src)
+        sh_degree = int(round(np.sqrt(arrays['features_rest'].shape[1] + 1))) - 1
+    else:
+        arrays, meta = read_gaussians(src)
+        sh_degree = meta['sh_degree']
+    if dst.endswith('.ply'):
+        write_ply(dst, arrays)
+    else:
+        write_gaussians(dst, arrays, sh_degree, half)
+
+
+def _write_ply_per_point(path, arrays):
+    # 原 save_ply 的写法（逐点 tuple），仅用于 benchmark 对比
+    num = arrays['xyz'].shape[0]
+    attributes = np.concatenate((arrays['xyz'], np.zeros_like(arrays['xyz']),
+                                 arrays['features_dc'].transpose(0, 2, 1).reshape(num, -1),
+                                 arrays['features_rest'].transpose(0, 2, 1).reshape(num, -1),
+                                 arrays['opacity'], arrays['scaling'], arrays['rotation']), axis=1)
+    dtype_full = [(attribute, 'f4') for attribute in ply_attributes(arrays['features_rest'].shape[1] * 3)]
+    elements = np.empty(num, dtype=dtype_full)
+    elements[:] = list(map(tuple, attributes))
+    PlyData([PlyElement.describe(elements, 'vertex')]).write(path)
+
+
+def _read_ply_per_column(path):
+    # 原 load_ply 的读法（逐列读入 float64），仅用于 benchmark 对比
+    vertex = PlyData.read(path).elements[0]
+    num = len(vertex.data)
+    xyz = np.stack([np.asarray(vertex[name]) for name in ('x', 'y', 'z')], axis=1)
+    features_dc = np.zeros((num, 3, 1))
+    for idx in range(3):
+        features_dc[:, idx, 0] = np.asarray(vertex['f_dc_{}'.format(idx)])
+    out = {'xyz': xyz, 'features_dc': features_dc, 'opacity': np.asarray(vertex['opacity'])[..., np.newaxis]}
+    for key, prefix in (('features_rest', 'f_rest_'), ('scaling', 'scale_'), ('rotation', 'rot')):
+        names = _sorted_names(vertex, prefix)
+        arr = np.zeros((num, len(names)))
+        for idx, name in enumerate(names):
+            arr[:, idx] = np.asarray(vertex[name])
+        out[key] = arr
+    return {key: np.array(value, dtype=np.float32) for key, value in out.items()}
+
+
+def benchmark(points, out_dir, sh_degree=2, repeat=3):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    num_rest = (sh_degree + 1) ** 2 - 1
+
+    def timed(func):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    print(f"{'points':>10} {'format':>14} {'save(s)':>9} {'load(s)':>9} {'size(MB)':>9}")
+    for num in points:
+        arrays = {
+            'xyz': rng.standard_normal((num, 3), dtype=np.float32),
+            'features_dc': rng.standard_normal((num, 1, 3), dtype=np.float32),
+            'features_rest': rng.standard_normal((num, num_rest, 3), dtype=np.float32),
+            'opacity': rng.standard_normal((num, 1), dtype=np.float32),
+            'scaling': rng.standard_normal((num, 3), dtype=np.float32),
+            'rotation': rng.standard_normal((num, 4), dtype=np.float32),
+        }
+        ply, gsb, gsb16 = (os.path.join(out_dir, f'bench_{num}.{ext}') for ext in ('ply', 'gsb', 'fp16.gsb'))
+
+        def materialize(loaded):
+            # 加载后整块拷贝为 float32（对应送入 torch / cuda 的那次拷贝）
+            for arr in loaded.values():
+                np.array(arr, dtype=np.float32)
+
+        rows = [
+            ('ply (tuple)', lambda: _write_ply_per_point(ply, arrays), lambda: _read_ply_per_column(ply), ply),
+            ('ply (bulk)', lambda: write_ply(ply, arrays), lambda: materialize(read_ply(ply)), ply),
+            ('gsb fp32', lambda: write_gaussians(gsb, arrays, sh_degree), lambda: materialize(read_gaussians(gsb)[0]), gsb),
+            ('gsb fp16', lambda: write_gaussians(gsb16, arrays, sh_degree, half=True), lambda: materialize(read_gaussians(gsb16)[0]), gsb16),
+        ]
+        for name, save, load, path in rows:
+            t_save = timed(save)
+            t_load = timed(load)
+            print(f"{num:>10} {name:>14} {t_save:>9.3f} {t_load:>9.3f} {os.path.getsize(path) / 2 ** 20:>9.1f}")
+        for path in (ply, gsb, gsb16):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="高斯点云二进制格式转换与基准测试")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('convert', help='ply <-> gsb')
+    p.add_argument('src')
+    p.add_argument('dst')
+    p.add_argument('--half', action='store_true', help='除 xyz 外以 float16 保存')
+    p = sub.add_parser('benchmark', help='对比 PLY 与 gsb 的保存/读取耗时')
+    p.add_argument('--points', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    p.add_argument('--sh_degree', type=int, default=2)
+    p.add_argument('--out_dir', default='/tmp/gaussian_io_bench')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert(args.src, args.dst, args.half)
+    else:
+        benchmark(args.points, args.out_dir, args.sh_degree)
@@ -0,0 +1,231 @@
+#
+# 推理用相机缓存
+#
+# Scene() 构造时会逐帧读取 gt 图像、torso_imgs、parsing、teeth_mask 与 landmarks，
+# 而推理（synthesize_fuse --fast / render_server）只需要每帧的位姿、AU、嘴部范围与背景。
+# 训练完成后把这些数据预计算一次，保存在 <dataset>/inference_cache/<transforms>/：
+#   meta.npz         位姿、FoV、图像尺寸、AU 与嘴部/下半脸范围（按 transforms 中的帧顺序）
+#   backgrounds.npy  合成好的背景 uint8 [N, H, W, 3]（torso_imgs 叠加 bc.jpg），推理时 mmap 按需读取
+#   manifest.json    最后写入，记录源文件的 mtime，源数据变化后缓存自动重建
+#
+# 用法：python -m scene.inference_cache -S <dataset>
+#
+
+import os
+import json
+import time
+import shutil
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+
+from scene.cameras import Camera
+from scene.dataset_readers import readCamerasFromTransforms
+from utils.audio_utils import get_audio_windows
+
+CACHE_DIR = 'inference_cache'
+CACHE_VERSION = 1
+POSTFIX_DICT = {"deepspeech": "ds", "esperanto": "eo", "hubert": "hu"}
+
+
+def cache_dir(source_path, transformsfile):
+    return os.path.join(source_path, CACHE_DIR, os.path.splitext(transformsfile)[0])
+
+
+def _source_signature(source_path, transformsfile):
+    """缓存依赖的源文件 -> mtime；torso_imgs 取目录 mtime（增删文件时变化）"""
+    sources = [transformsfile, 'bc.jpg', 'au.csv', 'lms.npy', 'torso_imgs']
+    signature = {}
+    for name in sources:
+        path = os.path.join(source_path, name)
+        signature[name] = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    return signature
+
+
+def is_fresh(source_path, transformsfile):
+    manifest = os.path.join(cache_dir(source_path, transformsfile), 'manifest.json')
+    if not os.path.exists(manifest):
+        return False
+    with open(manifest) as f:
+        meta = json.load(f)
+    return meta.get('version') == CACHE_VERSION and meta.get('sources') == _source_signature(source_path, transformsfile)
+
+
+def _composite_background(torso_path, bg_img):
+    # 与 readCamerasFromTransforms 中 preload 的背景计算一致
+    torso_img = np.array(Image.open(torso_path).convert("RGBA")) * 1.0
+    bg = torso_img[..., :3] * torso_img[..., 3:] / 255.0 + bg_img * (1 - torso_img[..., 3:] / 255.0)
+    return bg.astype(np.uint8)
+
+
+def build_inference_cache(source_path, transformsfile="transforms_train.json", workers=8):
+    start = time.time()
+    signature = _source_signature(source_path, transformsfile)
+    cam_infos = readCamerasFromTransforms(source_path, transformsfile, False, preload=False, load_audio=False)
+    num = len(cam_infos)
+    width, height = cam_infos[0].width, cam_infos[0].height
+
+    out_dir = cache_dir(source_path, transformsfile)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    talking = [c.talking_dict for c in cam_infos]
+    np.savez(os.path.join(tmp_dir, 'meta.npz'),
+             R=np.stack([c.R for c in cam_infos]),
+             T=np.stack([c.T for c in cam_infos]),
+             fovx=np.array([c.FovX for c in cam_infos]),
+             fovy=np.array([c.FovY for c in cam_infos]),
+             size=np.array([width, height]),
+             image_path=np.array([c.image_path for c in cam_infos]),
+             image_name=np.array([c.image_name for c in cam_infos]),
+             blink=np.array([t['blink'].item() for t in talking]),
+             au25=np.array([t['au25'] for t in talking], dtype=np.float64),
+             au_exp=np.stack([t['au_exp'].numpy() for t in talking]),
+             lips_rect=np.array([t['lips_rect'] for t in talking], dtype=np.int64),
+             lhalf_rect=np.stack([np.asarray(t['lhalf_rect'], dtype=np.int64) for t in talking]),
+             mouth_bound=np.array([t['mouth_bound'] for t in talking], dtype=np.int64))
+
+    bg_img = np.array(Image.open(os.path.join(source_path, 'bc.jpg')).convert("RGB"))
+    backgrounds = np.lib.format.open_memmap(os.path.join(tmp_dir, 'backgrounds.npy'), mode='w+',
+                                            dtype=np.uint8, shape=(num, height, width, 3))
+
+    def fill(idx):
+        img_id = os.path.splitext(os.path.basename(cam_infos[idx].image_path))[0]
+        backgrounds[idx] = _composite_background(os.path.join(source_path, 'torso_imgs', img_id + '.png'), bg_img)
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(fill, range(num)))
+    backgrounds.flush()
+    del backgrounds
+
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'num_frames': num, 'sources': signature}, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"[INFO] inference cache: {num} frames -> {out_dir} ({time.time() - start:.1f}s)")
+    return out_dir
+
+
+def ensure_inference_cache(source_path, transformsfile="transforms_train.json"):
+    if not is_fresh(source_path, transformsfile):
+        build_inference_cache(source_path, transformsfile)
+    return cache_dir(source_path, transformsfile)
+
+
+class CachedCamera(Camera):
+    """背景在首次访问时从 backgrounds.npy 读取，不随相机常驻显存"""
+
+    def __init__(self, backgrounds, bg_index, width, height, **kwargs):
+        super(CachedCamera, self).__init__(image=None, gt_alpha_mask=None, background=None, **kwargs)
+        self._backgrounds = backgrounds
+        self._bg_index = bg_index
+        self.image_width = width
+        self.image_height = height
+
+    @property
+    def background(self):
+        if self._background is not None:
+            return self._background
+        bg = torch.from_numpy(np.ascontiguousarray(self._backgrounds[self._bg_index]))
+        return bg.permute(2, 0, 1).to(self.data_device)
+
+    @background.setter
+    def background(self, value):
+        self._background = value
+
+
+def read_inference_cache(source_path, transformsfile="transforms_train.json"):
+    """返回 (meta, backgrounds)，缓存缺失或过期时先构建"""
+    root = ensure_inference_cache(source_path, transformsfile)
+    meta = dict(np.load(os.path.join(root, 'meta.npz')))
+    meta['img_ids'] = np.array([int(os.path.splitext(os.path.basename(p))[0]) for p in meta['image_path']])
+    backgrounds = np.load(os.path.join(root, 'backgrounds.npy'), mmap_mode='r')
+    return meta, backgrounds
+
+
+def make_cameras(meta, backgrounds, auds=None, train_audio=False, data_device="cuda"):
+    """
+    按缓存/模型包中的逐帧数据构造推理相机，帧数与音频窗口与 readCamerasFromTransforms 相同：
+    train_audio（训练音频）时按 img_id 取音频窗口并按音频长度截断，
+    否则按新音频帧数镜像循环扩展/截断；auds 为 None 时返回全部帧（调用方自行替换 auds，如 render_server）
+    backgrounds: 按帧索引返回 [H, W, 3] uint8 RGB 背景
+    """
+    num_frames = meta['R'].shape[0]
+    width, height = meta['size'].tolist()
+    au25 = meta['au25']
+    img_ids = meta['img_ids'].tolist()
+
+    if auds is None:
+        order = list(range(num_frames))
+    elif train_audio:
+        # 训练音频：img_id 超出音频长度的帧之后全部丢弃
+        order = []
+        for idx in range(num_frames):
+            if img_ids[idx] > auds.shape[0]:
+                print("[warnining] audio feature is too short")
+                break
+            order.append(idx)
+    else:
+        # 新音频：镜像循环 0,1,...,N-1,N-2,...,1
+        cycle_ids = list(range(num_frames)) + list(range(num_frames - 2, 0, -1))
+        order = [cycle_ids[idx % len(cycle_ids)] for idx in range(auds.shape[0])]
+
+    aud_windows = get_audio_windows(auds, device=data_device) if auds is not None else None
+    cameras = []
+    for idx, src in enumerate(order):
+        talking_dict = {
+            'img_id': idx,
+            'blink': torch.as_tensor(meta['blink'][src]),
+            'au25': au25[src].tolist(),
+            'au_exp': torch.as_tensor(meta['au_exp'][src]),
+            'lips_rect': meta['lips_rect'][src].tolist(),
+            'lhalf_rect': meta['lhalf_rect'][src],
+            'mouth_bound': meta['mouth_bound'][src].tolist(),
+        }
+        if auds is not None:
+            talking_dict['auds'] = aud_windows[img_ids[src] if train_audio else idx]
+        cameras.append(CachedCamera(backgrounds, src, width, height,
+                                    colmap_id=idx, R=meta['R'][src], T=meta['T'][src],
+                                    FoVx=float(meta['fovx'][src]), FoVy=float(meta['fovy'][src]),
+                                    talking_dict=talking_dict, image_name=str(meta['image_name'][src]),
+                                    image_path=str(meta['image_path'][src]), uid=idx, data_device=data_device))
+    return cameras
+
+
+def load_inference_cameras(source_path, transformsfile="transforms_train.json", audio_file='',
+                           audio_extractor='deepspeech', data_device="cuda", load_audio=True):
+    """
+    从缓存构造推理相机：使用新音频（audio_file）时按音频帧数镜像循环扩展/截断，否则按训练音频截断。
+    load_audio=False 时不读取音频，返回 transforms 中全部帧
+    """
+    meta, backgrounds = read_inference_cache(source_path, transformsfile)
+
+    auds = None
+    if load_audio:
+        if audio_file == '':
+            aud_features = np.load(os.path.join(source_path, 'aud_{}.npy'.format(POSTFIX_DICT[audio_extractor])))
+        else:
+            aud_features = np.load(audio_file)
+        auds = torch.from_numpy(aud_features).float().permute(0, 2, 1)
+    return make_cameras(meta, backgrounds, auds, audio_file == '', data_device)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="构建推理用相机缓存")
+    parser.add_argument("-S", "--source_path", required=True, type=str)
+    parser.add_argument("--transforms", nargs='+', default=["transforms_train.json", "transforms_val.json"])
+    parser.add_argument("--force", action="store_true", help="忽略 manifest，强制重建")
+    args = parser.parse_args()
+
+    for transformsfile in args.transforms:
+        if not os.path.exists(os.path.join(args.source_path, transformsfile)):
+            print(f"[INFO] skip {transformsfile}: not found")
+            continue
+        if args.force or not is_fresh(args.source_path, transformsfile):
+            build_inference_cache(args.source_path, transformsfile)
+        else:
+            print(f"[INFO] inference cache for {transformsfile} is up to date")
@@ -1,3 +1,4 @@
+import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -28,11 +29,12 @@ class AudioAttNet(nn.Module):
         )
 
     def forward(self, x):
-        # x: [1, seq_len, dim_aud]
-        y = x.permute(0, 2, 1)  # [1, dim_aud, seq_len]
+        # x: [B, seq_len, dim_aud], B = 1 except for batched inference
+        B = x.shape[0]
+        y = x.permute(0, 2, 1)  # [B, dim_aud, seq_len]
         y = self.attentionConvNet(y) 
-        y = self.attentionNet(y.view(1, self.seq_len)).view(1, self.seq_len, 1)
-        return torch.sum(y * x, dim=1) # [1, dim_aud]
+        y = self.attentionNet(y.view(B, self.seq_len)).view(B, self.seq_len, 1)
+        return torch.sum(y * x, dim=1) # [B, dim_aud]
 
 
 # Audio feature extractor
@@ -145,6 +147,8 @@ class MotionNetwork(nn.Module):
         
         self.aud_ch_att_net = MLP(self.in_dim, self.audio_dim, 32, 2)
 
+        self.static_cache = None
+
 
     @staticmethod
     @torch.jit.script
@@ -177,16 +181,58 @@ class MotionNetwork(nn.Module):
         return enc_a
 
 
+    @torch.no_grad()
+    def compute_static(self, x):
+        # per-gaussian tensors that only depend on the canonical positions
+        enc_x = self.encode_x(x, bound=self.bound)
+        w_x = self.sigma_net.net[0].weight[:, :self.in_dim]
+        return {
+            'enc_x': enc_x,
+            'aud_ch_att': self.aud_ch_att_net(enc_x),
+            'eye_att': torch.relu(self.eye_att_net(enc_x)),
+            'h_x': enc_x @ w_x.T,
+        }
+
+
+    def cache_static(self, x, path=None):
+        # inference only: precompute the static tensors for the (fixed) trained gaussians x,
+        # optionally persisted to / loaded from path
+        static = None
+        if path is not None and os.path.exists(path):
+            saved = torch.load(path, map_location=x.device)
+            if saved['xyz'].shape == x.shape and torch.equal(saved['xyz'], x.detach()):
+                static = saved['static']
+        if static is None:
+            static = self.compute_static(x)
+            if path is not None:
+                torch.save({'xyz': x.detach(), 'static': static}, path)
+        self.static_cache = {'xyz': x, 'static': static}
+
+
+    def clear_static_cache(self):
+        self.static_cache = None
+
+
+    def get_static(self, x):
+        if self.static_cache is not None and not self.training and self.static_cache['xyz'] is x:
+            return self.static_cache['static']
+        return None
+
+
     def forward(self, x, a, e=None, c=None):
         # x: [N, 3], in [-bound, bound]
-        enc_x = self.encode_x(x, bound=self.bound)
+        static = self.get_static(x)
+        if static is not None:
+            enc_x, aud_ch_att, eye_att = static['enc_x'], static['aud_ch_att'], static['eye_att']
+        else:
+            enc_x = self.encode_x(x, bound=self.bound)
+            aud_ch_att = self.aud_ch_att_net(enc_x)
+            eye_att = torch.relu(self.eye_att_net(enc_x))
 
         enc_a = self.encode_audio(a)
         enc_a = enc_a.repeat(enc_x.shape[0], 1)
-        aud_ch_att = self.aud_ch_att_net(enc_x)
         enc_w = enc_a * aud_ch_att
         
-        eye_att = torch.relu(self.eye_att_net(enc_x))
         enc_e = self.exp_encode_net(e[:-1])
         enc_e = torch.cat([enc_e, e[-1:]], dim=-1)
         enc_e = enc_e * eye_att
@@ -212,6 +258,45 @@ class MotionNetwork(nn.Module):
         }
 
 
+    def encode_audio_batch(self, a):
+        # a: [B, 8, 29, 16], one attention window per frame
+        B, W = a.shape[:2]
+        enc_a = self.audio_net(a.flatten(0, 1)).view(B, W, -1) # [B, 8, 64]
+        return self.audio_att_net(enc_a) # [B, 64]
+
+
+    @torch.no_grad()
+    def forward_batch(self, x, a, e):
+        # inference for B frames at once: x: [N, 3], a: [B, 8, 29, 16], e: [B, 6]
+        # everything depending only on x (hash-grid encoding, attention maps and the enc_x part
+        # of the first sigma layer) is computed once and shared by all frames
+        static = self.get_static(x)
+        if static is None:
+            static = self.compute_static(x)
+        aud_ch_att = static['aud_ch_att'] # [N, 32]
+        eye_att = static['eye_att'] # [N, 6]
+
+        enc_a = self.encode_audio_batch(a) # [B, 32]
+        enc_e = self.exp_encode_net(e[:, :-1])
+        enc_e = torch.cat([enc_e, e[:, -1:]], dim=-1) # [B, 6]
+
+        w = self.sigma_net.net[0].weight
+        w_a, w_e = torch.split(w[:, self.in_dim:self.in_dim + self.audio_dim + self.eye_dim], [self.audio_dim, self.eye_dim], dim=1)
+        h = static['h_x'][None] \
+            + (enc_a[:, None] * aud_ch_att[None]) @ w_a.T \
+            + (enc_e[:, None] * eye_att[None]) @ w_e.T # [B, N, hidden]
+        for l in range(1, self.sigma_net.num_layers):
+            h = F.relu(h, inplace=True)
+            h = self.sigma_net.net[l](h)
+
+        return {
+            'd_xyz': h[..., :3] * 1e-2,
+            'd_rot': h[..., 3:7],
+            'd_opa': h[..., 7:8],
+            'd_scale': h[..., 8:11],
+        }
+
+
     # optimizer utils
     def get_params(self, lr, lr_net, wd=0):
 
@@ -283,6 +368,8 @@ class MouthMotionNetwork(nn.Module):
         self.sigma_net = MLP(self.in_dim + self.audio_dim + self.individual_dim, self.out_dim, self.hidden_dim, self.num_layers)
         
         self.aud_ch_att_net = MLP(self.in_dim, self.audio_dim, 32, 2)
+
+        self.static_cache = None
     
 
     def encode_audio(self, a):
@@ -316,9 +403,46 @@ class MouthMotionNetwork(nn.Module):
         return torch.cat([feat_xy, feat_yz, feat_xz], dim=-1)
 
 
+    @torch.no_grad()
+    def compute_static(self, x):
+        # per-gaussian tensors that only depend on the canonical positions
+        enc_x = self.encode_x(x, bound=self.bound)
+        w_x = self.sigma_net.net[0].weight[:, :self.in_dim]
+        return {
+            'enc_x': enc_x,
+            'h_x': enc_x @ w_x.T,
+        }
+
+
+    def cache_static(self, x, path=None):
+        # inference only: precompute the static tensors for the (fixed) trained gaussians x,
+        # optionally persisted to / loaded from path
+        static = None
+        if path is not None and os.path.exists(path):
+            saved = torch.load(path, map_location=x.device)
+            if saved['xyz'].shape == x.shape and torch.equal(saved['xyz'], x.detach()):
+                static = saved['static']
+        if static is None:
+            static = self.compute_static(x)
+            if path is not None:
+                torch.save({'xyz': x.detach(), 'static': static}, path)
+        self.static_cache = {'xyz': x, 'static': static}
+
+
+    def clear_static_cache(self):
+        self.static_cache = None
+
+
+    def get_static(self, x):
+        if self.static_cache is not None and not self.training and self.static_cache['xyz'] is x:
+            return self.static_cache['static']
+        return None
+
+
     def forward(self, x, a):
         # x: [N, 3], in [-bound, bound]
-        enc_x = self.encode_x(x, bound=self.bound)
+        static = self.get_static(x)
+        enc_x = static['enc_x'] if static is not None else self.encode_x(x, bound=self.bound)
 
         enc_a = self.encode_audio(a)
         enc_w = enc_a.repeat(enc_x.shape[0], 1)
@@ -338,6 +462,37 @@ class MouthMotionNetwork(nn.Module):
         }
 
 
+    def encode_audio_batch(self, a):
+        # a: [B, 8, 29, 16], one attention window per frame
+        B, W = a.shape[:2]
+        enc_a = self.audio_net(a.flatten(0, 1)).view(B, W, -1) # [B, 8, 64]
+        return self.audio_att_net(enc_a) # [B, 64]
+
+
+    @torch.no_grad()
+    def forward_batch(self, x, a):
+        # inference for B frames at once: x: [N, 3], a: [B, 8, 29, 16]
+        # the audio code is the same for every gaussian, so the first sigma layer splits into
+        # a per-gaussian part (computed once) and a per-frame bias
+        static = self.get_static(x)
+        if static is None:
+            static = self.compute_static(x)
+        enc_a = self.encode_audio_batch(a) # [B, 32]
+
+        w_a = self.sigma_net.net[0].weight[:, self.in_dim:self.in_dim + self.audio_dim]
+        h = static['h_x'][None] + (enc_a @ w_a.T)[:, None] # [B, N, hidden]
+        for l in range(1, self.sigma_net.num_layers):
+            h = F.relu(h, inplace=True)
+            h = self.sigma_net.net[l](h)
+
+        d_xyz = h * 1e-2
+        d_xyz[..., 0] = d_xyz[..., 0] / 5
+        d_xyz[..., 2] = d_xyz[..., 2] / 5
+        return {
+            'd_xyz': d_xyz,
+        }
+
+
     # optimizer utils
     def get_params(self, lr, lr_net, wd=0):
 
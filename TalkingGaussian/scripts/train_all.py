@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+
+# mouth and face are independent; fuse reads chkpnt_mouth_latest.pth and chkpnt_face_latest.pth
+STAGES = {
+    "mouth": {"script": "train_mouth.py", "after": [], "args": ""},
+    "face": {"script": "train_face.py", "after": [], "args": "--init_num 2000 --densify_grad_threshold 0.0005"},
+    "fuse": {"script": "train_fuse.py", "after": ["mouth", "face"], "args": "--opacity_lr 0.001"},
+}
+STATE_FILE = "train_state.json"
+
+
+def _project_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _checkpoint(model_path, stage):
+    return os.path.join(model_path, f"chkpnt_{stage}_latest.pth")
+
+
+def _detect_devices(gpus):
+    """--gpus > CUDA_VISIBLE_DEVICES > nvidia-smi; empty list means CPU only"""
+    if gpus is None:
+        gpus = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if gpus is not None:
+        return [g for g in gpus.split(",") if g.strip() not in ("", "-1")]
+    if shutil.which("nvidia-smi") is None:
+        return []
+    try:
+        out = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return [str(i) for i, line in enumerate(out.splitlines()) if line.startswith("GPU")]
+
+
+def _load_state(model_path):
+    path = os.path.join(model_path, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(model_path, state):
+    path = os.path.join(model_path, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _is_done(model_path, state, stage):
+    return state.get(stage, {}).get("status") == "done" and os.path.exists(_checkpoint(model_path, stage))
+
+
+def _resume_checkpoint(model_path, state, stage):
+    """a stage that failed or was killed resumes from the chkpnt_<stage>_latest.pth it wrote itself"""
+    info = state.get(stage, {})
+    ckpt = _checkpoint(model_path, stage)
+    if stage == "fuse" or info.get("status") not in ("failed", "running") or not os.path.exists(ckpt):
+        return None
+    # an older checkpoint from a previous complete run is not a resume point
+    if os.path.getmtime(ckpt) < info.get("started", float("inf")):
+        return None
+    return ckpt
+
+
+def _build_command(args, stage, memory_fraction, resume):
+    cmd = [args.python, STAGES[stage]["script"], "-s", args.source_path, "-m", args.model_path,
+           "--audio_extractor", args.audio_extractor]
+    if args.iterations is not None:
+        cmd += ["--iterations", str(args.iterations)]
+    if memory_fraction is not None and stage != "fuse":
+        cmd += ["--memory_fraction", f"{memory_fraction:.3f}"]
+    if resume is not None:
+        cmd += ["--start_checkpoint", resume]
+    cmd += shlex.split(getattr(args, f"{stage}_args"))
+    return cmd
+
+
+def _report(state, stages):
+    print("\n[INFO] stage    status    device  wall time")
+    for stage in stages:
+        info = state.get(stage, {})
+        wall = info.get("wall_time")
+        wall = f"{wall / 60:.1f} min" if wall is not None else "-"
+        print(f"[INFO] {stage:<8} {info.get('status', 'pending'):<9} {str(info.get('device', '-')):<7} {wall}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Train the mouth and face stages concurrently (one per GPU, or sharing one GPU with memory caps), "
+            "then fuse. Per-stage status, checkpoints and wall time are kept in <model_path>/train_state.json; "
+            "rerunning resumes unfinished stages only."
+        )
+    )
+    parser.add_argument("-s", "--source_path", required=True)
+    parser.add_argument("-m", "--model_path", required=True)
+    parser.add_argument("--audio_extractor", default="deepspeech", choices=["deepspeech", "esperanto", "hubert"])
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES),
+                        help="Stages to run, e.g. --stages face to retrain a single stage")
+    parser.add_argument("--force", action="store_true", help="Rerun selected stages even if they are done")
+    parser.add_argument("--gpus", default=None, help="Comma separated GPU ids (default: CUDA_VISIBLE_DEVICES or all)")
+    parser.add_argument("--jobs_per_gpu", type=int, default=None,
+                        help="Concurrent stages per GPU (default: 1 with several GPUs, 2 with one)")
+    parser.add_argument("--memory_fraction", type=float, default=None,
+                        help="GPU memory cap per stage when sharing a GPU (default: 0.95 / jobs_per_gpu)")
+    parser.add_argument("--sequential", action="store_true", help="Run one stage at a time")
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="Override iterations of every stage (small values for smoke tests)")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter used for the stage scripts")
+    for stage, spec in STAGES.items():
+        parser.add_argument(f"--{stage}_args", default=spec["args"], help=f"Extra arguments for {spec['script']}")
+    args = parser.parse_args()
+
+    root = _project_root()
+    os.makedirs(os.path.join(args.model_path, "logs"), exist_ok=True)
+    # stage scripts run from the project root, resolve paths before changing cwd
+    args.source_path = os.path.abspath(args.source_path)
+    args.model_path = os.path.abspath(args.model_path)
+
+    devices = _detect_devices(args.gpus)
+    if args.sequential:
+        jobs_per_gpu = 1
+    elif args.jobs_per_gpu is not None:
+        jobs_per_gpu = max(args.jobs_per_gpu, 1)
+    else:
+        jobs_per_gpu = 1 if len(devices) > 1 else 2
+    if not devices:
+        # CPU only: the stages run one after another without a device
+        slots = [""]
+    else:
+        slots = [d for _ in range(jobs_per_gpu) for d in devices]
+        if args.sequential:
+            slots = slots[:1]
+    memory_fraction = args.memory_fraction
+    if memory_fraction is None and devices and jobs_per_gpu > 1:
+        memory_fraction = 0.95 / jobs_per_gpu
+    print(f"[INFO] devices: {devices or ['cpu']}, {len(slots)} concurrent slot(s)"
+          + (f", memory cap {memory_fraction:.2f} per stage" if memory_fraction else ""))
+
+    state = _load_state(args.model_path)
+    pending = []
+    for stage in STAGES:
+        if stage not in args.stages:
+            continue
+        if _is_done(args.model_path, state, stage) and not args.force:
+            print(f"[INFO] skip {stage}: done ({state[stage].get('wall_time', 0) / 60:.1f} min)")
+            continue
+        pending.append(stage)
+
+    running = {}  # stage -> (process, slot, log file, start time)
+    failed = []
+    while pending or running:
+        # start every ready stage that has a free slot
+        busy = [slot for _, slot, _, _ in running.values()]
+        free = list(slots)
+        for slot in busy:
+            free.remove(slot)
+        for stage in list(pending):
+            if not free:
+                break
+            deps = STAGES[stage]["after"]
+            if any(d in failed for d in deps):
+                pending.remove(stage)
+                failed.append(stage)
+                state[stage] = {**state.get(stage, {}), "status": "skipped"}
+                print(f"[INFO] skip {stage}: depends on failed {[d for d in deps if d in failed]}")
+                continue
+            if any(d in pending or d in running or not _is_done(args.model_path, state, d) for d in deps):
+                continue
+            slot = free.pop(0)
+            shared = slots.count(slot) > 1
+            resume = None if args.force else _resume_checkpoint(args.model_path, state, stage)
+            cmd = _build_command(args, stage, memory_fraction if shared else None, resume)
+            env = dict(os.environ, CUDA_VISIBLE_DEVICES=slot)
+            log_path = os.path.join(args.model_path, "logs", f"train_{stage}.log")
+            log = open(log_path, "a")
+            log.write(f"\n==== {time.strftime('%Y-%m-%d %H:%M:%S')} {' '.join(cmd)}\n")
+            log.flush()
+            print(f"[RUN] {stage} on {'cuda:' + slot if slot else 'cpu'}"
+                  + (f", resuming from {os.path.basename(resume)}" if resume else "") + f" (log: {log_path})")
+            start = time.time()
+            process = subprocess.Popen(cmd, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+            running[stage] = (process, slot, log, start)
+            pending.remove(stage)
+            # a resumed stage also counts the wall time of its earlier attempts
+            prev = state.get(stage, {})
+            state[stage] = {"status": "running", "device": slot or "cpu", "started": start, "cmd": cmd,
+                            "log": log_path, "wall_time_before": prev.get("wall_time_before", 0) + prev.get("elapsed", 0)
+                            if resume else 0}
+            _save_state(args.model_path, state)
+
+        if not running and pending:
+            # nothing can start: remaining stages wait on stages that were not selected and are not done
+            for stage in pending:
+                missing = [d for d in STAGES[stage]["after"] if not _is_done(args.model_path, state, d)]
+                print(f"[INFO] cannot run {stage}: {missing} not trained")
+                state[stage] = {**state.get(stage, {}), "status": "blocked"}
+                failed.append(stage)
+            pending = []
+            break
+
+        time.sleep(1)
+        for stage, (process, slot, log, start) in list(running.items()):
+            ret = process.poll()
+            if ret is None:
+                continue
+            log.close()
+            elapsed = time.time() - start
+            info = state[stage]
+            info.update({"status": "done" if ret == 0 else "failed", "returncode": ret, "elapsed": elapsed,
+                         "wall_time": info.get("wall_time_before", 0) + elapsed, "finished": time.time()})
+            if ret == 0:
+                info["checkpoint"] = _checkpoint(args.model_path, stage)
+                print(f"[INFO] {stage} finished in {elapsed / 60:.1f} min")
+            else:
+                failed.append(stage)
+                print(f"[INFO] {stage} failed (exit {ret}) after {elapsed / 60:.1f} min, see {info['log']}; "
+                      f"rerun with --stages {stage} to resume it")
+            del running[stage]
+            _save_state(args.model_path, state)
+
+    _save_state(args.model_path, state)
+    _report(state, [s for s in STAGES if s in args.stages])
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,10 +20,16 @@ conda run -n talking_gaussian --no-capture-output python train_mouth.py -s "$dat
 conda run -n talking_gaussian --no-capture-output python train_face.py -s "$dataset_rel" -m "$workspace_rel" --init_num 2000 --densify_grad_threshold 0.0005 --audio_extractor "$audio_extractor"
 conda run -n talking_gaussian --no-capture-output python train_fuse.py -s "$dataset_rel" -m "$workspace_rel" --opacity_lr 0.001 --audio_extractor "$audio_extractor"
 
-# # Parallel. Ensure that you have aleast 2 GPUs, and over N x 64GB memory for about N x 5k frames (IMPORTANT! Otherwise the computer will crash).
-# CUDA_VISIBLE_DEVICES=$gpu_id conda run -n talking_gaussian --no-capture-output python train_mouth.py -s "$dataset_rel" -m "$workspace_rel" --audio_extractor "$audio_extractor" & 
-# CUDA_VISIBLE_DEVICES=$((gpu_id+1)) conda run -n talking_gaussian --no-capture-output python train_face.py -s "$dataset_rel" -m "$workspace_rel" --init_num 2000 --densify_grad_threshold 0.0005 --audio_extractor "$audio_extractor"
-# CUDA_VISIBLE_DEVICES=$gpu_id conda run -n talking_gaussian --no-capture-output python train_fuse.py -s "$dataset_rel" -m "$workspace_rel" --opacity_lr 0.001 --audio_extractor "$audio_extractor"
+# Precompute poses / AU / backgrounds for inference (synthesize_fuse --fast, render_server)
+conda run -n talking_gaussian --no-capture-output python -m scene.inference_cache -S "$dataset_rel"
+# Single-file inference bundle (gaussians, motion nets, cameras, backgrounds) for render nodes
+conda run -n talking_gaussian --no-capture-output python -m scene.bundle -S "$dataset_rel" -m "$workspace_rel" --audio_extractor "$audio_extractor"
+# Optional: prune / quantize the trained gaussians into <workspace>/model_compact.tgb (reports PSNR/SSIM/fps deltas in compact_report.json)
+# conda run -n talking_gaussian --no-capture-output python compact.py -S "$dataset_rel" -m "$workspace_rel" --audio_extractor "$audio_extractor" --prune_ratio 0.4 --quantize vq
+
+# # Parallel: mouth and face train concurrently (one per GPU, or sharing one GPU with memory caps), then fuse.
+# # Per-stage status / wall time are kept in <workspace>/train_state.json; rerun to resume only the unfinished stages.
+# conda run -n talking_gaussian --no-capture-output python scripts/train_all.py -s "$dataset_rel" -m "$workspace_rel" --audio_extractor "$audio_extractor"
 
 conda run -n talking_gaussian --no-capture-output python synthesize_fuse.py -s "$dataset_rel" -m "$workspace_rel" --eval --audio_extractor "$audio_extractor"
 conda run -n talking_gaussian --no-capture-output python metrics.py "$workspace_rel/test/ours_None/renders/out.mp4" "$workspace_rel/test/ours_None/gt/out.mp4"
\ No newline at end of file
@@ -10,17 +10,21 @@
 #
 
 import imageio
+import time
 import numpy as np
 import torch
 from scene import Scene
+from scene.inference_cache import load_inference_cameras
+from scene.bundle import RenderBundle
 import os
+from contextlib import ExitStack
 from tqdm import tqdm
 from os import makedirs
-from gaussian_renderer import render_motion, render_motion_mouth
+from gaussian_renderer import render_motion, render_motion_mouth, render_motion_batch, render_motion_mouth_batch
 import torchvision
 from utils.general_utils import safe_state
-from utils.camera_utils import loadCamOnTheFly
-import copy
+from utils.camera_utils import loadCamOnTheFly, copyCamera
+from utils.video_writer import FFmpegFrameWriter
 from argparse import ArgumentParser
 from arguments import ModelParams, PipelineParams, get_combined_args
 from gaussian_renderer import GaussianModel, MotionNetwork, MouthMotionNetwork
@@ -32,83 +36,174 @@ def dilate_fn(bin_img, ksize=13):
     out = F.max_pool2d(bin_img, kernel_size=ksize, stride=1, padding=pad)
     return out
 
-def render_set(model_path, name, iteration, views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, fast, dilate):
+def to_uint8(image):
+    return (image[0:3, ...].clamp(0, 1).permute(1, 2, 0).detach().cpu().numpy() * 255).astype(np.uint8)
+
+def compose_view(view, render_pkg, render_pkg_mouth, dilate):
+    """脸部与嘴部两组高斯的渲染结果按 alpha 与背景合成"""
+    if dilate:
+        alpha_mouth = dilate_fn(render_pkg_mouth["alpha"][None])[0]
+    else:
+        alpha_mouth = render_pkg_mouth["alpha"]
+        
+    mouth_image = render_pkg_mouth["render"] + view.background.cuda() / 255.0 * (1.0 - alpha_mouth)
+
+    # alpha = gaussian_blur(render_pkg["alpha"], [3, 3], 2)
+    alpha = render_pkg["alpha"]
+    image = render_pkg["render"] + mouth_image * (1.0 - alpha)
+
+    return {"image": image, "face": render_pkg["render"], "mouth": render_pkg_mouth["render"]}
+
+def render_view(view, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate):
+    """渲染单帧：脸部与嘴部两组高斯分别渲染后合成"""
+    render_pkg = render_motion(view, gaussians, motion_net, pipeline, background, frame_idx=0)
+    render_pkg_mouth = render_motion_mouth(view, gaussians_mouth, motion_net_mouth, pipeline, background, frame_idx=0)
+    return compose_view(view, render_pkg, render_pkg_mouth, dilate)
+
+def render_view_batch(views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate):
+    """批量渲染多帧：运动网络一次推理 B 帧（静态 xyz 编码共享），再逐帧光栅化"""
+    render_pkgs = render_motion_batch(views, gaussians, motion_net, pipeline, background)
+    render_pkgs_mouth = render_motion_mouth_batch(views, gaussians_mouth, motion_net_mouth, pipeline, background)
+    return [compose_view(view, pkg, pkg_mouth, dilate) for view, pkg, pkg_mouth in zip(views, render_pkgs, render_pkgs_mouth)]
+
+def render_frames(views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate, batch_size=1):
+    """按 batch_size 逐批产出每帧的合成结果；batch_size=1 时与逐帧 render_view 相同"""
+    for start in range(0, len(views), batch_size):
+        batch = views[start:start + batch_size]
+        with torch.no_grad():
+            if batch_size == 1:
+                yield render_view(batch[0], gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate)
+            else:
+                yield from render_view_batch(batch, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate)
+
+def benchmark(views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate, batch_size, num_frames=200):
+    """对比逐帧与批量渲染的吞吐（fps），并检查两者输出一致"""
+    views = [loadCamOnTheFly(copyCamera(view)) if view.original_image == None else view for view in views[:num_frames]]
+    results = {}
+    for bs in (1, batch_size):
+        # 预热一批，排除 CUDA 初始化
+        for _ in render_frames(views[:bs], gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate, bs):
+            pass
+        torch.cuda.synchronize()
+        start = time.time()
+        images = [out["image"] for out in render_frames(views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate, bs)]
+        torch.cuda.synchronize()
+        elapsed = time.time() - start
+        results[bs] = images
+        print(f"[benchmark] batch_size={bs}: {len(views)} 帧, {elapsed:.2f}s, {len(views) / elapsed:.1f} fps")
+    max_diff = max((a - b).abs().max().item() for a, b in zip(results[1], results[batch_size]))
+    print(f"[benchmark] 逐帧与批量输出最大差异: {max_diff:.2e}")
+
+def load_fuse_models(dataset : ModelParams, gaussians : GaussianModel = None, persist_static=False):
+    """
+    从 chkpnt_fuse_latest.pth 恢复脸部/嘴部高斯与对应的运动网络（推理模式）
+    高斯位置训练后固定，运动网络中只依赖位置的哈希编码与注意力在此预计算一次；
+    persist_static=True 时缓存保存在检查点旁，下次加载直接读取
+    """
+    if gaussians is None:
+        gaussians = GaussianModel(dataset.sh_degree)
+    gaussians_mouth = GaussianModel(dataset.sh_degree)
+
+    motion_net = MotionNetwork(args=dataset).cuda()
+    motion_net_mouth = MouthMotionNetwork(args=dataset).cuda()
+
+    checkpoint = os.path.join(dataset.model_path, "chkpnt_fuse_latest.pth")
+    (model_params, motion_params, model_mouth_params, motion_mouth_params) = torch.load(checkpoint)
+    motion_net.load_state_dict(motion_params, strict=False)
+    gaussians.restore(model_params, None)
+
+    motion_net_mouth.load_state_dict(motion_mouth_params, strict=False)
+    gaussians_mouth.restore(model_mouth_params, None)
+
+    # motion_net.fix(gaussians.get_xyz.cuda())
+    # motion_net_mouth.fix(gaussians_mouth.get_xyz.cuda())
+    motion_net.eval()
+    motion_net_mouth.eval()
+    face_static, mouth_static = None, None
+    if persist_static:
+        face_static = os.path.join(dataset.model_path, "chkpnt_fuse_latest.static_face.pth")
+        mouth_static = os.path.join(dataset.model_path, "chkpnt_fuse_latest.static_mouth.pth")
+        # 缓存同时依赖网络权重，早于检查点的缓存作废
+        for path in (face_static, mouth_static):
+            if os.path.exists(path) and os.path.getmtime(path) < os.path.getmtime(checkpoint):
+                os.remove(path)
+    motion_net.cache_static(gaussians.get_xyz, face_static)
+    motion_net_mouth.cache_static(gaussians_mouth.get_xyz, mouth_static)
+    return gaussians, motion_net, gaussians_mouth, motion_net_mouth
+
+def render_set(model_path, name, iteration, views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, fast, dilate, batch_size=1, wav=None, render_dir=None):
     render_path = os.path.join(model_path, name, "ours_{}".format(iteration), "renders")
     gts_path = os.path.join(model_path, name, "ours_{}".format(iteration), "gt")
+    if render_dir:
+        # 每个请求单独的输出目录，并发渲染同一模型时互不覆盖
+        render_path = os.path.join(render_dir, "renders")
+        gts_path = os.path.join(render_dir, "gt")
 
     makedirs(render_path, exist_ok=True)
     makedirs(gts_path, exist_ok=True)
 
-    all_preds = []
-    all_gts = []
-
-    all_preds_face = []
-    all_preds_mouth = []
-
-
-    for idx, view in enumerate(tqdm(views, desc="Rendering progress", ascii=True)):
-        if view.original_image == None:
-            view = loadCamOnTheFly(copy.deepcopy(view))
-        with torch.no_grad():
-            render_pkg = render_motion(view, gaussians, motion_net, pipeline, background, frame_idx=0)
-            render_pkg_mouth = render_motion_mouth(view, gaussians_mouth, motion_net_mouth, pipeline, background, frame_idx=0)
-        # gt = view.original_image[0:3, :, :]
-        # torchvision.utils.save_image(rendering, os.path.join(render_path, '{0:05d}'.format(idx) + ".png"))
-        # torchvision.utils.save_image(gt, os.path.join(gts_path, '{0:05d}'.format(idx) + ".png"))
-
-        if dilate:
-            alpha_mouth = dilate_fn(render_pkg_mouth["alpha"][None])[0]
-        else:
-            alpha_mouth = render_pkg_mouth["alpha"]
-            
-        mouth_image = render_pkg_mouth["render"] + view.background.cuda() / 255.0 * (1.0 - alpha_mouth)
-
-        # alpha = gaussian_blur(render_pkg["alpha"], [3, 3], 2)
-        alpha = render_pkg["alpha"]
-        image = render_pkg["render"] + mouth_image * (1.0 - alpha)
-
-        pred = (image[0:3, ...].clamp(0, 1).permute(1, 2, 0).detach().cpu().numpy()* 255).astype(np.uint8)
-        all_preds.append(pred)
-        
-        if not fast:
-            all_preds_face.append((render_pkg["render"].clamp(0, 1).permute(1, 2, 0).detach().cpu().numpy()* 255).astype(np.uint8))
-            all_preds_mouth.append((render_pkg_mouth["render"].clamp(0, 1).permute(1, 2, 0).detach().cpu().numpy()* 255).astype(np.uint8))
-
-            all_gts.append(view.original_image.permute(1, 2, 0).cpu().numpy().astype(np.uint8))
-    
-    imageio.mimwrite(os.path.join(render_path, 'out.mp4'), all_preds, fps=25, quality=8, macro_block_size=1)
+    # 边渲染边编码：帧经有界队列送入 ffmpeg，内存占用与视频长度无关
+    # 指定 wav 时音轨在同一次编码中合成，out.mp4 即为最终视频
+    writers = {"out": FFmpegFrameWriter(os.path.join(render_path, 'out.mp4'), fps=25, audio=wav)}
     if not fast:
-        imageio.mimwrite(os.path.join(gts_path, 'out.mp4'), all_gts, fps=25, quality=8, macro_block_size=1)
-
-        imageio.mimwrite(os.path.join(render_path, 'out_face.mp4'), all_preds_face, fps=25, quality=8, macro_block_size=1)
-        imageio.mimwrite(os.path.join(render_path, 'out_mouth.mp4'), all_preds_mouth, fps=25, quality=8, macro_block_size=1)
-
-
-
-def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParams, use_train : bool, fast, dilate):
+        writers["gt"] = FFmpegFrameWriter(os.path.join(gts_path, 'out.mp4'), fps=25)
+        writers["face"] = FFmpegFrameWriter(os.path.join(render_path, 'out_face.mp4'), fps=25)
+        writers["mouth"] = FFmpegFrameWriter(os.path.join(render_path, 'out_mouth.mp4'), fps=25)
+
+    # 正常结束时依次 close 等待编码完成；出错时 __exit__ 直接终止 ffmpeg，不掩盖原异常
+    with ExitStack() as stack:
+        for writer in writers.values():
+            stack.enter_context(writer)
+        progress = tqdm(total=len(views), desc="Rendering progress", ascii=True)
+        for start in range(0, len(views), batch_size):
+            batch = [loadCamOnTheFly(copyCamera(view)) if not fast and view.original_image == None else view for view in views[start:start + batch_size]]
+            outputs = render_frames(batch, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate, batch_size)
+            for view, out in zip(batch, outputs):
+                writers["out"].write(to_uint8(out["image"]))
+                
+                if not fast:
+                    writers["face"].write(to_uint8(out["face"]))
+                    writers["mouth"].write(to_uint8(out["mouth"]))
+
+                    writers["gt"].write(view.original_image.permute(1, 2, 0).cpu().numpy().astype(np.uint8))
+            progress.update(len(batch))
+        progress.close()
+
+
+
+def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParams, use_train : bool, fast, dilate, batch_size=1, run_benchmark=False, persist_static=False, wav=None, render_dir=None, bundle=None):
     with torch.no_grad():
         gaussians = GaussianModel(dataset.sh_degree)
-        gaussians_mouth = GaussianModel(dataset.sh_degree)
-        scene = Scene(dataset, gaussians, shuffle=False)
-
-        motion_net = MotionNetwork(args=dataset).cuda()
-        motion_net_mouth = MouthMotionNetwork(args=dataset).cuda()
-
-        (model_params, motion_params, model_mouth_params, motion_mouth_params) = torch.load(os.path.join(dataset.model_path, "chkpnt_fuse_latest.pth"))
-        motion_net.load_state_dict(motion_params, strict=False)
-        gaussians.restore(model_params, None)
-
-        motion_net_mouth.load_state_dict(motion_mouth_params, strict=False)
-        gaussians_mouth.restore(model_mouth_params, None)
-
-        
-        # motion_net.fix(gaussians.get_xyz.cuda())
-        # motion_net_mouth.fix(gaussians_mouth.get_xyz.cuda())
+        if bundle:
+            # 模型包：高斯、运动网络、相机与背景都在包内，不需要数据集与检查点
+            assert dataset.audio, "--bundle 需要通过 --audio 指定音频特征"
+            render_bundle = RenderBundle(bundle)
+            auds = torch.from_numpy(np.load(dataset.audio)).float().permute(0, 2, 1)
+            views = render_bundle.cameras(auds, dataset.data_device)
+            gaussians, motion_net, gaussians_mouth, motion_net_mouth = render_bundle.load_models()
+            dataset.white_background = render_bundle.white_background
+            dataset.model_path = dataset.model_path or os.path.dirname(os.path.abspath(bundle))
+            fast, loaded_iter = True, None
+        elif fast or run_benchmark:
+            # 不输出 gt 时只需位姿、AU 与背景：读取推理缓存（缺失或过期时自动构建），不构造 Scene
+            transformsfile = "transforms_train.json" if use_train else "transforms_val.json"
+            views = load_inference_cameras(dataset.source_path, transformsfile, dataset.audio, dataset.audio_extractor, dataset.data_device)
+            loaded_iter = None
+        else:
+            scene = Scene(dataset, gaussians, shuffle=False)
+            views = scene.getTestCameras() if not use_train else scene.getTrainCameras()
+            loaded_iter = scene.loaded_iter
+        if not bundle:
+            gaussians, motion_net, gaussians_mouth, motion_net_mouth = load_fuse_models(dataset, gaussians, persist_static)
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
         background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
-        
-        render_set(dataset.model_path, "test" if not use_train else "train", scene.loaded_iter, scene.getTestCameras() if not use_train else scene.getTrainCameras(), gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, fast, dilate)
+
+        if run_benchmark:
+            benchmark(views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, dilate, max(batch_size, 2))
+            return
+
+        render_set(dataset.model_path, "test" if not use_train else "train", loaded_iter, views, gaussians, motion_net, gaussians_mouth, motion_net_mouth, pipeline, background, fast, dilate, batch_size, wav, render_dir)
 
 if __name__ == "__main__":
     # Set up command line argument parser
@@ -120,10 +215,16 @@ if __name__ == "__main__":
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--fast", action="store_true")
     parser.add_argument("--dilate", action="store_true")
+    parser.add_argument("--batch_size", default=1, type=int, help="运动网络批量推理的帧数")
+    parser.add_argument("--benchmark", action="store_true", help="对比逐帧与批量渲染的 fps")
+    parser.add_argument("--persist_static_cache", action="store_true", help="将运动网络的静态编码缓存保存在检查点旁")
+    parser.add_argument("--wav", default=None, type=str, help="合成到 out.mp4 的音轨（与渲染同一次编码）")
+    parser.add_argument("--render_dir", default=None, type=str, help="输出目录，缺省为 <model_path>/<train|test>/ours_<iter>")
+    parser.add_argument("--bundle", default=None, type=str, help="从 scene.bundle 导出的模型包渲染（隐含 --fast），无需 -S 数据集")
     args = get_combined_args(parser)
     print("Rendering " + args.model_path)
 
     # Initialize system state (RNG)
     safe_state(args.quiet)
     
-    render_sets(model.extract(args), args.iteration, pipeline.extract(args), args.use_train, args.fast, args.dilate)
+    render_sets(model.extract(args), args.iteration, pipeline.extract(args), args.use_train, args.fast, args.dilate, args.batch_size, args.benchmark, args.persist_static_cache, args.wav, args.render_dir, args.bundle)
@@ -7,6 +7,8 @@ import os
 import argparse
 import subprocess
 import shutil
+import math
+import wave
 import numpy as np
 from datetime import datetime
 
@@ -23,34 +25,23 @@ def ffprobe_duration(path: str) -> float:
         raise RuntimeError(f"ffprobe failed: {r.stderr}")
     return float(r.stdout.strip())
 
-def trim_video_to_duration(input_mp4: str, out_mp4: str, duration_s: float):
-    """把视频裁到 duration_s（秒）。为避免关键帧问题，直接重编码更稳。"""
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", input_mp4,
-        "-t", f"{duration_s:.3f}",
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
-        "-an",
-        out_mp4
-    ]
-    r = subprocess.run(cmd, capture_output=True, text=True)
-    if r.returncode != 0:
-        raise RuntimeError(f"ffmpeg trim failed: {r.stderr}")
+def wav_info(path: str):
+    """
+    从 wav 头读取 (采样率, 时长秒)，不启动 ffprobe 子进程。
+    非 PCM wav 或其他格式返回 None，由调用方回退到 ffprobe。
+    """
+    try:
+        with wave.open(path, 'rb') as w:
+            return w.getframerate(), w.getnframes() / float(w.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
 
-def mux_audio(video_mp4: str, audio_wav: str, out_mp4: str):
-    """给视频加音轨，输出最终 mp4"""
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", video_mp4,
-        "-i", audio_wav,
-        "-c:v", "copy",
-        "-c:a", "aac",
-        "-shortest",
-        out_mp4
-    ]
-    r = subprocess.run(cmd, capture_output=True, text=True)
-    if r.returncode != 0:
-        raise RuntimeError(f"ffmpeg mux failed: {r.stderr}")
+def audio_duration(path: str) -> float:
+    """音频时长（秒），优先读 wav 头"""
+    info = wav_info(path)
+    if info is not None:
+        return info[1]
+    return ffprobe_duration(path)
 
 def ensure_audio_sample_rate(audio_file: str, target_sr: int = 16000) -> str:
     """
@@ -58,6 +49,10 @@ def ensure_audio_sample_rate(audio_file: str, target_sr: int = 16000) -> str:
     返回最终使用的音频文件路径。
     """
     try:
+        info = wav_info(audio_file)
+        if info is not None and info[0] == target_sr:
+            return audio_file
+
         # 使用 ffprobe 检查采样率
         cmd = [
             "ffprobe", "-v", "error",
@@ -140,6 +135,31 @@ def extract_audio_features(audio_file, output_dir, audio_basename, extractor, ts
         
     return feature_file
 
+def fix_feature_length(feature_file: str, audio_file: str):
+    """
+    把特征截断到音频恰好需要的帧数（25fps，向上取整），
+    渲染帧数与音频一致，之后无需再裁剪视频。
+    """
+    try:
+        feats = np.load(feature_file)
+        print(f"特征文件形状: {feats.shape}")
+        num_frames = feats.shape[0]
+        print(f"特征帧数: {num_frames}, 预计视频时长: {num_frames / 25.0:.2f} 秒")
+
+        real_audio_dur = audio_duration(audio_file)
+        print(f"音频真实时长: {real_audio_dur:.2f} 秒")
+
+        expected_frames = max(1, math.ceil(real_audio_dur * 25 - 1e-6))
+        if num_frames > expected_frames:
+            feats_trimmed = feats[:expected_frames]
+            np.save(feature_file, feats_trimmed)
+            print(f"特征已截断至 {expected_frames} 帧，新形状: {feats_trimmed.shape}")
+        elif num_frames < expected_frames:
+            print(f"警告: 特征帧数 ({num_frames}) 少于音频所需帧数 ({expected_frames})")
+
+    except Exception as e:
+        print(f"警告: 特征检查/修正失败: {e}")
+
 def main():
     parser = argparse.ArgumentParser(description='TalkingGaussian 视频生成工具')
     parser.add_argument('--audio_file', 
@@ -163,6 +183,10 @@ def main():
                         choices=[0, 1, 2, 3],
                         default=2,
                         help='渲染质量等级：0(极速), 1(标准), 2(高保真), 3(最高保真)')
+    parser.add_argument('--batch_size',
+                        type=int,
+                        default=8,
+                        help='运动网络批量推理的帧数，1 为逐帧渲染')
 
     args = parser.parse_args()
 
@@ -246,35 +270,12 @@ def main():
 
     print(f"音频特征准备完成: {feature_file}")
 
-    # --- 调试与强制修正逻辑开始 ---
-    try:
-        feats = np.load(feature_file)
-        print(f"特征文件形状: {feats.shape}")
-        num_frames = feats.shape[0]
-        predicted_dur = num_frames / 25.0
-        print(f"特征帧数: {num_frames}, 预计视频时长: {predicted_dur:.2f} 秒")
-        
-        # 获取音频真实时长
-        real_audio_dur = ffprobe_duration(args.audio_file)
-        print(f"音频真实时长: {real_audio_dur:.2f} 秒")
-        
-        # 检查误差 (允许 0.5秒 或 12帧 的误差)
-        if predicted_dur > real_audio_dur + 0.5:
-            print(f"警告: 特征时长 ({predicted_dur:.2f}s) 显著长于音频 ({real_audio_dur:.2f}s)")
-            expected_frames = int(real_audio_dur * 25) + 1 # 多留1帧防截断
-            print(f"正在强制截断特征至 {expected_frames} 帧...")
-            
-            # 截断并覆盖保存
-            feats_trimmed = feats[:expected_frames]
-            np.save(feature_file, feats_trimmed)
-            print(f"特征已修正，新形状: {feats_trimmed.shape}")
-            
-    except Exception as e:
-        print(f"警告: 特征检查/修正失败: {e}")
-    # --- 调试与强制修正逻辑结束 ---
+    fix_feature_length(feature_file, args.audio_file)
 
     # 生成视频
     print("正在生成人脸说话视频...")
+    # 渲染结果写在输出目录下（每次调用独立），不再写入共享的 <model_path>/train/ours_None
+    render_dir = os.path.join(args.output_dir, f"{audio_basename}_{ts}_render")
     use_train = True  # 将参数提取为变量
     cmd = [
         'python', 'synthesize_fuse.py',
@@ -282,66 +283,33 @@ def main():
         '-M', args.model_path,
         '--audio', feature_file,
         '--sh_degree', str(args.sh_degree),
+        '--batch_size', str(args.batch_size),
+        # 音轨在渲染编码时一并合成；不输出 gt/face/mouth 对比视频
+        '--wav', args.audio_file,
+        '--fast',
+        '--render_dir', render_dir,
     ]
     if use_train:
         cmd.append('--use_train')
     
+    generated_video = os.path.join(render_dir, "renders", "out.mp4")
+    # 删除上次的结果，避免渲染失败时误用旧视频
+    if os.path.exists(generated_video):
+        os.remove(generated_video)
+
     result = subprocess.run(cmd, capture_output=True, text=True)
-    # ...existing code...
+    if result.returncode != 0:
+        print(f"错误: 渲染失败: {result.stderr[-2000:]}")
 
-    # 查找生成的视频文件
-    # 根据 use_train 决定子目录是 'train' 还是 'test'
-    sub_dir = "train" if use_train else "test"
-    render_output_dir = os.path.join(args.model_path, sub_dir, "ours_None", "renders")
-    generated_video = os.path.join(render_output_dir, "out.mp4")
-    
     if not os.path.exists(generated_video):
-        print("警告: 未能找到生成的视频文件")
-        # 尝试查找其他可能的位置
-        alternative_paths = [
-            os.path.join(args.model_path, "train", "ours_None", "renders", "out.mp4"),
-        ]
-        
-        found = False
-        for alt_path in alternative_paths:
-            if os.path.exists(alt_path):
-                generated_video = alt_path
-                found = True
-                break
-                
-        if not found:
-            print("错误: 在预期位置未找到生成的视频文件")
-            return
-    
-    # 将视频复制到输出目录并重命名
-    output_video = os.path.join(args.output_dir, f"{audio_basename}_talking_head.mp4")
-    shutil.copy2(generated_video, output_video)
-    
-    print(f"生成无声视频: {output_video}")
+        print("错误: 在预期位置未找到生成的视频文件")
+        return
     
-    # 检查生成视频的实际时长
-    try:
-        actual_dur = ffprobe_duration(output_video)
-        print(f"生成视频实际时长: {actual_dur:.3f}s")
-    except Exception as e:
-        print(f"无法获取视频时长: {e}")
-
-    # 1) 读音频时长
-    audio_dur = ffprobe_duration(args.audio_file)
-    print(f"输入音频时长: {audio_dur:.3f}s")
-
-    # 2) 裁剪视频到音频时长
-    trimmed_video = os.path.join(args.output_dir, f"{audio_basename}_trimmed.mp4")
-    trim_video_to_duration(output_video, trimmed_video, audio_dur)
-    print(f"裁剪后视频: {trimmed_video}")
-
-    # 3) 合成音轨
+    # out.mp4 已包含音轨且帧数与音频一致，直接作为最终视频
     final_video = os.path.join(args.output_dir, f"{audio_basename}_final.mp4")
-    mux_audio(trimmed_video, args.audio_file, final_video)
-    print(f"最终有声视频: {final_video}")
-
-        
-    print(f"人脸说话视频生成完成: {output_video}")
+    shutil.move(generated_video, final_video)
+    shutil.rmtree(render_dir, ignore_errors=True)
+    print(f"人脸说话视频生成完成: {final_video}")
 
 
 if __name__ == '__main__':
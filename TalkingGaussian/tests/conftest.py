@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 与训练/预处理脚本一致：从 TalkingGaussian 目录导入 scene、utils 等；data_utils 下的脚本互相按模块名导入
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (ROOT, os.path.join(ROOT, "data_utils")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
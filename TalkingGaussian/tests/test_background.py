@@ -0,0 +1,87 @@
+"""
+data_utils/process.py：距离变换版背景提取（extract_background）与原 KD-tree 版（extract_background_knn）的回归对比
+"""
+
+import os
+import glob
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+ndimage = pytest.importorskip("scipy.ndimage")
+pytest.importorskip("sklearn")
+
+import process
+
+
+H, W = 72, 96
+NUM_FRAMES = 60
+
+
+def make_clip(base_dir):
+    """纹理背景前左右移动的椭圆"人物"，parsing 中背景为白色、人物为头发/面部颜色"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:H, 0:W]
+    background = np.stack([xx * 255 // W, yy * 255 // H, (xx + yy) * 255 // (W + H)], -1).astype(np.uint8)
+    background = np.clip(background.astype(int) + rng.integers(-20, 20, background.shape), 0, 255).astype(np.uint8)
+
+    ori_dir = os.path.join(base_dir, "ori_imgs")
+    parsing_dir = os.path.join(base_dir, "parsing")
+    os.makedirs(ori_dir)
+    os.makedirs(parsing_dir)
+    for i in range(NUM_FRAMES):
+        cx = 20 + (W - 40) * i / (NUM_FRAMES - 1)
+        person = ((xx - cx) / 14) ** 2 + ((yy - 40) / 24) ** 2 <= 1
+        neck = (np.abs(xx - cx) <= 6) & (yy >= 60)
+        image = background.copy()
+        image[person | neck] = (40, 80, 160)
+        parsing = np.full((H, W, 3), 255, dtype=np.uint8)
+        parsing[person] = (255, 0, 0)
+        parsing[neck] = (0, 255, 0)
+        cv2.imwrite(os.path.join(ori_dir, f"{i}.jpg"), image)
+        cv2.imwrite(os.path.join(parsing_dir, f"{i}.png"), parsing)
+    return ori_dir
+
+
+def run(method, base_dir, ori_dir, monkeypatch):
+    """返回写入 bc.jpg 之前的背景图（绕开 JPEG 压缩，逐像素比较）"""
+    written = {}
+    monkeypatch.setattr(process.cv2, "imwrite", lambda path, image: written.setdefault(path, image.copy()) is not None)
+    process.extract_background(base_dir, ori_dir, workers=2, method=method)
+    return written[os.path.join(base_dir, "bc.jpg")]
+
+
+def fill_ties(ori_dir):
+    """
+    最近背景像素填充中存在多个等距最近像素的位置（KD-tree 与距离变换在这些位置可能取不同的像素）。
+    按 extract_background 的采样（每 20 帧取 1 帧）重算 max_dist > 5 的背景像素集合。
+    """
+    max_dist = None
+    for image_path in glob.glob(os.path.join(ori_dir, "*.jpg"))[::20]:
+        parsing = cv2.imread(image_path.replace("ori_imgs", "parsing").replace(".jpg", ".png"))
+        dist = ndimage.distance_transform_edt(np.all(parsing == 255, axis=-1))
+        max_dist = dist if max_dist is None else np.maximum(max_dist, dist)
+    bc_pixs = max_dist > 5
+
+    src = np.stack(np.nonzero(bc_pixs), 1)
+    ties = np.zeros(bc_pixs.shape, dtype=bool)
+    for y, x in zip(*np.nonzero(~bc_pixs)):
+        d2 = ((src - (y, x)) ** 2).sum(1)
+        ties[y, x] = (d2 == d2.min()).sum() > 1
+    return ties
+
+
+def test_edt_matches_knn(tmp_path, monkeypatch):
+    base_dir = str(tmp_path)
+    ori_dir = make_clip(base_dir)
+
+    edt = run("edt", base_dir, ori_dir, monkeypatch)
+    knn = run("knn", base_dir, ori_dir, monkeypatch)
+    ties = fill_ties(ori_dir)
+
+    assert edt.shape == knn.shape == (H, W, 3)
+    # 两种方法只在等距并列的最近像素上取法不同，其余像素必须逐位相同
+    assert ties.mean() < 0.05, ties.mean()
+    mismatch = np.any(edt != knn, axis=-1) & ~ties
+    assert not mismatch.any(), np.argwhere(mismatch)[:10]
@@ -0,0 +1,121 @@
+"""
+scripts/train_all.py：在小型合成数据集上以 CPU 跑通 mouth / face / fuse 三个阶段各 2 次迭代（冒烟测试）
+
+没有 GPU 时光栅化走 gaussian_renderer/torch_rasterizer.py，哈希网格编码走 gridencoder.grid_encode_torch；
+LPIPS 需要 torchvision 的 alexnet 预训练权重（已缓存或可下载）。
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("lpips")
+pytest.importorskip("pandas")
+Image = pytest.importorskip("PIL.Image")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+H, W = 128, 128
+NUM_FRAMES = 8
+AU_KEYS = [" AU01_r", " AU04_r", " AU05_r", " AU06_r", " AU07_r", " AU25_r", " AU45_r"]
+
+
+def make_landmarks(rng):
+    """68 点人脸关键点（每点为 [列, 行] 像素坐标，与 ori_imgs/*.lms 一致），嘴唇 48-67 位于图像下半部分"""
+    lms = np.zeros((68, 2), dtype=np.float32)
+    angles = np.linspace(0, 2 * np.pi, 68, endpoint=False)
+    lms[:, 0] = W / 2 + 36 * np.cos(angles)
+    lms[:, 1] = H / 2 + 44 * np.sin(angles)
+    lips = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    lms[48:60, 0] = W / 2 + 20 * np.cos(lips)
+    lms[48:60, 1] = 92 + 10 * np.sin(lips)
+    lms[60:68, 0] = W / 2 + 12 * np.cos(lips[:8])
+    lms[60:68, 1] = 92 + rng.uniform(2, 6) * np.sin(lips[:8])
+    return lms
+
+
+def make_dataset(base_dir):
+    """按 process.py 的输出布局生成 NUM_FRAMES 帧：前 6 帧训练、后 2 帧验证"""
+    rng = np.random.default_rng(0)
+    for name in ("gt_imgs", "torso_imgs", "parsing", "teeth_mask"):
+        os.makedirs(os.path.join(base_dir, name))
+
+    yy, xx = np.mgrid[0:H, 0:W]
+    background = np.stack([xx * 255 // W, yy * 255 // H, np.full_like(xx, 128)], -1).astype(np.uint8)
+    Image.fromarray(background).save(os.path.join(base_dir, "bc.jpg"))
+
+    head = ((xx - W / 2) / 36) ** 2 + ((yy - H / 2) / 44) ** 2 <= 1
+    hair = head & (yy < H / 2 - 24)
+    lms_all = []
+    for i in range(NUM_FRAMES):
+        lms = make_landmarks(rng)
+        lms_all.append(lms)
+        mouth = ((xx - W / 2) / 12) ** 2 + ((yy - 92) / max(lms[60:68, 1].max() - 92, 1)) ** 2 <= 1
+
+        image = background.copy()
+        image[head] = (200, 160, 140)
+        image[hair] = (40, 30, 20)
+        image[mouth] = (120, 20, 30)
+        Image.fromarray(image).save(os.path.join(base_dir, "gt_imgs", f"{i}.jpg"))
+
+        parsing = np.full((H, W, 3), 255, dtype=np.uint8)
+        parsing[head] = (0, 0, 255)
+        parsing[hair] = (0, 0, 0)
+        parsing[mouth] = (100, 100, 100)
+        Image.fromarray(parsing).save(os.path.join(base_dir, "parsing", f"{i}.png"))
+
+        Image.fromarray(np.zeros((H, W, 4), dtype=np.uint8)).save(os.path.join(base_dir, "torso_imgs", f"{i}.png"))
+        np.save(os.path.join(base_dir, "teeth_mask", f"{i}.npy"), np.zeros((H, W), dtype=bool))
+
+    np.save(os.path.join(base_dir, "lms.npy"), np.stack(lms_all))
+    np.save(os.path.join(base_dir, "aud_ds.npy"), rng.standard_normal((NUM_FRAMES, 16, 29)).astype(np.float32))
+
+    au = rng.uniform(0, 2, (NUM_FRAMES, len(AU_KEYS)))
+    with open(os.path.join(base_dir, "au.csv"), "w") as f:
+        f.write("frame," + ",".join(AU_KEYS) + "\n")
+        for i, row in enumerate(au):
+            f.write(f"{i + 1}," + ",".join(f"{v:.3f}" for v in row) + "\n")
+
+    # 相机在 z = 0.5 处看向原点，随机初始点云位于 [-0.1, 0.1]^3
+    c2w = np.eye(4)
+    c2w[2, 3] = 0.5
+    for split, ids in (("train", range(6)), ("val", range(6, NUM_FRAMES))):
+        transforms = {"focal_len": 1.2 * W,
+                      "frames": [{"img_id": i, "transform_matrix": c2w.tolist()} for i in ids]}
+        with open(os.path.join(base_dir, f"transforms_{split}.json"), "w") as f:
+            json.dump(transforms, f)
+
+
+def test_train_all_cpu_smoke(tmp_path):
+    data_dir = str(tmp_path / "data")
+    model_dir = str(tmp_path / "output")
+    os.makedirs(data_dir)
+    make_dataset(data_dir)
+
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="")
+    cmd = [sys.executable, os.path.join(ROOT, "scripts", "train_all.py"), "-s", data_dir, "-m", model_dir,
+           "--iterations", "2", "--gpus", "",
+           "--mouth_args", "--init_num 300",
+           "--face_args", "--init_num 300",
+           "--fuse_args", "--opacity_lr 0.001 --init_num 300"]
+    result = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, timeout=1800)
+
+    logs = {}
+    for stage in ("mouth", "face", "fuse"):
+        log_path = os.path.join(model_dir, "logs", f"train_{stage}.log")
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                logs[stage] = f.read()[-3000:]
+    assert result.returncode == 0, result.stdout + result.stderr + json.dumps(logs, indent=1)
+
+    with open(os.path.join(model_dir, "train_state.json")) as f:
+        state = json.load(f)
+    for stage in ("mouth", "face", "fuse"):
+        assert state[stage]["status"] == "done"
+        assert state[stage]["device"] == "cpu"
+        assert os.path.exists(os.path.join(model_dir, f"chkpnt_{stage}_latest.pth"))
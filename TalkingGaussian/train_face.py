@@ -17,14 +17,13 @@ from utils.loss_utils import l1_loss, l2_loss, patchify, ssim
 from gaussian_renderer import render, render_motion
 import sys
 from scene import Scene, GaussianModel, MotionNetwork
-from utils.general_utils import safe_state
+from utils.general_utils import safe_state, DEVICE, timing_event
 import lpips
 import uuid
 from tqdm import tqdm
 from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams
-from utils.camera_utils import loadCamOnTheFly
 import copy
 
 try:
@@ -53,27 +52,27 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
     gaussians = GaussianModel(dataset.sh_degree)
     scene = Scene(dataset, gaussians)
 
-    motion_net = MotionNetwork(args=dataset).cuda()
+    motion_net = MotionNetwork(args=dataset).to(DEVICE)
     motion_optimizer = torch.optim.AdamW(motion_net.get_params(5e-3, 5e-4), betas=(0.9, 0.99), eps=1e-8)
     scheduler = torch.optim.lr_scheduler.LambdaLR(motion_optimizer, lambda iter: (0.5 ** (iter / mouth_select_iter)) if iter < mouth_select_iter else 0.1 ** (iter / bg_iter))
 
-    lpips_criterion = lpips.LPIPS(net='alex').eval().cuda()
+    lpips_criterion = lpips.LPIPS(net='alex').eval().to(DEVICE)
 
     gaussians.training_setup(opt)
     if checkpoint:
-        (model_params, motion_params, motion_optimizer_params, first_iter) = torch.load(checkpoint)
+        (model_params, motion_params, motion_optimizer_params, first_iter) = torch.load(checkpoint, map_location=DEVICE)
         gaussians.restore(model_params, opt)
         motion_net.load_state_dict(motion_params)
         motion_optimizer.load_state_dict(motion_optimizer_params)
 
     bg_color = [0, 1, 0]   # [1, 1, 1] # if dataset.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    background = torch.tensor(bg_color, dtype=torch.float32, device=DEVICE)
 
 
-    iter_start = torch.cuda.Event(enable_timing = True)
-    iter_end = torch.cuda.Event(enable_timing = True)
+    iter_start = timing_event()
+    iter_end = timing_event()
 
-    viewpoint_stack = None
+    viewpoint_stack = scene.train_sampler()
     ema_loss_for_log = 0.0
     progress_bar = tqdm(range(first_iter, opt.iterations), ascii=True, dynamic_ncols=True, desc="Training progress")
     first_iter += 1
@@ -88,9 +87,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
             gaussians.oneupSHdegree()
 
         # Pick a random Camera
-        if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras().copy()
-        viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+        viewpoint_cam = viewpoint_stack.pop()
 
         # find a big mouth
         mouth_global_lb = viewpoint_cam.talking_dict['mouth_bound'][0]
@@ -115,29 +112,25 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
         if iteration < warm_step:
             if iteration % select_interval == 0:
                 while viewpoint_cam.talking_dict['mouth_bound'][2] < mouth_lb or viewpoint_cam.talking_dict['mouth_bound'][2] > mouth_ub:
-                    if not viewpoint_stack:
-                        viewpoint_stack = scene.getTrainCameras().copy()
-                    viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+                    viewpoint_cam = viewpoint_stack.pop()
 
 
         if warm_step < iteration < mouth_select_iter:
 
             if iteration % select_interval == 0:
                 while viewpoint_cam.talking_dict['blink'] < au_lb or viewpoint_cam.talking_dict['blink'] > au_ub:
-                    if not viewpoint_stack:
-                        viewpoint_stack = scene.getTrainCameras().copy()
-                    viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+                    viewpoint_cam = viewpoint_stack.pop()
 
         if viewpoint_cam.original_image == None:
-            viewpoint_cam = loadCamOnTheFly(copy.deepcopy(viewpoint_cam))
+            viewpoint_cam = scene.load_view(viewpoint_cam)
 
         # Render
         if (iteration - 1) == debug_from:
             pipe.debug = True
 
-        face_mask = torch.as_tensor(viewpoint_cam.talking_dict["face_mask"]).cuda()
-        hair_mask = torch.as_tensor(viewpoint_cam.talking_dict["hair_mask"]).cuda()
-        mouth_mask = torch.as_tensor(viewpoint_cam.talking_dict["mouth_mask"]).cuda()
+        face_mask = torch.as_tensor(viewpoint_cam.talking_dict["face_mask"]).to(DEVICE)
+        hair_mask = torch.as_tensor(viewpoint_cam.talking_dict["hair_mask"]).to(DEVICE)
+        mouth_mask = torch.as_tensor(viewpoint_cam.talking_dict["mouth_mask"]).to(DEVICE)
         head_mask =  face_mask + hair_mask
 
         if iteration > lpips_start_iter:
@@ -154,7 +147,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         image_white, alpha, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["alpha"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
         
-        gt_image  = viewpoint_cam.original_image.cuda() / 255.0
+        gt_image  = viewpoint_cam.original_image.to(DEVICE) / 255.0
         gt_image_white = gt_image * head_mask + background[:, None, None] * ~head_mask
 
         if iteration > motion_stop_iter:
@@ -207,7 +200,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         else:
             # with real bg
-            image = image_white - background[:, None, None] * (1.0 - alpha) + viewpoint_cam.background.cuda() / 255.0 * (1.0 - alpha)
+            image = image_white - background[:, None, None] * (1.0 - alpha) + viewpoint_cam.background.to(DEVICE) / 255.0 * (1.0 - alpha)
 
             Ll1 = l1_loss(image, gt_image)
             loss = Ll1 + opt.lambda_dssim * (1.0 - ssim(image, gt_image))
@@ -331,7 +324,7 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_i
                 psnr_test = 0.0
                 for idx, viewpoint in enumerate(config['cameras']):
                     if viewpoint.original_image == None:
-                        viewpoint = loadCamOnTheFly(copy.deepcopy(viewpoint))
+                        viewpoint = scene.load_view(viewpoint)
                         
                     if renderFunc is render:
                         render_pkg = renderFunc(viewpoint, scene.gaussians, *renderArgs)
@@ -340,10 +333,10 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_i
 
                     image = torch.clamp(render_pkg["render"], 0.0, 1.0)
                     alpha = render_pkg["alpha"]
-                    image = image - renderArgs[1][:, None, None] * (1.0 - alpha) + viewpoint.background.cuda() / 255.0 * (1.0 - alpha)
-                    gt_image = torch.clamp(viewpoint.original_image.to("cuda") / 255.0, 0.0, 1.0)
+                    image = image - renderArgs[1][:, None, None] * (1.0 - alpha) + viewpoint.background.to(DEVICE) / 255.0 * (1.0 - alpha)
+                    gt_image = torch.clamp(viewpoint.original_image.to(DEVICE) / 255.0, 0.0, 1.0)
                     
-                    mouth_mask = torch.as_tensor(viewpoint.talking_dict["mouth_mask"]).cuda()
+                    mouth_mask = torch.as_tensor(viewpoint.talking_dict["mouth_mask"]).to(DEVICE)
                     max_pool = torch.nn.MaxPool2d(kernel_size=3, stride=1, padding=1)
                     mouth_mask_post = (-max_pool(-max_pool(mouth_mask[None].float())))[0].bool()
                     
@@ -387,6 +380,7 @@ if __name__ == "__main__":
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--memory_fraction", type=float, default=0, help="cap on this process's share of GPU memory when stages share a device")
     args = parser.parse_args(sys.argv[1:])
     args.save_iterations.append(args.iterations)
     
@@ -397,6 +391,8 @@ if __name__ == "__main__":
 
     # Start GUI server, configure and run training
     torch.autograd.set_detect_anomaly(args.detect_anomaly)
+    if args.memory_fraction > 0 and torch.cuda.is_available():
+        torch.cuda.set_per_process_memory_fraction(args.memory_fraction)
     training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from)
 
     # All done
@@ -17,14 +17,13 @@ from utils.loss_utils import l1_loss, l2_loss, patchify, ssim
 from gaussian_renderer import render, render_motion, render_motion_mouth
 import sys
 from scene import Scene, GaussianModel, MotionNetwork, MouthMotionNetwork
-from utils.general_utils import safe_state
+from utils.general_utils import safe_state, DEVICE, timing_event
 import lpips
 import uuid
 from tqdm import tqdm
 from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams
-from utils.camera_utils import loadCamOnTheFly
 import copy
 
 try:
@@ -34,7 +33,7 @@ except ImportError:
     TENSORBOARD_FOUND = False
 
 def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from):
-    opt.iterations = 10000
+    opt.iterations = min(opt.iterations, 10000) # fixed 10k unless a shorter run is requested
     opt.densify_until_iter = 0
 
     testing_iterations = [i for i in range(0, opt.iterations + 1, 2000)]
@@ -51,30 +50,30 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
     scene = Scene(dataset, gaussians)
     gaussians_mouth = GaussianModel(dataset.sh_degree)
     with torch.no_grad():
-        motion_net_mouth = MouthMotionNetwork(args=dataset).cuda()
-        motion_net = MotionNetwork(args=dataset).cuda()
+        motion_net_mouth = MouthMotionNetwork(args=dataset).to(DEVICE)
+        motion_net = MotionNetwork(args=dataset).to(DEVICE)
 
     gaussians.training_setup(opt)
     gaussians_mouth.training_setup(opt)
 
-    (model_params, motion_params, _, _) = torch.load(os.path.join(scene.model_path, "chkpnt_face_latest.pth"))
+    (model_params, motion_params, _, _) = torch.load(os.path.join(scene.model_path, "chkpnt_face_latest.pth"), map_location=DEVICE)
     gaussians.restore(model_params, opt)
     motion_net.load_state_dict(motion_params)
 
-    (model_params, motion_params, _, _) = torch.load(os.path.join(scene.model_path, "chkpnt_mouth_latest.pth"))
+    (model_params, motion_params, _, _) = torch.load(os.path.join(scene.model_path, "chkpnt_mouth_latest.pth"), map_location=DEVICE)
     gaussians_mouth.restore(model_params, opt)
     motion_net_mouth.load_state_dict(motion_params)
 
-    lpips_criterion = lpips.LPIPS(net='alex').eval().cuda()
+    lpips_criterion = lpips.LPIPS(net='alex').eval().to(DEVICE)
 
     bg_color = [0, 1, 0]   # [1, 1, 1] # if dataset.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    background = torch.tensor(bg_color, dtype=torch.float32, device=DEVICE)
 
 
-    iter_start = torch.cuda.Event(enable_timing = True)
-    iter_end = torch.cuda.Event(enable_timing = True)
+    iter_start = timing_event()
+    iter_end = timing_event()
 
-    viewpoint_stack = None
+    viewpoint_stack = scene.train_sampler()
     ema_loss_for_log = 0.0
     progress_bar = tqdm(range(first_iter, opt.iterations), ascii=True, dynamic_ncols=True, desc="Training progress")
     first_iter += 1
@@ -84,17 +83,15 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
         iter_start.record()
 
         # Pick a random Camera
-        if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras().copy()
-        viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+        viewpoint_cam = viewpoint_stack.pop()
         if viewpoint_cam.original_image == None:
-            viewpoint_cam = loadCamOnTheFly(copy.deepcopy(viewpoint_cam))
+            viewpoint_cam = scene.load_view(viewpoint_cam)
 
         gaussians.update_learning_rate(iteration)
 
-        face_mask = torch.as_tensor(viewpoint_cam.talking_dict["face_mask"]).cuda()
-        hair_mask = torch.as_tensor(viewpoint_cam.talking_dict["hair_mask"]).cuda()
-        mouth_mask = torch.as_tensor(viewpoint_cam.talking_dict["mouth_mask"]).cuda()
+        face_mask = torch.as_tensor(viewpoint_cam.talking_dict["face_mask"]).to(DEVICE)
+        hair_mask = torch.as_tensor(viewpoint_cam.talking_dict["hair_mask"]).to(DEVICE)
+        mouth_mask = torch.as_tensor(viewpoint_cam.talking_dict["mouth_mask"]).to(DEVICE)
         head_mask = face_mask + hair_mask + mouth_mask
 
         # Render
@@ -109,10 +106,10 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         alpha_mouth = render_pkg_mouth["alpha"]
         alpha = render_pkg["alpha"]
-        mouth_image = render_pkg_mouth["render"] - background[:, None, None] * (1.0 - alpha_mouth) + viewpoint_cam.background.cuda() / 255.0 * (1.0 - alpha_mouth)
+        mouth_image = render_pkg_mouth["render"] - background[:, None, None] * (1.0 - alpha_mouth) + viewpoint_cam.background.to(DEVICE) / 255.0 * (1.0 - alpha_mouth)
         image = render_pkg["render"] - background[:, None, None] * (1.0 - alpha) + mouth_image * (1.0 - alpha)
                 
-        gt_image  = viewpoint_cam.original_image.cuda() / 255.0
+        gt_image  = viewpoint_cam.original_image.to(DEVICE) / 255.0
         gt_image_white = gt_image * head_mask + background[:, None, None] * ~head_mask
 
         if iteration > bg_iter:
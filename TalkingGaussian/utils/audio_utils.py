@@ -32,4 +32,27 @@ def get_audio_features(features, att_mode, index):
             auds = torch.cat([auds, torch.zeros_like(auds[:pad_right])], dim=0) # [8, 16]
         return auds
     else:
-        raise NotImplementedError(f'wrong att_mode: {att_mode}')
\ No newline at end of file
+        raise NotImplementedError(f'wrong att_mode: {att_mode}')
+
+def get_audio_windows(features, att_mode=2, device=None):
+    """
+    一次性生成全部帧的音频窗口，windows[index] 与 get_audio_features(features, att_mode, index) 相同
+    （index 取 0..N，N = features.shape[0]）。
+    features 只在两端补零后拷贝到 device 一次（调用方传入 data_device；None 时保持 features 所在设备），
+    窗口由 unfold 得到，均为同一存储上的视图，相机按帧索引取用，无需逐帧切片与拼接。
+    返回 [N+1, 8, C, 16]（att_mode 0 时为 [N, 1, C, 16]）
+    """
+    if device is not None:
+        features = features.to(device)
+    if att_mode == 0:
+        return features.unsqueeze(1)
+    elif att_mode == 1:
+        pad_left, pad_right = 8, 0
+    elif att_mode == 2:
+        pad_left, pad_right = 4, 4
+    else:
+        raise NotImplementedError(f'wrong att_mode: {att_mode}')
+    padded = torch.cat([features.new_zeros(pad_left, *features.shape[1:]), features,
+                        features.new_zeros(pad_right, *features.shape[1:])], dim=0)
+    # unfold: [N+1, C, 16, 8]，窗口维移到第 1 维
+    return padded.unfold(0, 8, 1).movedim(-1, 1)
@@ -13,6 +13,7 @@ from scene.cameras import Camera
 import torch
 import numpy as np
 import os
+import copy
 from PIL import Image
 from utils.general_utils import PILtoTorch
 from utils.graphics_utils import fov2focal
@@ -70,28 +71,55 @@ def camera_to_JSON(id, camera : Camera):
     return camera_entry
 
 
-def loadCamOnTheFly(camera):
-    image_path = camera.image_path
+def loadFrameOnTheFly(image_path, bg_img=None):
+    """
+    读取一帧训练数据（CPU 张量）：gt 图像、背景（torso 叠加 bc.jpg）与脸/头发/嘴部掩码
+    bg_img: 预先读取的 bc.jpg（[3, H, W]），缺省时按 image_path 所在数据集读取
+    """
     image = Image.open(image_path)
     image = np.array(image.convert("RGB"))
 
-    bg_img = PILtoTorch(np.array(Image.open(os.path.join("/".join(image_path.split("/")[:-2]), 'bc.jpg')).convert("RGB"))).to(camera.data_device)
+    if bg_img is None:
+        bg_img = PILtoTorch(np.array(Image.open(os.path.join("/".join(image_path.split("/")[:-2]), 'bc.jpg')).convert("RGB")))
     torso_img_path = image_path.replace("gt_imgs", "torso_imgs").replace("jpg", "png")
-    torso_img = PILtoTorch(np.array(Image.open(torso_img_path).convert("RGBA")) * 1.0).to(camera.data_device)
+    torso_img = PILtoTorch(np.array(Image.open(torso_img_path).convert("RGBA")) * 1.0)
     bg = torso_img[:3] * torso_img[3:] / 255 + bg_img * (1.0 - torso_img[3:] / 255)
 
     teeth_mask_path = image_path.replace("gt_imgs", "teeth_mask").replace("jpg", "npy")
-    teeth_mask = torch.as_tensor(np.load(teeth_mask_path)).to(camera.data_device)
+    teeth_mask = torch.as_tensor(np.load(teeth_mask_path))
 
     mask_path = image_path.replace("gt_imgs", "parsing").replace("jpg", "png")
-    mask = PILtoTorch(np.array(Image.open(mask_path).convert("RGB")) * 1.0).to(camera.data_device)
-    camera.talking_dict['face_mask'] = (mask[2] > 254) * (mask[0] == 0) * (mask[1] == 0) ^ teeth_mask
-    camera.talking_dict['hair_mask'] = (mask[0] < 1) * (mask[1] < 1) * (mask[2] < 1)
-    camera.talking_dict['mouth_mask'] = (mask[0] == 100) * (mask[1] == 100) * (mask[2] == 100) + teeth_mask
-    
-    camera.original_image = PILtoTorch(image).type("torch.ByteTensor").clamp(0, 255).to(camera.data_device)
-    camera.background = bg.type("torch.ByteTensor").clamp(0, 255).to(camera.data_device)
+    mask = PILtoTorch(np.array(Image.open(mask_path).convert("RGB")) * 1.0)
+    return {
+        'image': PILtoTorch(image).type("torch.ByteTensor").clamp(0, 255),
+        'background': bg.type("torch.ByteTensor").clamp(0, 255),
+        'face_mask': (mask[2] > 254) * (mask[0] == 0) * (mask[1] == 0) ^ teeth_mask,
+        'hair_mask': (mask[0] < 1) * (mask[1] < 1) * (mask[2] < 1),
+        'mouth_mask': (mask[0] == 100) * (mask[1] == 100) * (mask[2] == 100) + teeth_mask,
+    }
+
+
+def applyFrame(camera, frame):
+    """把 loadFrameOnTheFly 的结果（已在目标设备上）填入相机"""
+    for key in ('face_mask', 'hair_mask', 'mouth_mask'):
+        camera.talking_dict[key] = frame[key]
+    camera.original_image = frame['image']
+    camera.background = frame['background']
     camera.image_width = camera.original_image.shape[2]
     camera.image_height = camera.original_image.shape[1]
-    
     return camera
+
+
+def copyCamera(camera):
+    """
+    按帧填充数据前的相机副本：talking_dict 单独复制，其余张量与原相机共享。
+    不用 deepcopy，音频窗口是整段音频特征上的视图，deepcopy 会把整段特征复制一遍
+    """
+    view = copy.copy(camera)
+    view.talking_dict = dict(camera.talking_dict)
+    return view
+
+
+def loadCamOnTheFly(camera):
+    frame = loadFrameOnTheFly(camera.image_path)
+    return applyFrame(camera, {key: value.to(camera.data_device) for key, value in frame.items()})
@@ -0,0 +1,115 @@
+#
+# 流式对话的增量音频特征
+#
+# 逐段调用 extract_ds_features.py 时，每个 1~2s 的音频段都要启动子进程并加载 DeepSpeech，
+# 而且每段单独提取、单独渲染，8 帧音频注意力窗口在每个分段接缝处补零，口型在接缝处出错。
+# FeatureStream 由常驻渲染服务持有（模型只加载一次），累积整段回复的音频：
+#   - append() 追加新音频，update() 只对尾部 [已定稿帧 - context, 末尾] 重新提取，每次开销与回复总长无关；
+#   - 末尾 lookahead 帧还缺少后文（DeepSpeech 双向 RNN 与 16 帧窗口都要看后文），暂不定稿；
+#   - 已定稿的帧不再改变，整段特征写入同一个 .npy，各分段按 start_frame 取自己的帧，
+#     注意力窗口跨越接缝取真实的前后帧。
+#
+
+import os
+import math
+import threading
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+SAMPLE_RATE = 16000
+FPS = 25
+
+_extractors = {}
+_extractors_lock = threading.Lock()
+
+
+def _load_deepspeech():
+    from data_utils.deepspeech_features.deepspeech_store import get_deepspeech_model_file
+    from data_utils.deepspeech_features.deepspeech_features import DeepSpeechExtractor
+    model = DeepSpeechExtractor(get_deepspeech_model_file())
+    return lambda pcm: model(pcm, SAMPLE_RATE)
+
+
+def _load_hubert():
+    from data_utils.hubert import get_hubert_features
+    return lambda pcm: get_hubert_features(pcm.astype(np.float32) / 32768.0)
+
+
+def get_extractor(audio_extractor):
+    """常驻的特征提取模型，每种只加载一次；输入 16k int16 音频，输出 [帧数, ...] 特征（25fps）"""
+    with _extractors_lock:
+        if audio_extractor not in _extractors:
+            if audio_extractor == 'deepspeech':
+                _extractors[audio_extractor] = _load_deepspeech()
+            elif audio_extractor == 'hubert':
+                _extractors[audio_extractor] = _load_hubert()
+            else:
+                raise NotImplementedError(f'streaming features are not supported for {audio_extractor}')
+        return _extractors[audio_extractor]
+
+
+class FeatureStream:
+    def __init__(self, feature_file, audio_extractor='deepspeech', context=3.0, lookahead=8, extractor=None):
+        """
+        feature_file: 整段回复累积的特征文件（每次 update 原子替换）
+        context: 重新提取时带上的已定稿音频（秒），给双向 RNN 提供前文
+        lookahead: 末尾暂不定稿的帧数
+        """
+        self.feature_file = feature_file
+        self.extractor = extractor or get_extractor(audio_extractor)
+        self.context_frames = int(round(context * FPS))
+        self.lookahead = lookahead
+        self.sample_rate = None
+        self.audio = np.zeros(0, dtype=np.int16)
+        self.features = None
+        self.lock = threading.Lock()
+
+    @property
+    def num_frames(self):
+        return 0 if self.features is None else self.features.shape[0]
+
+    def append(self, pcm, sample_rate):
+        """pcm: int16 单声道"""
+        with self.lock:
+            if self.sample_rate is None:
+                self.sample_rate = sample_rate
+            elif sample_rate != self.sample_rate:
+                raise ValueError(f'sample rate changed within a stream: {self.sample_rate} -> {sample_rate}')
+            self.audio = np.concatenate([self.audio, np.asarray(pcm, dtype=np.int16)])
+
+    def append_wav(self, path):
+        sample_rate, pcm = wavfile.read(path)
+        if pcm.ndim != 1:
+            pcm = pcm[:, 0]
+        self.append(pcm, sample_rate)
+
+    def update(self, final=False):
+        """提取新到的音频，返回已定稿的帧数；final=True 时音频已结束，全部定稿（末尾补零与离线提取一致）"""
+        with self.lock:
+            if self.sample_rate is None:
+                return self.num_frames
+            frame_len = self.sample_rate / FPS
+            total = self.audio.shape[0] / frame_len
+            target = math.ceil(total - 1e-6) if final else int(total) - self.lookahead
+            done = self.num_frames
+            if target <= done:
+                return done
+
+            start = max(0, done - self.context_frames)
+            pcm = self.audio[int(round(start * frame_len)):]
+            if self.sample_rate != SAMPLE_RATE:
+                pcm = np.clip(resample_poly(pcm.astype(np.float32), SAMPLE_RATE, self.sample_rate), -32768, 32767)
+            feats = np.asarray(self.extractor(pcm.astype(np.int16)), dtype=np.float32)
+            if feats.shape[0] < target - start:
+                # 尾部不足一帧的音频（与 fix_feature_length 一样按帧数向上取整）
+                pad = np.zeros((target - start - feats.shape[0], *feats.shape[1:]), dtype=np.float32)
+                feats = np.concatenate([feats, pad])
+            new = feats[done - start:target - start]
+            self.features = new if self.features is None else np.concatenate([self.features, new])
+
+            tmp = self.feature_file[:-len('.npy')] + '.tmp.npy'
+            np.save(tmp, self.features)
+            os.replace(tmp, self.feature_file)
+            return self.num_frames
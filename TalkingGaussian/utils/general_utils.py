@@ -11,10 +11,26 @@
 
 import torch
 import sys
+import time
 from datetime import datetime
 import numpy as np
 import random
 
+# 训练所用设备：没有可用 GPU（如 CUDA_VISIBLE_DEVICES=""）时退回 CPU，
+# CPU 上光栅化、哈希网格编码与初始化 KNN 使用纯 PyTorch 实现，只适合极少迭代的冒烟测试
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+class _WallClockEvent:
+    """CPU 上代替 torch.cuda.Event(enable_timing=True)：record() 记录时刻，elapsed_time() 返回毫秒"""
+    def record(self):
+        self.time = time.perf_counter()
+
+    def elapsed_time(self, end):
+        return (end.time - self.time) * 1000.0
+
+def timing_event():
+    return torch.cuda.Event(enable_timing=True) if DEVICE.type == "cuda" else _WallClockEvent()
+
 def inverse_sigmoid(x):
     return torch.log(x/(1-x))
 
@@ -69,7 +85,7 @@ def get_expon_lr_func(
     return helper
 
 def strip_lowerdiag(L):
-    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device="cuda")
+    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device=L.device)
 
     uncertainty[:, 0] = L[:, 0, 0]
     uncertainty[:, 1] = L[:, 0, 1]
@@ -87,7 +103,7 @@ def build_rotation(r):
 
     q = r / norm[:, None]
 
-    R = torch.zeros((q.size(0), 3, 3), device='cuda')
+    R = torch.zeros((q.size(0), 3, 3), device=q.device)
 
     r = q[:, 0]
     x = q[:, 1]
@@ -106,7 +122,7 @@ def build_rotation(r):
     return R
 
 def build_scaling_rotation(s, r):
-    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device="cuda")
+    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device=s.device)
     R = build_rotation(r)
 
     L[:,0,0] = s[:,0]
@@ -137,4 +153,5 @@ def safe_state(silent):
     random.seed(0)
     np.random.seed(0)
     torch.manual_seed(0)
-    torch.cuda.set_device(torch.device("cuda:0"))
+    if torch.cuda.is_available():
+        torch.cuda.set_device(torch.device("cuda:0"))
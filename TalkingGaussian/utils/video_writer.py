@@ -0,0 +1,96 @@
+#
+# 逐帧写入 ffmpeg 的视频编码器
+#
+# 帧经有界队列交给后台线程写入 ffmpeg stdin，渲染与编码并行，内存中最多 queue_size 帧；
+# 指定 audio 时音轨在同一次编码中合成（以较短的一路为准）。
+#
+
+import queue
+import subprocess
+import threading
+
+
+class FFmpegFrameWriter:
+    """把 [H, W, 3] uint8 RGB 帧流式编码为 mp4；首帧决定分辨率"""
+
+    def __init__(self, path, fps=25, crf=18, preset="veryfast", queue_size=32, audio=None):
+        self.path = path
+        self.audio = audio
+        self.fps = fps
+        self.crf = crf
+        self.preset = preset
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.proc = None
+        self.thread = None
+        self.error = None
+        self.num_frames = 0
+
+    def _start(self, height, width):
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}", "-r", str(self.fps),
+            "-i", "-",
+        ]
+        if self.audio is not None:
+            cmd += ["-i", self.audio, "-map", "0:v", "-map", "1:a", "-c:a", "aac", "-shortest"]
+        cmd += [
+            # libx264 + yuv420p 要求宽高为偶数
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p",
+            self.path,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.proc.stdin.write(frame.tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self.error = e
+
+    def write(self, frame):
+        if self.proc is None:
+            self._start(frame.shape[0], frame.shape[1])
+        if self.error is not None:
+            raise RuntimeError(f"ffmpeg writer failed for {self.path}: {self.error}")
+        self.queue.put(frame)
+        self.num_frames += 1
+
+    def close(self):
+        """等待队列中的帧编码完成；ffmpeg 失败时抛出 RuntimeError"""
+        if self.proc is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.proc.stdin.close()
+        stderr = self.proc.stderr.read().decode("utf-8", "ignore")
+        if self.proc.wait() != 0 or self.error is not None:
+            raise RuntimeError(f"ffmpeg writer failed for {self.path}: {self.error or stderr}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self.proc is not None:
+            # 出错时直接终止 ffmpeg，不再等待队列中的帧，也不抛出新的异常掩盖原异常
+            self.proc.kill()
+            self.queue.put(None)
+            self.thread.join()
+            self.proc.wait()
+            for pipe in (self.proc.stdin, self.proc.stderr):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+        return False
@@ -1,9 +1,15 @@
 from flask import Flask, render_template, request, jsonify
 import os
-import threading
+import time
+import uuid
+import shutil
 from backend.video_generator import generate_video
 from backend.model_trainer import train_model
 from backend.chat_engine import chat_response
+from backend.stream_pipeline import start_chat_stream, stream_sessions
+from backend.job_queue import job_queue, QUEUED, RUNNING, SUCCESS
+from backend.workspace import create_workspace, cleanup_workspaces, snapshot_input_audio, touch_workspace
+from backend import asr_service
 
 app = Flask(__name__)
 
@@ -40,44 +46,39 @@ def video_generation():
             "inference_params": inference_params if inference_params else {}  # 方案二：渲染细节等级
         }
 
-        video_path = generate_video(data)
-        return jsonify({'status': 'success', 'video_path': video_path})
+        # 渲染在后台任务队列中执行，立即返回任务 ID，前端轮询 /jobs/<job_id>
+        job_id = job_queue.submit('video_generation', data, gpu=data.get('gpu_choice'))
+        return jsonify({'status': 'queued', 'job_id': job_id})
 
     return render_template('video_generation.html')
 
 
-# 训练任务状态存储（简单实现，生产环境应使用Redis等）
-training_tasks = {}
+def run_video_generation(data):
+    video_path = generate_video(data)
+    return {'status': 'success', 'video_path': video_path}
 
 
-def train_model_async(data, task_id):
-    """异步执行训练任务"""
-    try:
-        result = train_model(data)
-        if isinstance(result, dict):
-            training_tasks[task_id] = {
-                'status': result.get('status', 'error'),
-                'model_path': result.get('model_path'),
-                'message': result.get('message', ''),
-                'preview_video': result.get('preview_video'),
-                'reference_audio': result.get('reference_audio'),
-                'reference_audio_short': result.get('reference_audio_short')
-            }
-        else:
-            # 兼容旧返回：只返回路径则认为成功
-            training_tasks[task_id] = {
-                'status': 'success',
-                'model_path': result,
-                'message': f'训练完成，模型路径：{result}',
-                'preview_video': None,
-                'reference_audio': None,
-                'reference_audio_short': None
-            }
-    except Exception as e:
-        training_tasks[task_id] = {
-            'status': 'error',
-            'message': f'训练失败：{str(e)}'
+def run_training(data):
+    """训练任务：把 train_model 的返回值整理为统一格式"""
+    result = train_model(data)
+    if isinstance(result, dict):
+        return {
+            'status': result.get('status', 'error'),
+            'model_path': result.get('model_path'),
+            'message': result.get('message', ''),
+            'preview_video': result.get('preview_video'),
+            'reference_audio': result.get('reference_audio'),
+            'reference_audio_short': result.get('reference_audio_short')
         }
+    # 兼容旧返回：只返回路径则认为成功
+    return {
+        'status': 'success',
+        'model_path': result,
+        'message': f'训练完成，模型路径：{result}',
+        'preview_video': None,
+        'reference_audio': None,
+        'reference_audio_short': None
+    }
 
 
 # 模型训练界面
@@ -92,14 +93,8 @@ def model_training():
             "custom_params": request.form.get('custom_params')
         }
 
-        # 生成任务ID
-        import time
-        task_id = f"train_{int(time.time())}"
-
-        # 启动异步训练任务
-        thread = threading.Thread(target=train_model_async, args=(data, task_id))
-        thread.daemon = True
-        thread.start()
+        # 提交到任务队列（同一 GPU 上的训练任务依次执行）
+        task_id = job_queue.submit('training', data, gpu=data.get('gpu_choice'))
 
         # 立即返回，告诉前端训练已开始
         return jsonify({
@@ -114,73 +109,188 @@ def model_training():
 # 训练状态查询接口
 @app.route('/training_status/<task_id>', methods=['GET'])
 def training_status(task_id):
-    """查询训练任务状态"""
-    if task_id in training_tasks:
-        return jsonify(training_tasks[task_id])
-    else:
+    """查询训练任务状态（兼容旧接口，完整信息见 /jobs/<job_id>）"""
+    job = job_queue.get(task_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在'})
+    if job['status'] in (QUEUED, RUNNING):
+        message = '训练排队中...' if job['status'] == QUEUED else '训练进行中...'
         return jsonify({
             'status': 'running',
-            'message': '训练进行中...'
+            'message': message,
+            'stage': job['stage'],
+            'progress': f"{job['progress'] * 100:.0f}%" if job['progress'] else None
         })
+    if job['status'] == SUCCESS:
+        return jsonify(job['result'])
+    return jsonify({'status': 'error', 'message': job['message']})
+
+
+AUDIO_DIR = './static/audios'
+DEFAULT_INPUT_AUDIO = './static/audios/input.wav'
+
+
+def attach_workspace(data, prefix):
+    """为对话请求创建独立工作目录，并把录音复制进去（排队期间的新录音不会影响本请求）"""
+    # 清理过期目录：排队中、运行中的任务与未结束的流式会话仍在使用的目录保留
+    in_use = job_queue.active_params('workspace')
+    in_use.update(session.work_dir for session in list(stream_sessions.values()) if not session.finished)
+    cleanup_workspaces(keep=in_use)
+    workspace = create_workspace(prefix)
+    data['workspace'] = workspace
+    data['input_audio'] = snapshot_input_audio(workspace, data.get('input_audio'))
+    return data
+
+
+def parse_chat_form():
+    """解析实时对话表单参数（/chat_system 与 /chat_stream 共用）"""
+    # 获取 CosyVoice 参数（语言类型和语速）
+    language = request.form.get('language', 'zh')
+    speed = request.form.get('speed', '1.0')
+
+    # 验证和格式化 speed 参数
+    try:
+        speed_float = float(speed)
+        if speed_float < 0.5 or speed_float > 2.0:
+            print(f"[app] 警告：speed={speed_float} 不在有效范围 [0.5, 2.0] 内，使用默认值 1.0")
+            speed_float = 1.0
+    except ValueError:
+        print(f"[app] 警告：speed={speed} 不是有效数字，使用默认值 1.0")
+        speed_float = 1.0
+
+    cosyvoice_params = {
+        'language': language if language in ['zh', 'en'] else 'zh',
+        'speed': speed_float  # 方案一：语速调节
+    }
+
+    # 获取推理参数（方案二：渲染细节等级）
+    sh_degree = request.form.get('sh_degree')
+    inference_params = {}
+    if sh_degree:
+        try:
+            sh_degree_int = int(sh_degree)
+            if sh_degree_int in [0, 1, 2, 3]:
+                inference_params['sh_degree'] = sh_degree_int
+        except ValueError:
+            print(f"[app] 警告：sh_degree={sh_degree} 不是有效整数，使用默认值")
+
+    # 本次录音：前端提交 /save_audio 返回的路径，缺省为最近一次录音；只接受 static/audios 下的文件
+    input_audio = request.form.get('input_audio') or DEFAULT_INPUT_AUDIO
+    if not os.path.abspath(input_audio).startswith(os.path.abspath(AUDIO_DIR) + os.sep):
+        print(f"[app] 警告：input_audio={input_audio} 不在 {AUDIO_DIR} 下，使用默认录音")
+        input_audio = DEFAULT_INPUT_AUDIO
+
+    data = {
+        "model_name": request.form.get('model_name'),
+        "model_param": request.form.get('model_param'),
+        "input_audio": input_audio,
+        # 渲染所用 GPU，同时决定任务进入哪块 GPU 的渲染队列
+        "gpu_choice": request.form.get('gpu_choice') or 'GPU0',
+        # 录音时流式识别的结果（/asr_stream），有则跳过对录音文件的识别
+        "recognized_text": asr_service.pop_result(request.form.get('asr_session_id', '')),
+        # 新的语音克隆参数格式
+        "voice_clone_type": request.form.get('voice_clone_type'),  # current_recording / preset_voice / custom
+        "preset_voice_name": request.form.get('preset_voice_name'),  # 预设音色名称
+        "custom_voice_file": request.form.get('custom_voice_file'),  # 自定义音频文件名（上传后返回的文件名）
+        "custom_voice_path": request.form.get('custom_voice_path'),  # 自定义音频完整路径（手动输入）
+        # 保留旧参数以兼容（如果前端还未更新）
+        "voice_clone": request.form.get('voice_clone'),
+        "api_choice": request.form.get('api_choice'),
+        # CosyVoice 参数
+        "cosyvoice_params": cosyvoice_params,  # 语言类型选择
+        # TalkingGaussian 推理参数
+        "inference_params": inference_params if inference_params else {}  # 方案二：渲染细节等级
+    }
+    return data
 
 
 # 实时对话系统界面
 @app.route('/chat_system', methods=['GET', 'POST'])
 def chat_system():
     if request.method == 'POST':
-        # 获取 CosyVoice 参数（语言类型和语速）
-        language = request.form.get('language', 'zh')
-        speed = request.form.get('speed', '1.0')
+        data = attach_workspace(parse_chat_form(), 'chat')
 
-        # 验证和格式化 speed 参数
-        try:
-            speed_float = float(speed)
-            if speed_float < 0.5 or speed_float > 2.0:
-                print(f"[app] 警告：speed={speed_float} 不在有效范围 [0.5, 2.0] 内，使用默认值 1.0")
-                speed_float = 1.0
-        except ValueError:
-            print(f"[app] 警告：speed={speed} 不是有效数字，使用默认值 1.0")
-            speed_float = 1.0
+        job_id = job_queue.submit('chat', data, gpu=data['gpu_choice'])
+        return jsonify({'status': 'queued', 'job_id': job_id})
 
-        cosyvoice_params = {
-            'language': language if language in ['zh', 'en'] else 'zh',
-            'speed': speed_float  # 方案一：语速调节
-        }
-
-        # 获取推理参数（方案二：渲染细节等级）
-        sh_degree = request.form.get('sh_degree')
-        inference_params = {}
-        if sh_degree:
-            try:
-                sh_degree_int = int(sh_degree)
-                if sh_degree_int in [0, 1, 2, 3]:
-                    inference_params['sh_degree'] = sh_degree_int
-            except ValueError:
-                print(f"[app] 警告：sh_degree={sh_degree} 不是有效整数，使用默认值")
+    return render_template('chat_system.html')
 
-        data = {
-            "model_name": request.form.get('model_name'),
-            "model_param": request.form.get('model_param'),
-            # 新的语音克隆参数格式
-            "voice_clone_type": request.form.get('voice_clone_type'),  # current_recording / preset_voice / custom
-            "preset_voice_name": request.form.get('preset_voice_name'),  # 预设音色名称
-            "custom_voice_file": request.form.get('custom_voice_file'),  # 自定义音频文件名（上传后返回的文件名）
-            "custom_voice_path": request.form.get('custom_voice_path'),  # 自定义音频完整路径（手动输入）
-            # 保留旧参数以兼容（如果前端还未更新）
-            "voice_clone": request.form.get('voice_clone'),
-            "api_choice": request.form.get('api_choice'),
-            # CosyVoice 参数
-            "cosyvoice_params": cosyvoice_params,  # 语言类型选择
-            # TalkingGaussian 推理参数
-            "inference_params": inference_params if inference_params else {}  # 方案二：渲染细节等级
-        }
 
+def run_chat(data):
+    touch_workspace(data.get('workspace'))
+    try:
         video_path = chat_response(data)
-        video_path = "/" + video_path.replace("\\", "/")
+    finally:
+        touch_workspace(data.get('workspace'))
+    video_path = "/" + video_path.replace("\\", "/")
+    return {'status': 'success', 'video_path': video_path}
 
-        return jsonify({'status': 'success', 'video_path': video_path})
 
-    return render_template('chat_system.html')
+# 流式对话：立即返回 HLS 播放列表，视频分段边生成边播放
+@app.route('/chat_stream', methods=['POST'])
+def chat_stream():
+    result = start_chat_stream(attach_workspace(parse_chat_form(), 'stream'))
+    return jsonify(result)
+
+
+# 流式对话状态查询接口
+@app.route('/chat_stream_status/<session_id>', methods=['GET'])
+def chat_stream_status(session_id):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({'status': 'error', 'message': '会话不存在'})
+    return jsonify(session.status())
+
+
+# 后台任务查询：状态、阶段、进度与结果
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    kind = request.args.get('kind')
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'status': 'success', 'jobs': job_queue.list(kind, limit)})
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+    return jsonify(job)
+
+
+# 流式语音识别：录音过程中上传 16kHz 单声道 16bit PCM 分块
+@app.route('/asr_stream/start', methods=['POST'])
+def asr_stream_start():
+    try:
+        session_id = asr_service.start_session()
+    except Exception as e:
+        print(f"[app] 流式识别不可用: {e}")
+        return jsonify({'status': 'error', 'message': f'流式识别不可用: {e}'})
+    return jsonify({'status': 'success', 'session_id': session_id, 'sample_rate': asr_service.SAMPLE_RATE})
+
+
+@app.route('/asr_stream/<session_id>/chunk', methods=['POST'])
+def asr_stream_chunk(session_id):
+    partial = asr_service.feed_session(session_id, request.get_data())
+    if partial is None:
+        return jsonify({'status': 'error', 'message': '识别会话不存在'}), 404
+    return jsonify({'status': 'success', 'partial': partial})
+
+
+@app.route('/asr_stream/<session_id>/finish', methods=['POST'])
+def asr_stream_finish(session_id):
+    text = asr_service.finish_session(session_id)
+    if text is None:
+        return jsonify({'status': 'error', 'message': '识别会话不存在'}), 404
+    return jsonify({'status': 'success', 'text': text})
 
 
 @app.route('/save_audio', methods=['POST'])
@@ -193,18 +303,17 @@ def save_audio():
         return jsonify({'status': 'error', 'message': '没有选择文件'})
 
     # 确保目录存在
-    os.makedirs('./static/audios', exist_ok=True)
+    os.makedirs(AUDIO_DIR, exist_ok=True)
 
-    # 保存文件（固定名称，供后续流程使用）
-    input_path = './static/audios/input.wav'
-    audio_file.save(input_path)
-
-    # 同时保存一个带时间戳的副本（用于历史记录）
-    import time
+    # 每次录音保存为唯一文件名，对话请求通过该路径引用本次录音
     timestamp = time.strftime('%Y%m%d_%H%M%S')
-    timestamped_path = f'./static/audios/input_{timestamp}.wav'
-    import shutil
-    shutil.copy(input_path, timestamped_path)
+    timestamped_path = f'{AUDIO_DIR}/input_{timestamp}_{uuid.uuid4().hex[:6]}.wav'
+    audio_file.save(timestamped_path)
+
+    # 同时更新固定名称的最近一次录音（兼容未提交 input_audio 的旧前端）
+    tmp_path = f'{DEFAULT_INPUT_AUDIO}.{uuid.uuid4().hex[:6]}.tmp'
+    shutil.copy(timestamped_path, tmp_path)
+    os.replace(tmp_path, DEFAULT_INPUT_AUDIO)
 
     return jsonify({
         'status': 'success',
@@ -291,6 +400,14 @@ def upload_au():
     })
 
 
+job_queue.register('video_generation', run_video_generation)
+job_queue.register('training', run_training)
+job_queue.register('chat', run_chat)
+# debug 模式下 reloader 父进程只监视文件变化，由实际提供服务的子进程恢复排队中的任务
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    job_queue.recover()
+
+
 if __name__ == '__main__':
     # host='0.0.0.0' 允许从外部访问（华为云服务器需要）
     # debug=True 开发模式，生产环境应设置为False
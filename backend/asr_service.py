@@ -0,0 +1,150 @@
+"""
+Vosk 语音识别服务
+
+- 模型缓存：每个 Vosk 模型目录在进程内只加载一次（原先每次识别都重新构造 vosk.Model）；
+- 流式识别：录音过程中浏览器把 16kHz 单声道 16bit PCM 分块上传，服务端即时送入
+  KaldiRecognizer.AcceptWaveform，停止录音时只需 FinalResult，识别结果几乎立即可用。
+  PCM 由浏览器 AudioContext 直接采集，服务端无需再解码 WebM/Opus。
+"""
+
+import os
+import json
+import time
+import uuid
+import wave
+import threading
+
+SAMPLE_RATE = 16000
+# 超过该时长（秒）无数据的流式会话会被清理
+SESSION_TIMEOUT = 300
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def default_model_dir():
+    """Vosk 模型目录：VOSK_MODEL_DIR，缺省中文模型，不存在时使用英文模型"""
+    model_dir = os.getenv('VOSK_MODEL_DIR', './CosyVoice/asset/vosk-model-small-cn-0.22')
+    if not os.path.exists(model_dir):
+        model_dir = './CosyVoice/asset/vosk-model-small-en-us-0.15'
+        print(f"[ASR] 中文模型不存在，使用英文模型: {model_dir}")
+    return model_dir
+
+
+def get_model(model_dir=None):
+    """返回缓存的 vosk.Model，首次使用时加载"""
+    model_dir = os.path.abspath(model_dir or default_model_dir())
+    with _models_lock:
+        model = _models.get(model_dir)
+        if model is None:
+            try:
+                from vosk import Model
+            except ImportError:
+                raise RuntimeError("Vosk未安装，请运行: pip install vosk>=0.3.45")
+            if not os.path.isdir(model_dir):
+                raise RuntimeError(f"Vosk模型目录不存在: {model_dir}")
+            start = time.time()
+            model = Model(model_dir)
+            _models[model_dir] = model
+            print(f"[ASR] Vosk模型已加载: {model_dir} ({time.time() - start:.1f}s)")
+    return model
+
+
+def new_recognizer(model_dir=None, sample_rate=SAMPLE_RATE):
+    from vosk import KaldiRecognizer
+    return KaldiRecognizer(get_model(model_dir), sample_rate)
+
+
+class RecognizerSession:
+    """一次录音的流式识别状态"""
+
+    def __init__(self, model_dir=None, sample_rate=SAMPLE_RATE):
+        self.recognizer = new_recognizer(model_dir, sample_rate)
+        self.parts = []
+        self.partial = ''
+        self.lock = threading.Lock()
+        self.last_active = time.time()
+
+    def accept(self, pcm_bytes):
+        """送入一段 PCM，返回当前的部分识别结果"""
+        with self.lock:
+            self.last_active = time.time()
+            if self.recognizer.AcceptWaveform(pcm_bytes):
+                text = json.loads(self.recognizer.Result()).get('text')
+                if text:
+                    self.parts.append(text)
+                self.partial = ''
+            else:
+                self.partial = json.loads(self.recognizer.PartialResult()).get('partial', '')
+            return ' '.join(self.parts + [self.partial]).strip()
+
+    def finish(self):
+        with self.lock:
+            text = json.loads(self.recognizer.FinalResult()).get('text')
+            if text:
+                self.parts.append(text)
+            return ' '.join(t for t in self.parts if t).strip()
+
+
+def transcribe_wav(wav16k_path, model_dir=None):
+    """识别 16kHz 单声道 wav 文件"""
+    session = RecognizerSession(model_dir)
+    with wave.open(wav16k_path, 'rb') as w:
+        while True:
+            data = w.readframes(4000)
+            if not data:
+                break
+            session.accept(data)
+    return session.finish()
+
+
+_sessions = {}
+# 已完成的流式识别结果，对话请求通过 session_id 取用
+_results = {}
+_sessions_lock = threading.Lock()
+
+
+def start_session(model_dir=None):
+    _cleanup()
+    session_id = uuid.uuid4().hex
+    session = RecognizerSession(model_dir)
+    with _sessions_lock:
+        _sessions[session_id] = session
+    return session_id
+
+
+def feed_session(session_id, pcm_bytes):
+    """返回部分识别结果；会话不存在返回 None"""
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    if session is None:
+        return None
+    return session.accept(pcm_bytes)
+
+
+def finish_session(session_id):
+    """结束会话并返回完整识别结果；会话不存在返回 None"""
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session is None:
+        return None
+    text = session.finish()
+    with _sessions_lock:
+        _results[session_id] = (text, time.time())
+    return text
+
+
+def pop_result(session_id):
+    """取出已完成会话的识别结果（只能取一次）"""
+    with _sessions_lock:
+        item = _results.pop(session_id, None)
+    return item[0] if item else None
+
+
+def _cleanup():
+    deadline = time.time() - SESSION_TIMEOUT
+    with _sessions_lock:
+        for sid in [sid for sid, s in _sessions.items() if s.last_active < deadline]:
+            del _sessions[sid]
+        for sid in [sid for sid, (_, t) in _results.items() if t < deadline]:
+            del _results[sid]
@@ -1,11 +1,22 @@
 import os
+import json
 import subprocess
 import shutil
 import tempfile
 import time
+import uuid
+import wave
+import urllib.request
+import urllib.error
 import speech_recognition as sr
 from zhipuai import ZhipuAI
 from backend.llm_service import query_llm 
+from backend.job_queue import report_progress
+from backend.workspace import create_workspace
+from backend.asr_service import default_model_dir, transcribe_wav
+# CosyVoice 常驻合成服务地址（bash CosyVoice/run_cosyvoice.sh serve 启动），置空则始终走脚本
+COSYVOICE_SERVER = os.environ.get('COSYVOICE_SERVER', 'http://127.0.0.1:50001')
+
 # 预设音色配置
 PRESET_VOICES = {
     "default": "./CosyVoice/asset/zero_shot_prompt.wav",          # 中文女声
@@ -17,7 +28,7 @@ PRESET_VOICES = {
     # "voice2": "./CosyVoice/asset/voice2.wav",
 }
 
-def get_voice_clone_reference(voice_clone_type, preset_voice_name=None, custom_voice_file=None, custom_voice_path=None, fallback_voice_clone=None):
+def get_voice_clone_reference(voice_clone_type, preset_voice_name=None, custom_voice_file=None, custom_voice_path=None, fallback_voice_clone=None, current_recording=None):
     """
     根据选择类型获取语音克隆参考音频路径
     
@@ -29,6 +40,7 @@ def get_voice_clone_reference(voice_clone_type, preset_voice_name=None, custom_v
         preset_voice_name: 预设音色名称（当 voice_clone_type 为 "preset_voice" 时使用）
         custom_voice_file: 自定义音频文件名（当 voice_clone_type 为 "custom" 时使用）
         fallback_voice_clone: 兼容旧版本的参数（如果提供了，优先使用）
+        current_recording: 本次请求的录音路径（缺省为 ./static/audios/input.wav）
     
     Returns:
         参考音频文件路径
@@ -44,7 +56,7 @@ def get_voice_clone_reference(voice_clone_type, preset_voice_name=None, custom_v
     # 根据类型选择参考音频
     if voice_clone_type == "current_recording":
         # 使用当前录音
-        reference_path = "./static/audios/input.wav"
+        reference_path = current_recording or "./static/audios/input.wav"
         if os.path.exists(reference_path):
             print(f"[backend.chat_engine] 使用当前录音作为参考音频: {reference_path}")
             return reference_path
@@ -88,6 +100,32 @@ def get_voice_clone_reference(voice_clone_type, preset_voice_name=None, custom_v
         print(f"[backend.chat_engine] 未知的语音克隆类型: {voice_clone_type}，使用默认预设音色")
         return PRESET_VOICES.get("default", "./CosyVoice/asset/zero_shot_prompt.wav")
 
+def resolve_voice_clone_reference(data):
+    """
+    从请求参数解析参考音频，文件不存在时回退到默认参考音频；都不存在返回 None
+    """
+    voice_clone_ref = get_voice_clone_reference(
+        voice_clone_type=data.get('voice_clone_type'),
+        preset_voice_name=data.get('preset_voice_name'),
+        custom_voice_file=data.get('custom_voice_file'),
+        custom_voice_path=data.get('custom_voice_path'),
+        fallback_voice_clone=data.get('voice_clone'),  # 兼容旧版本
+        current_recording=data.get('input_audio')
+    )
+    
+    # 最终检查文件是否存在
+    if not os.path.exists(voice_clone_ref):
+        print(f"[backend.chat_engine] 警告：参考音频文件不存在: {voice_clone_ref}")
+        # 尝试使用默认路径
+        default_ref = './CosyVoice/asset/zero_shot_prompt.wav'
+        if os.path.exists(default_ref):
+            print(f"[backend.chat_engine] 使用默认参考音频: {default_ref}")
+            voice_clone_ref = default_ref
+        else:
+            print(f"[backend.chat_engine] 错误：默认参考音频也不存在: {default_ref}")
+            return None
+    return voice_clone_ref
+
 def chat_response(data):
     """
     完整的实时对话系统视频生成逻辑。
@@ -98,33 +136,32 @@ def chat_response(data):
         print(f"  {k}: {v}")
 
     try:
-        # 生成时间戳（用于所有中间文件）
-        ts = time.strftime('%Y%m%d_%H%M%S')
+        # 中间文件全部放在本请求的工作目录中，并发请求互不覆盖
+        workspace = data.get('workspace') or create_workspace('chat')
         
         # 步骤1：语音识别（ASR）
-        input_audio = "./static/audios/input.wav"
-        input_text = "./static/text/input.txt"
-        input_text_timestamped = f"./static/text/input_{ts}.txt"
-        os.makedirs("./static/text", exist_ok=True)
+        input_audio = data.get('input_audio') or "./static/audios/input.wav"
+        input_text = os.path.join(workspace, "input.txt")
         
-        if not os.path.exists(input_audio):
+        if not os.path.exists(input_audio) and not data.get('recognized_text'):
             print(f"[backend.chat_engine] 音频文件不存在: {input_audio}")
             return os.path.join("static", "videos", "chat_response.mp4")
         
-        recognized_text = audio_to_text(input_audio, input_text)
+        report_progress('语音识别', 0.05)
+        # 录音时已流式识别完成的直接使用，否则识别上传的录音文件
+        recognized_text = data.get('recognized_text')
+        if recognized_text:
+            with open(input_text, 'w', encoding='utf-8') as f:
+                f.write(recognized_text)
+            print(f"[backend.chat_engine] 使用流式识别结果: {recognized_text}")
+        else:
+            recognized_text = audio_to_text(input_audio, input_text)
         if not recognized_text:
             print("[backend.chat_engine] 语音识别失败")
             return os.path.join("static", "videos", "chat_response.mp4")
         
-        # 保存带时间戳的ASR结果副本
-        if recognized_text:
-            with open(input_text_timestamped, 'w', encoding='utf-8') as f:
-                f.write(recognized_text)
-            print(f"[backend.chat_engine] ASR结果已保存到: {input_text_timestamped}")
-        
         # 步骤2：大模型生成回复
-        output_text = "./static/text/output.txt"
-        output_text_timestamped = f"./static/text/output_{ts}.txt"
+        output_text = os.path.join(workspace, "output.txt")
         # api_key = os.getenv('ZHIPU_API_KEY', '31af4e1567ad48f49b6d7b914b4145fb.MDVLvMiePGYLRJ7M')
         # model = "glm-4-plus"
         # reply_text = get_ai_response(input_text, output_text, api_key, model)
@@ -138,14 +175,11 @@ def chat_response(data):
         else:
             llm_input = f"请用中文回答：{recognized_text}"
 
+        report_progress('生成回复', 0.15)
         reply_text = query_llm(llm_input, api_choice)
-        # 将回复保存到文件（保持原有逻辑的副作用）
         with open(output_text, 'w', encoding='utf-8') as f:
             f.write(reply_text)
-        # 同时保存带时间戳的副本
-        with open(output_text_timestamped, 'w', encoding='utf-8') as f:
-            f.write(reply_text)
-        print(f"[backend.chat_engine] LLM回复已保存到: {output_text_timestamped}")
+        print(f"[backend.chat_engine] LLM回复已保存到: {output_text}")
         
         if not reply_text:
             print("[backend.chat_engine] LLM回复生成失败")
@@ -153,31 +187,9 @@ def chat_response(data):
         
         # 步骤3：语音克隆（CosyVoice）
         # 获取参考音频路径（支持新的三种选择方式）
-        voice_clone_type = data.get('voice_clone_type')
-        preset_voice_name = data.get('preset_voice_name')
-        custom_voice_file = data.get('custom_voice_file')
-        custom_voice_path = data.get('custom_voice_path')
-        fallback_voice_clone = data.get('voice_clone')  # 兼容旧版本
-        
-        voice_clone_ref = get_voice_clone_reference(
-            voice_clone_type=voice_clone_type,
-            preset_voice_name=preset_voice_name,
-            custom_voice_file=custom_voice_file,
-            custom_voice_path=custom_voice_path,
-            fallback_voice_clone=fallback_voice_clone
-        )
-        
-        # 最终检查文件是否存在
-        if not os.path.exists(voice_clone_ref):
-            print(f"[backend.chat_engine] 警告：参考音频文件不存在: {voice_clone_ref}")
-            # 尝试使用默认路径
-            default_ref = './CosyVoice/asset/zero_shot_prompt.wav'
-            if os.path.exists(default_ref):
-                print(f"[backend.chat_engine] 使用默认参考音频: {default_ref}")
-                voice_clone_ref = default_ref
-            else:
-                print(f"[backend.chat_engine] 错误：默认参考音频也不存在: {default_ref}")
-                return os.path.join("static", "videos", "chat_response.mp4")
+        voice_clone_ref = resolve_voice_clone_reference(data)
+        if voice_clone_ref is None:
+            return os.path.join("static", "videos", "chat_response.mp4")
         
         # 获取 CosyVoice 参数
         cosyvoice_params = data.get('cosyvoice_params', {})
@@ -200,10 +212,9 @@ def chat_response(data):
             speed = 1.0
         
         # 生成克隆音频
-        os.makedirs("./static/audios", exist_ok=True)
-        tts_output = "./static/audios/tts_output.wav"
-        tts_output_timestamped = f"./static/audios/tts_output_{ts}.wav"
+        tts_output = os.path.join(workspace, "tts_output.wav")
         
+        report_progress('语音合成', 0.3)
         cloned_audio = text_to_speech_cosyvoice(
             text=reply_text,
             prompt_wav=voice_clone_ref,
@@ -212,11 +223,6 @@ def chat_response(data):
             speed=speed  # 方案一：语速调节
         )
         
-        # 如果生成成功，复制一个带时间戳的副本
-        if cloned_audio and os.path.exists(cloned_audio):
-            shutil.copy(cloned_audio, tts_output_timestamped)
-            print(f"[backend.chat_engine] 语音合成输出已保存到: {tts_output_timestamped}")
-        
         if not cloned_audio or not os.path.exists(cloned_audio):
             print("[backend.chat_engine] 语音克隆失败")
             return os.path.join("static", "videos", "chat_response.mp4")
@@ -244,6 +250,8 @@ def chat_response(data):
             'dataset_path': dataset_path,
             'gpu_choice': gpu_choice,
             'audio_extractor': audio_extractor,
+            'workspace': workspace,
+            'output_path': os.path.join("static", "videos", f"chat_{os.path.basename(workspace)}.mp4"),
             'inference_params': {
                 'sh_degree': sh_degree  # 渲染细节等级（方案二）
             }
@@ -283,56 +291,17 @@ def _ffmpeg_to_wav16k_mono(src_path: str, dst_path: str):
 
 def transcribe_vosk(wav16k_path: str, model_dir: str):
     """
-    使用 Vosk 进行离线语音识别
+    使用 Vosk 进行离线语音识别（模型由 asr_service 缓存，只加载一次）
     返回识别文本
     """
-    try:
-        from vosk import Model, KaldiRecognizer
-    except ImportError:
-        raise RuntimeError("Vosk未安装，请运行: pip install vosk>=0.3.45")
-    
-    if not os.path.exists(model_dir) or not os.path.isdir(model_dir):
-        raise RuntimeError(f"Vosk模型目录不存在: {model_dir}")
-    
-    model = Model(model_dir)
-    rec = KaldiRecognizer(model, 16000)
-    
-    final_text_parts = []
-    
-    with open(wav16k_path, "rb") as f:
-        while True:
-            data = f.read(4000)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                import json
-                j = json.loads(rec.Result())
-                if j.get("text"):
-                    final_text_parts.append(j["text"])
-    
-    import json
-    j = json.loads(rec.FinalResult())
-    if j.get("text"):
-        final_text_parts.append(j["text"])
-    
-    text = " ".join([t for t in final_text_parts if t]).strip()
-    return text
+    return transcribe_wav(wav16k_path, model_dir)
 
 def audio_to_text(input_audio, input_text):
     """
     语音识别（ASR）
     使用 Vosk 离线语音识别，支持 WebM/Opus 等格式
     """
-    # Vosk 模型目录（中文模型）
-    vosk_model_dir = os.getenv(
-        'VOSK_MODEL_DIR',
-        './CosyVoice/asset/vosk-model-small-cn-0.22'  # 默认中文模型路径
-    )
-    
-    # 如果中文模型不存在，尝试英文模型
-    if not os.path.exists(vosk_model_dir):
-        vosk_model_dir = './CosyVoice/asset/vosk-model-small-en-us-0.15'
-        print(f"[ASR] 中文模型不存在，使用英文模型: {vosk_model_dir}")
+    vosk_model_dir = default_model_dir()
     
     try:
         if not os.path.exists(input_audio):
@@ -402,6 +371,89 @@ def get_ai_response(input_text, output_text, api_key, model):
         print(f"[backend.chat_engine] LLM调用失败: {e}")
         return None
 
+def prepare_prompt_wav(prompt_wav):
+    """参考音频超过 30s 时重采样为 16k 单声道并截断（CosyVoice 限制），返回可用的参考音频路径"""
+    def _duration_sec(wav_path: str) -> float:
+        try:
+            r = subprocess.run(
+                ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", wav_path],
+                capture_output=True, text=True, check=True
+            )
+            return float(r.stdout.strip())
+        except Exception:
+            return 0.0
+
+    def _trim_wav(src, dst, max_sec=30):
+        # 强制重采样 16k 单声道并截断，避免元数据导致时长 >30s
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", src,
+            "-t", str(max_sec),
+            "-ar", "16000",
+            "-ac", "1",
+            "-c:a", "pcm_s16le",
+            dst
+        ]
+        subprocess.run(cmd, capture_output=True, text=True)
+
+    dur = _duration_sec(prompt_wav)
+    if dur > 30.0:
+        tmp_dir = tempfile.mkdtemp()
+        trimmed = os.path.join(tmp_dir, "prompt_trimmed.wav")
+        print(f"[backend.chat_engine] 参考音频超过30s ({dur:.2f}s)，截断到30s后再用")
+        _trim_wav(prompt_wav, trimmed, 29.5)
+        prompt_wav = trimmed
+    return prompt_wav
+
+def synthesize_with_server(text, prompt_wav, prompt_text, output_file, language, model_dir, speed):
+    """
+    调用 CosyVoice 常驻合成服务，模型只加载一次。
+    服务不可用或失败时返回 None，由调用方回退到 run_cosyvoice.sh。
+    """
+    if not COSYVOICE_SERVER:
+        return None
+
+    payload = {
+        'tts_text': text,
+        'prompt_wav': prompt_wav,
+        'prompt_text': prompt_text,
+        'output_file': output_file,
+        'language': language,
+        'speed': speed,
+        'model_dir': model_dir,
+    }
+    req = urllib.request.Request(
+        f"{COSYVOICE_SERVER.rstrip('/')}/synthesize",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        print(f"[backend.chat_engine] CosyVoice服务返回错误 {e.code}: {e.read().decode('utf-8', 'ignore')}")
+        return None
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        print(f"[backend.chat_engine] CosyVoice服务不可用（{e}），回退到脚本方式")
+        return None
+
+    if result.get('status') == 'success' and os.path.exists(output_file):
+        print(f"[backend.chat_engine] 语音克隆完成（常驻服务，{result.get('duration', 0):.2f}s）: {output_file}")
+        return output_file
+    return None
+
+def concat_wavs(wav_paths, output_file):
+    """按顺序拼接采样格式相同的 wav 文件"""
+    if len(wav_paths) == 1:
+        shutil.copy(wav_paths[0], output_file)
+        return
+    with wave.open(output_file, 'wb') as out:
+        for i, path in enumerate(wav_paths):
+            with wave.open(path, 'rb') as w:
+                if i == 0:
+                    out.setparams(w.getparams())
+                out.writeframes(w.readframes(w.getnframes()))
+
 def text_to_speech_cosyvoice(text, prompt_wav, output_file, language='zh', model_dir=None, speed=1.0):
     """
     使用CosyVoice进行语音克隆
@@ -429,36 +481,7 @@ def text_to_speech_cosyvoice(text, prompt_wav, output_file, language='zh', model
         output_file = os.path.abspath(output_file)
 
         # 如果参考音频超过 30s，先截断到 30s（CosyVoice 限制）
-        def _duration_sec(wav_path: str) -> float:
-            try:
-                r = subprocess.run(
-                    ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", wav_path],
-                    capture_output=True, text=True, check=True
-                )
-                return float(r.stdout.strip())
-            except Exception:
-                return 0.0
-
-        def _trim_wav(src, dst, max_sec=30):
-            # 强制重采样 16k 单声道并截断，避免元数据导致时长 >30s
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", src,
-                "-t", str(max_sec),
-                "-ar", "16000",
-                "-ac", "1",
-                "-c:a", "pcm_s16le",
-                dst
-            ]
-            subprocess.run(cmd, capture_output=True, text=True)
-
-        dur = _duration_sec(prompt_wav)
-        if dur > 30.0:
-            tmp_dir = tempfile.mkdtemp()
-            trimmed = os.path.join(tmp_dir, "prompt_trimmed.wav")
-            print(f"[backend.chat_engine] 参考音频超过30s ({dur:.2f}s)，截断到30s后再用")
-            _trim_wav(prompt_wav, trimmed, 29.5)
-            prompt_wav = trimmed
+        prompt_wav = prepare_prompt_wav(prompt_wav)
 
         # 检查模型目录是否存在
         if not os.path.exists(model_dir):
@@ -486,6 +509,13 @@ def text_to_speech_cosyvoice(text, prompt_wav, output_file, language='zh', model
             print(f"[backend.chat_engine] 警告：speed={speed} 不在有效范围 [0.5, 2.0] 内，使用默认值 1.0")
             speed = 1.0
         
+        # 优先使用常驻合成服务
+        if synthesize_with_server(text, prompt_wav, text[:50], output_file, language, model_dir, speed):
+            return output_file
+        
+        # 脚本固定输出到 CosyVoice/test_result/<名称>_<分句序号>.wav，名称按调用唯一生成
+        script_output = f"tts_{uuid.uuid4().hex[:12]}.wav"
+        
         # 构建命令 - 调用Shell脚本，脚本内部会使用conda run
         cmd = [
             'bash', cosyvoice_script,
@@ -495,7 +525,7 @@ def text_to_speech_cosyvoice(text, prompt_wav, output_file, language='zh', model
             '--tts_text', text,
             '--language', language,
             '--speed', str(speed),  # 方案一：语速调节
-            '--output_file', os.path.basename(output_file)
+            '--output_file', script_output
         ]
         
         print(f"[backend.chat_engine] 执行CosyVoice命令: {' '.join(cmd)}")
@@ -516,28 +546,18 @@ def text_to_speech_cosyvoice(text, prompt_wav, output_file, language='zh', model
             print(f"[backend.chat_engine] CosyVoice执行失败，退出码: {result.returncode}")
             return None
         
-        # 查找生成的音频文件
-        # test_cosyvoice.py 默认输出到 "test_result/"，有时是项目根目录下的 test_result，也可能是 CosyVoice/test_result
-        candidate_dirs = [
-            os.path.join(os.path.dirname(cosyvoice_script), 'test_result'),
-            'CosyVoice/test_result',
-            'test_result'
-        ]
-        base_name = os.path.splitext(os.path.basename(output_file))[0]
-        generated_files = []
-        for d in candidate_dirs:
-            if os.path.exists(d):
-                for f in os.listdir(d):
-                    if f.startswith(base_name) and f.endswith('.wav'):
-                        generated_files.append(os.path.join(d, f))
-        if generated_files:
-            latest_file = max(generated_files, key=lambda f: os.path.getctime(f))
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
-            shutil.copy(latest_file, output_file)
-            print(f"[backend.chat_engine] 语音克隆完成: {output_file}")
-            return output_file
-        print(f"[backend.chat_engine] 未找到生成的音频文件")
-        return None
+        # 按分句序号收集本次生成的音频并拼接为 output_file
+        result_dir = os.path.join(cosyvoice_root, 'test_result')
+        base_name = os.path.splitext(script_output)[0]
+        segments = []
+        while os.path.exists(os.path.join(result_dir, f"{base_name}_{len(segments)}.wav")):
+            segments.append(os.path.join(result_dir, f"{base_name}_{len(segments)}.wav"))
+        if not segments:
+            print(f"[backend.chat_engine] 未找到生成的音频文件: {result_dir}/{base_name}_*.wav")
+            return None
+        concat_wavs(segments, output_file)
+        print(f"[backend.chat_engine] 语音克隆完成（{len(segments)} 段）: {output_file}")
+        return output_file
             
     except Exception as e:
         print(f"[backend.chat_engine] 语音克隆错误: {e}")
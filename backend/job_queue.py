@@ -0,0 +1,332 @@
+"""
+后台任务队列
+
+视频生成、对话生成与模型训练都要占用 GPU 数十秒到数小时，原先直接在 Flask 请求线程中执行
+（训练则每次新开一个守护线程，任务状态只保存在内存字典中）。本模块提供：
+  - SQLite 任务表：任务参数、状态、进度与结果持久化，服务重启后排队中的任务继续执行；
+  - 每块 GPU 两条有界工作线程池：训练独占一条，视频生成与对话渲染共用另一条，
+    数小时的训练不会挡住对话请求，同一块 GPU 上同一条线路的并发数不超过 workers_per_gpu；
+  - 唯一任务 ID（uuid），接口立即返回任务 ID，前端轮询 /jobs/<job_id> 获取进度与结果；
+  - 取消：排队中的任务直接取消；运行中的任务终止其通过 run_process 启动的子进程（整个进程组），
+    不在子进程中的步骤在下一次上报进度时中止（协作式取消）。
+
+任务函数签名为 func(data) -> dict，在执行过程中可调用 report_progress(stage, progress) 上报进度，
+训练、渲染等外部命令用 run_process 代替 subprocess.run 启动，以便取消时终止。
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import signal
+import sqlite3
+import threading
+import subprocess
+import traceback
+
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join('jobs', 'jobs.db'))
+# 每块 GPU 上每条线路（训练 / 渲染）的并发数
+JOB_WORKERS_PER_GPU = int(os.environ.get('JOB_WORKERS_PER_GPU', 1))
+# 取消时先 SIGTERM 子进程组，超时仍未退出再 SIGKILL（秒）
+JOB_KILL_TIMEOUT = 10
+# 使用独立线路的任务类型，其余任务类型（视频生成、对话）共用渲染线路
+TRAINING_KINDS = ('training',)
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCESS = 'success'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCESS, ERROR, CANCELLED)
+
+
+class JobCancelled(BaseException):
+    """运行中的任务被取消（继承 BaseException，不会被后端各处的 except Exception 吞掉）"""
+
+
+_local = threading.local()
+
+
+def report_progress(stage=None, progress=None):
+    """
+    在任务函数中上报当前阶段与进度（0~1）；不在任务线程中调用时无操作。
+    任务已被请求取消时抛出 JobCancelled。
+    """
+    job = getattr(_local, 'job', None)
+    if job is None:
+        return
+    queue_, job_id = job
+    queue_.update_progress(job_id, stage, progress)
+    if queue_.cancel_requested(job_id):
+        raise JobCancelled(job_id)
+
+
+def _signal_process(proc, sig):
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, sig)
+        elif sig == signal.SIGTERM:
+            proc.terminate()
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _terminate(proc):
+    """终止子进程及其进程组（训练脚本经 bash / conda run 再启动 python）"""
+    if proc.poll() is not None:
+        return
+    _signal_process(proc, signal.SIGTERM)
+
+    def kill():
+        if proc.poll() is None:
+            _signal_process(proc, getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+    timer = threading.Timer(JOB_KILL_TIMEOUT, kill)
+    timer.daemon = True
+    timer.start()
+
+
+def run_process(cmd, check=False, **kwargs):
+    """
+    subprocess.run 的替代：在任务线程中调用时把子进程登记到当前任务，任务被取消时终止子进程并抛出 JobCancelled。
+    子进程在独立的进程组中运行；不在任务线程中调用时与 subprocess.run 相同。
+    """
+    job = getattr(_local, 'job', None)
+    if job is None:
+        return subprocess.run(cmd, check=check, **kwargs)
+    queue_, job_id = job
+    if kwargs.pop('capture_output', False):
+        kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+    with subprocess.Popen(cmd, start_new_session=True, **kwargs) as proc:
+        queue_.attach_process(job_id, proc)
+        try:
+            stdout, stderr = proc.communicate()
+        except BaseException:
+            _terminate(proc)
+            raise
+        finally:
+            queue_.detach_process(job_id)
+    if queue_.cancel_requested(job_id):
+        raise JobCancelled(job_id)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+
+class JobQueue:
+    def __init__(self, db_path=JOB_DB_PATH, workers_per_gpu=JOB_WORKERS_PER_GPU):
+        self.db_path = db_path
+        self.workers_per_gpu = workers_per_gpu
+        self.handlers = {}
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.cancelled = set()
+        # job_id -> 运行中任务当前的子进程（run_process 登记）
+        self.processes = {}
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    gpu TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL DEFAULT 0,
+                    params TEXT,
+                    result TEXT,
+                    message TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id, **fields):
+        keys = ', '.join(f"{k} = ?" for k in fields)
+        with self.lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {keys} WHERE id = ?", (*fields.values(), job_id))
+
+    def register(self, kind, func):
+        """注册任务类型；需在 recover() 之前完成"""
+        self.handlers[kind] = func
+
+    def recover(self):
+        """服务重启后：运行中的任务标记为中断，排队中的任务重新入队"""
+        with self.lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE status = ?",
+                         (ERROR, '服务重启，任务中断', time.time(), RUNNING))
+            rows = conn.execute("SELECT id, kind, gpu FROM jobs WHERE status = ? ORDER BY created_at",
+                                (QUEUED,)).fetchall()
+        for row in rows:
+            if row['kind'] in self.handlers:
+                self._enqueue(row['id'], row['kind'], row['gpu'])
+        if rows:
+            print(f"[backend.job_queue] 恢复 {len(rows)} 个排队中的任务")
+
+    def submit(self, kind, data, gpu='GPU0'):
+        """提交任务，立即返回任务 ID"""
+        if kind not in self.handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        job_id = f"{kind}_{uuid.uuid4().hex}"
+        gpu = gpu or 'GPU0'
+        with self.lock, self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, kind, gpu, status, params, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (job_id, kind, gpu, QUEUED, json.dumps(data, ensure_ascii=False), time.time()))
+        self._enqueue(job_id, kind, gpu)
+        return job_id
+
+    @staticmethod
+    def _lane(kind):
+        return 'training' if kind in TRAINING_KINDS else 'render'
+
+    def _enqueue(self, job_id, kind, gpu):
+        # 线程池按 (线路, GPU) 划分：视频生成与对话在同一块 GPU 上排队，训练另占一条线路
+        key = (self._lane(kind), gpu)
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = queue.Queue()
+                for i in range(self.workers_per_gpu):
+                    threading.Thread(target=self._worker, args=(pool,), daemon=True,
+                                     name=f"job-{key[0]}-{gpu}-{i}").start()
+                self.pools[key] = pool
+        pool.put(job_id)
+
+    def _worker(self, pool):
+        while True:
+            job_id = pool.get()
+            try:
+                self._run(job_id)
+            except Exception:
+                traceback.print_exc()
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if job is None or job['status'] != QUEUED:
+            return
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        print(f"[backend.job_queue] 开始任务 {job_id}")
+
+        _local.job = (self, job_id)
+        try:
+            result = self.handlers[job['kind']](job['params'])
+            # 取消请求到达时任务已经完成（没有可终止的子进程、之后也没有再上报进度），按实际结果记为成功
+            self._update(job_id, status=SUCCESS, progress=1.0, finished_at=time.time(),
+                         result=json.dumps(result, ensure_ascii=False))
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, message='任务已取消', finished_at=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status=ERROR, message=f'任务失败：{e}', finished_at=time.time())
+        finally:
+            _local.job = None
+            with self.lock:
+                self.cancelled.discard(job_id)
+        print(f"[backend.job_queue] 任务结束 {job_id}: {self.get(job_id)['status']}")
+
+    def update_progress(self, job_id, stage=None, progress=None):
+        fields = {}
+        if stage is not None:
+            fields['stage'] = stage
+        if progress is not None:
+            fields['progress'] = float(progress)
+        if fields:
+            self._update(job_id, **fields)
+
+    def attach_process(self, job_id, proc):
+        with self.lock:
+            self.processes[job_id] = proc
+            cancelled = job_id in self.cancelled
+        if cancelled:
+            _terminate(proc)
+
+    def detach_process(self, job_id):
+        with self.lock:
+            self.processes.pop(job_id, None)
+
+    def cancel(self, job_id):
+        """
+        取消任务；返回取消后的任务状态，任务不存在返回 None。
+        运行中的任务：终止其当前子进程，任务线程随后以 JobCancelled 结束；没有子进程时在下一次上报进度时中止。
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job['status'] == QUEUED:
+            with self.lock, self._connect() as conn:
+                conn.execute("UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE id = ? AND status = ?",
+                             (CANCELLED, '任务已取消', time.time(), job_id, QUEUED))
+        elif job['status'] == RUNNING:
+            with self.lock:
+                self.cancelled.add(job_id)
+                proc = self.processes.get(job_id)
+            if proc is not None:
+                _terminate(proc)
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id):
+        with self.lock:
+            return job_id in self.cancelled
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def active_params(self, key):
+        """排队中与运行中任务参数里 key 的取值（如 workspace，清理过期目录时跳过）"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT params FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        values = set()
+        for row in rows:
+            value = json.loads(row['params'] or '{}').get(key)
+            if value:
+                values.add(value)
+        return values
+
+    def list(self, kind=None, limit=50):
+        sql = "SELECT * FROM jobs"
+        args = []
+        if kind:
+            sql += " WHERE kind = ?"
+            args.append(kind)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(int(limit))
+        with self._connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _to_dict(self, row):
+        job = dict(row)
+        job['params'] = json.loads(job['params']) if job['params'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        if job['status'] == RUNNING and job['id'] in self.cancelled:
+            job['stage'] = '正在取消'
+        if job['status'] == QUEUED:
+            job['position'] = self._position(job)
+        return job
+
+    def _position(self, job):
+        """同一 (线路, GPU) 队列中排在该任务之前的任务数"""
+        lane = self._lane(job['kind'])
+        kinds = [kind for kind in self.handlers if self._lane(kind) == lane] or [job['kind']]
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT COUNT(*) FROM jobs WHERE kind IN ({', '.join('?' * len(kinds))}) AND gpu = ? "
+                               "AND status IN (?, ?) AND created_at < ?",
+                               (*kinds, job['gpu'], QUEUED, RUNNING, job['created_at'])).fetchone()
+        return row[0]
+
+
+job_queue = JobQueue()
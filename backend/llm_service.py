@@ -1,6 +1,9 @@
 from openai import OpenAI
 import os
+import re
 import json
+import threading
+from collections import OrderedDict
 
 # === API 配置文件路径 ===
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), 'config')
@@ -30,52 +33,127 @@ def load_api_config():
         if os.path.exists(EXAMPLE_CONFIG_FILE):
             print(f"[LLM Service] 请复制 {EXAMPLE_CONFIG_FILE} 为 {CONFIG_FILE} 并填入你的API密钥")
     
-    # 环境变量优先级更高，覆盖配置文件中的值
+    # 环境变量优先级更高，覆盖配置文件中的值（<KEY>_BASE_URL 可指向本地 OpenAI 兼容服务做测试）
     api_config = {}
-    for key in ["openai", "zhipu", "deepseek"]:
+    for key in PROVIDERS:
         api_config[key] = {
             "api_key": os.getenv(
                 f"{key.upper()}_API_KEY",
                 config.get(key, {}).get("api_key", "sk-xxxxxxxx")
             ),
-            "base_url": config.get(key, {}).get("base_url", ""),
-            "model": config.get(key, {}).get("model", ""),
+            "base_url": os.getenv(f"{key.upper()}_BASE_URL", config.get(key, {}).get("base_url", "")),
+            "model": os.getenv(f"{key.upper()}_MODEL", config.get(key, {}).get("model", "")),
             "enabled": config.get(key, {}).get("enabled", True)
         }
     
     # 设置默认值（如果配置文件中没有）
     if not api_config["openai"]["base_url"]:
         api_config["openai"]["base_url"] = "https://api.openai.com/v1"
+    if not api_config["openai"]["model"]:
         api_config["openai"]["model"] = "gpt-3.5-turbo"
     
     if not api_config["zhipu"]["base_url"]:
         api_config["zhipu"]["base_url"] = "https://open.bigmodel.cn/api/paas/v4/"
+    if not api_config["zhipu"]["model"]:
         api_config["zhipu"]["model"] = "glm-4"
     
     if not api_config["deepseek"]["base_url"]:
         api_config["deepseek"]["base_url"] = "https://api.deepseek.com"
+    if not api_config["deepseek"]["model"]:
         api_config["deepseek"]["model"] = "deepseek-chat"
     
     return api_config
 
+def _config_signature():
+    """配置文件 mtime 与相关环境变量；两者都未变化时沿用已加载的配置"""
+    try:
+        mtime = os.path.getmtime(CONFIG_FILE)
+    except OSError:
+        mtime = None
+    env = tuple(os.getenv(f"{key.upper()}_{suffix}") for key in PROVIDERS
+                for suffix in ("API_KEY", "BASE_URL", "MODEL"))
+    return mtime, env
+
+def get_api_config():
+    """返回当前 API 配置，仅在配置文件或环境变量变化时重新加载"""
+    global API_CONFIG, _config_sig
+    signature = _config_signature()
+    with _config_lock:
+        if signature != _config_sig:
+            API_CONFIG = load_api_config()
+            _config_sig = signature
+        return API_CONFIG
+
+PROVIDERS = ["openai", "zhipu", "deepseek"]
+_config_lock = threading.Lock()
+_config_sig = None
 # 加载API配置
-API_CONFIG = load_api_config()
+API_CONFIG = get_api_config()
 
-def query_llm(text, api_choice="zhipu"):
+# 每个 (base_url, api_key) 复用一个客户端，底层 httpx 连接池保持长连接
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(config):
+    key = (config['base_url'], config['api_key'])
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=config['api_key'], base_url=config['base_url'])
+            _clients[key] = client
+        return client
+
+# 回复缓存：按 (规范化问题, 服务商, 模型) 缓存回复，适合常见问题反复询问的场景
+# LLM_REPLY_CACHE_SIZE 为缓存条数，0 表示关闭（默认）
+LLM_REPLY_CACHE_SIZE = int(os.getenv('LLM_REPLY_CACHE_SIZE', 0))
+_reply_cache = OrderedDict()
+_reply_cache_lock = threading.Lock()
+
+def normalize_prompt(text):
+    """忽略大小写、多余空白与句末标点"""
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    return text.rstrip('。！？!?.，,~～ ')
+
+def _cache_key(text, api_choice, config):
+    return normalize_prompt(text), api_choice, config['model']
+
+def _cache_get(key):
+    if LLM_REPLY_CACHE_SIZE <= 0:
+        return None
+    with _reply_cache_lock:
+        reply = _reply_cache.get(key)
+        if reply is not None:
+            _reply_cache.move_to_end(key)
+        return reply
+
+def _cache_put(key, reply):
+    if LLM_REPLY_CACHE_SIZE <= 0 or not reply:
+        return
+    with _reply_cache_lock:
+        _reply_cache[key] = reply
+        _reply_cache.move_to_end(key)
+        while len(_reply_cache) > LLM_REPLY_CACHE_SIZE:
+            _reply_cache.popitem(last=False)
+
+# 数字人助手的系统提示词
+SYSTEM_PROMPT = "你是一个数字人助手，请用简短、口语化的中文回答用户，字数控制在50字以内。"
+
+# 配置文件中的占位密钥
+DEFAULT_KEYS = ["sk-xxxxxxxx", "your-zhipu-api-key-here", "sk-your-deepseek-api-key-here"]
+
+def select_llm_config(api_choice="zhipu"):
     """
-    统一的 LLM 调用接口
+    选择可用的 LLM 配置（未启用时按 deepseek > openai > zhipu 回退）
+    返回 (config, api_choice)，密钥未配置时 config 为 None
     """
-    print(f"[LLM Service] 正在调用: {api_choice}")
-    
-    # 重新加载配置（支持动态更新）
-    global API_CONFIG
-    API_CONFIG = load_api_config()
+    # 配置文件修改后自动生效（按 mtime 重新加载）
+    api_config = get_api_config()
     
-    config = API_CONFIG.get(api_choice)
+    config = api_config.get(api_choice)
     if not config:
         print(f"[LLM Service] 未找到 {api_choice} 配置，回退到 zhipu")
         api_choice = "zhipu"
-        config = API_CONFIG.get("zhipu")
+        config = api_config.get("zhipu")
     
     # 检查API是否启用
     if not config.get("enabled", True):
@@ -85,35 +163,47 @@ def query_llm(text, api_choice="zhipu"):
         for key in fallback_order:
             if key == api_choice:
                 continue
-            cfg = API_CONFIG.get(key)
+            cfg = api_config.get(key)
             if cfg and cfg.get("enabled", True):
                 # 检查密钥是否有效
                 api_key = cfg.get("api_key", "")
-                default_keys = ["sk-xxxxxxxx", "your-zhipu-api-key-here", "sk-your-deepseek-api-key-here"]
-                if api_key and api_key not in default_keys:
+                if api_key and api_key not in DEFAULT_KEYS:
                     print(f"[LLM Service] 切换到: {key}")
                     config = cfg
                     api_choice = key
                     break
     
     # 检查API密钥是否有效（排除默认占位符）
-    default_keys = ["sk-xxxxxxxx", "your-zhipu-api-key-here", "sk-your-deepseek-api-key-here"]
     api_key = config.get("api_key", "")
-    if not api_key or api_key in default_keys:
+    if not api_key or api_key in DEFAULT_KEYS:
         print(f"[LLM Service] 警告: {api_choice} 的API密钥未配置或使用默认值")
+        return None, api_choice
+    return config, api_choice
+
+def query_llm(text, api_choice="zhipu"):
+    """
+    统一的 LLM 调用接口
+    """
+    print(f"[LLM Service] 正在调用: {api_choice}")
+    
+    config, api_choice = select_llm_config(api_choice)
+    if config is None:
         return "抱歉，API密钥未配置，请检查配置文件 backend/config/api_config.json 或环境变量。"
 
+    cache_key = _cache_key(text, api_choice, config)
+    reply = _cache_get(cache_key)
+    if reply is not None:
+        print(f"[LLM Service] 命中回复缓存: {reply}")
+        return reply
+
     try:
         # 使用 OpenAI SDK 统一调用 (智谱、DeepSeek 等现在都兼容此格式)
-        client = OpenAI(
-            api_key=config['api_key'],
-            base_url=config['base_url']
-        )
+        client = get_client(config)
 
         response = client.chat.completions.create(
             model=config['model'],
             messages=[
-                {"role": "system", "content": "你是一个数字人助手，请用简短、口语化的中文回答用户，字数控制在50字以内。"},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": text}
             ],
             temperature=0.7,
@@ -122,8 +212,58 @@ def query_llm(text, api_choice="zhipu"):
         
         reply = response.choices[0].message.content
         print(f"[LLM Service] 回复: {reply}")
+        _cache_put(cache_key, reply)
         return reply
 
     except Exception as e:
         print(f"[LLM Service] 调用失败: {e}")
-        return "抱歉，我现在连接大脑有点问题，请稍后再试。"
\ No newline at end of file
+        return "抱歉，我现在连接大脑有点问题，请稍后再试。"
+
+def query_llm_stream(text, api_choice="zhipu"):
+    """
+    流式 LLM 调用：逐段产出回复文本（stream=True 的增量内容）
+    失败时产出与 query_llm 相同的兜底回复
+    """
+    print(f"[LLM Service] 正在流式调用: {api_choice}")
+    
+    config, api_choice = select_llm_config(api_choice)
+    if config is None:
+        yield "抱歉，API密钥未配置，请检查配置文件 backend/config/api_config.json 或环境变量。"
+        return
+
+    cache_key = _cache_key(text, api_choice, config)
+    reply = _cache_get(cache_key)
+    if reply is not None:
+        print(f"[LLM Service] 命中回复缓存: {reply}")
+        yield reply
+        return
+
+    produced = False
+    parts = []
+    try:
+        client = get_client(config)
+
+        stream = client.chat.completions.create(
+            model=config['model'],
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": text}
+            ],
+            temperature=0.7,
+            max_tokens=150,
+            stream=True
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                produced = True
+                parts.append(delta)
+                yield delta
+        _cache_put(cache_key, ''.join(parts))
+
+    except Exception as e:
+        print(f"[LLM Service] 流式调用失败: {e}")
+        if not produced:
+            yield "抱歉，我现在连接大脑有点问题，请稍后再试。"
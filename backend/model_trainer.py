@@ -2,6 +2,7 @@ import subprocess
 import os
 import time
 import shutil
+from backend.job_queue import report_progress, run_process
 
 def _resp(status, model_path=None, message="", preview_video=None, reference_audio=None, reference_audio_short=None):
     return {
@@ -101,20 +102,25 @@ def train_model(data):
                     dataset_path = os.path.dirname(video_path)
             
             # 检查数据是否已预处理（检查 transforms_train.json）
+            # process.py 记录了各步骤输入指纹（.process_state.json），由它管理的数据集每次都重新检查：
+            # 输入未变化的步骤直接跳过，上次失败的步骤及其下游会续跑
             transforms_file = os.path.join(dataset_path, "transforms_train.json")
-            if not os.path.exists(transforms_file):
-                print("[backend.model_trainer] 数据未预处理，开始预处理...")
-                # 执行数据预处理 - 使用conda run切换到talking_gaussian环境
-                # 1. 运行 process.py (基础预处理)
-                print("[backend.model_trainer] 步骤 1/3: 运行基础预处理 (process.py)...")
+            state_file = os.path.join(dataset_path, ".process_state.json")
+            if not os.path.exists(transforms_file) or os.path.exists(state_file):
+                print("[backend.model_trainer] 开始数据预处理（增量）...")
+                # 基础预处理、牙齿遮罩（--teeth）与 DeepSpeech 特征（--aud_ds）在同一任务图中执行，
+                # 相互独立的分支（音频 / 人脸解析 / 关键点 / 牙齿遮罩）并行运行
+                report_progress('数据预处理', 0.05)
                 preprocess_cmd = [
                     'conda', 'run', '-n', 'talking_gaussian', '--no-capture-output',
                     'python', 'TalkingGaussian/data_utils/process.py',
                     video_path,
-                    '--asr', audio_extractor
+                    '--asr', audio_extractor,
+                    '--teeth', '--aud_ds',
+                    '--jobs', os.environ.get('PREPROCESS_JOBS', '2')
                 ]
                 
-                preprocess_result = subprocess.run(
+                preprocess_result = run_process(
                     preprocess_cmd,
                     capture_output=False,
                     text=True,
@@ -122,62 +128,8 @@ def train_model(data):
                 )
                 
                 if preprocess_result.returncode != 0:
-                    print(f"[backend.model_trainer] 基础预处理失败")
-                    return _resp("error", None, f"基础预处理失败，请检查控制台日志")
-
-                # 2. 运行 create_teeth_mask.py (生成牙齿遮罩)
-                print("[backend.model_trainer] 步骤 2/3: 生成牙齿遮罩 (create_teeth_mask.py)...")
-                # 注意：create_teeth_mask.py 需要 dataset 目录作为参数
-                # 切换到 TalkingGaussian 目录运行，以解决相对路径问题
-                # dataset_path 是 "TalkingGaussian/data/Macron1"，在 TalkingGaussian 目录下应为 "data/Macron1"
-                relative_dataset_path = os.path.relpath(dataset_path, "TalkingGaussian")
-                
-                teeth_mask_cmd = [
-                    'conda', 'run', '-n', 'talking_gaussian', '--no-capture-output',
-                    'bash', '-c',
-                    f'export PYTHONPATH=data_utils/easyportrait && python data_utils/easyportrait/create_teeth_mask.py {relative_dataset_path}'
-                ]
-
-                teeth_mask_result = subprocess.run(
-                    teeth_mask_cmd,
-                    capture_output=False,
-                    text=True,
-                    cwd='TalkingGaussian'  # 临时切换工作目录
-                )
-
-                if teeth_mask_result.returncode != 0:
-                    print(f"[backend.model_trainer] 生成牙齿遮罩失败")
-                    return _resp("error", None, f"生成牙齿遮罩失败，请检查控制台日志")
-
-                # 3. 运行 extract_ds_features.py (生成 DeepSpeech 特征)
-                # 只有当 audio_extractor 为 deepspeech 时才需要这一步，但为了保险起见，如果 aud_ds.npy 不存在，我们手动生成它
-                # 注意：process.py 可能已经生成了 aud.npy，我们需要确保 aud_ds.npy 存在
-                print("[backend.model_trainer] 步骤 3/3: 检查并生成 DeepSpeech 特征...")
-                
-                aud_wav_path = os.path.join(dataset_path, "aud.wav")
-                aud_ds_npy_path = os.path.join(dataset_path, "aud_ds.npy")
-                
-                # 如果 aud_ds.npy 不存在，则运行提取脚本
-                if not os.path.exists(aud_ds_npy_path):
-                    ds_cmd = [
-                        'conda', 'run', '-n', 'talking_gaussian', '--no-capture-output',
-                        'python', 'TalkingGaussian/data_utils/deepspeech_features/extract_ds_features.py',
-                        '--input', aud_wav_path,
-                        '--output', aud_ds_npy_path
-                    ]
-                    
-                    ds_result = subprocess.run(
-                        ds_cmd,
-                        capture_output=False,
-                        text=True,
-                        cwd='.'
-                    )
-                    
-                    if ds_result.returncode != 0:
-                        print(f"[backend.model_trainer] DeepSpeech 特征提取失败")
-                        return _resp("error", None, f"DeepSpeech 特征提取失败，请检查控制台日志")
-                else:
-                    print(f"[backend.model_trainer] aud_ds.npy 已存在，跳过提取")
+                    print(f"[backend.model_trainer] 数据预处理失败，各步骤耗时见 {os.path.join(dataset_path, 'process_timing.json')}")
+                    return _resp("error", None, f"数据预处理失败，请检查控制台日志（重新提交将从失败的步骤继续）")
 
                 print("[backend.model_trainer] 所有数据预处理完成")
 
@@ -210,6 +162,7 @@ def train_model(data):
             ]
             
             print(f"[backend.model_trainer] 执行命令: {' '.join(cmd)}")
+            report_progress('训练模型', 0.3)
             
             # 设置GPU环境变量
             env = os.environ.copy()
@@ -217,7 +170,7 @@ def train_model(data):
             
             # 执行训练命令
             # 修改为不捕获输出，直接打印到控制台
-            result = subprocess.run(
+            result = run_process(
                 cmd,
                 capture_output=False,
                 text=True,
@@ -303,7 +256,7 @@ def train_model(data):
             
             print(f"[backend.model_trainer] 执行命令: {' '.join(cmd)}")
             # 执行训练命令
-            result = subprocess.run(
+            result = run_process(
                 cmd,
                 capture_output=True,
                 text=True,
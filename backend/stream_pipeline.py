@@ -0,0 +1,410 @@
+"""
+流式对话流水线
+
+chat_response 按 ASR → LLM → TTS → 特征提取 → 渲染 → 裁剪 → 合成 顺序执行，首帧时间等于整条流水线耗时。
+流式模式下各阶段重叠执行：
+  1. LLM 以 stream=True 逐段返回，按句切分；
+  2. 每句一完成即提交 CosyVoice 常驻服务 /synthesize_stream，边合成边返回 PCM；
+  3. PCM 按帧对齐切成约 1.5s 的音频段；音频同时追加到渲染服务的增量特征流（/features，模型常驻，
+     只对尾部重新提取），某段之后的特征定稿后，该段按 start_frame 从整段特征中取帧渲染，
+     音频注意力窗口跨越分段接缝（不补零），相邻分段的姿态也保持连续；
+  4. 渲染结果转为 MPEG-TS 分段并追加到 HLS 播放列表，浏览器边生成边播放。
+
+依赖两个常驻服务：bash CosyVoice/run_cosyvoice.sh serve 与 bash TalkingGaussian/run_talkinggaussian.sh serve
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import wave
+import queue
+import shutil
+import threading
+import subprocess
+import traceback
+import urllib.request
+import urllib.error
+
+from backend.llm_service import query_llm_stream
+from backend.chat_engine import (COSYVOICE_SERVER, audio_to_text, prepare_prompt_wav,
+                                 resolve_voice_clone_reference)
+from backend.video_generator import (TG_RENDER_SERVER, extract_relative_path, render_with_server,
+                                     validate_model_path)
+from backend.workspace import create_workspace
+
+STREAM_ROOT = os.path.join("static", "streams")
+FPS = 25
+# 首段短一些以缩短首帧时间，后续分段长一些以减少分段开销
+FIRST_SEGMENT_SECONDS = float(os.environ.get('STREAM_FIRST_SEGMENT_SECONDS', 1.0))
+SEGMENT_SECONDS = float(os.environ.get('STREAM_SEGMENT_SECONDS', 1.5))
+
+# 音频注意力窗口为 [i-4, i+4)：第 i 帧需要 i+3 帧的特征已定稿才能渲染
+AUDIO_WINDOW_LOOKAHEAD = 4
+# 新增音频累计到该时长再送去提取特征，避免过于频繁的请求
+FEATURE_FEED_SECONDS = 0.2
+
+# 句末标点：遇到即切句；长句在软标点处切分
+SENTENCE_END = '。！？!?；;\n'
+SOFT_BREAK = '，,、：:'
+
+# 流式会话状态（仅保存在内存中，会话随服务重启失效）
+stream_sessions = {}
+# 已结束的会话（状态与 static/streams/<session_id>/ 分段）保留的时长（小时），新会话开始时清理
+STREAM_TTL_HOURS = float(os.environ.get('STREAM_TTL_HOURS', 24))
+
+
+def split_sentences(chunks, min_chars=4, max_chars=40):
+    """将 LLM 增量文本切分为句子，尽早产出第一句以便 TTS 开始合成"""
+    buf = ''
+    for chunk in chunks:
+        buf += chunk
+        while buf:
+            cut = -1
+            for i, ch in enumerate(buf):
+                # 英文句号需后接空格，避免切开小数
+                is_end = ch in SENTENCE_END or (ch == '.' and buf[i + 1:i + 2] == ' ')
+                if is_end and i + 1 >= min_chars:
+                    cut = i + 1
+                    break
+            if cut < 0 and len(buf) > max_chars:
+                soft = [i for i, ch in enumerate(buf[:max_chars]) if ch in SOFT_BREAK]
+                cut = soft[-1] + 1 if soft else max_chars
+            if cut < 0:
+                break
+            sentence, buf = buf[:cut].strip(), buf[cut:]
+            if sentence.strip(SENTENCE_END + SOFT_BREAK + ' '):
+                yield sentence
+    if buf.strip(SENTENCE_END + SOFT_BREAK + ' '):
+        yield buf.strip()
+
+
+def tts_stream(text, prompt_wav, language='zh', speed=1.0):
+    """调用 CosyVoice 常驻服务流式合成，产出 (sample_rate, pcm_bytes)"""
+    payload = {
+        'tts_text': text,
+        'prompt_wav': os.path.abspath(prompt_wav),
+        'prompt_text': text[:50],  # 与 text_to_speech_cosyvoice 相同的简化处理
+        'language': language,
+        'speed': speed,
+    }
+    req = urllib.request.Request(
+        f"{COSYVOICE_SERVER.rstrip('/')}/synthesize_stream",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(req, timeout=600) as resp:
+        sample_rate = int(resp.headers.get('X-Sample-Rate', 24000))
+        while True:
+            data = resp.read1(65536)
+            if not data:
+                break
+            yield sample_rate, data
+
+
+def server_alive(base_url):
+    if not base_url:
+        return False
+    try:
+        with urllib.request.urlopen(f"{base_url.rstrip('/')}/health", timeout=2) as resp:
+            return resp.status == 200
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return False
+
+
+def update_features(stream_id, wav_path, final, render_args):
+    """把新增音频追加到渲染服务的增量特征流，返回 (整段特征文件, 已定稿帧数)"""
+    payload = {
+        'stream_id': stream_id,
+        'final': final,
+        'work_dir': os.path.abspath(render_args['work_dir']),
+        'audio_extractor': render_args['audio_extractor'],
+        'model_path': render_args['model_path'],
+    }
+    if wav_path:
+        payload['wav'] = os.path.abspath(wav_path)
+    req = urllib.request.Request(
+        f"{TG_RENDER_SERVER.rstrip('/')}/features",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"特征提取失败 {e.code}: {e.read().decode('utf-8', 'ignore')}")
+    if result.get('status') != 'success':
+        raise RuntimeError(f"特征提取失败: {result.get('message')}")
+    return result['feature_file'], int(result['frames'])
+
+
+def write_wav(path, pcm, sample_rate):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+
+
+class StreamSession:
+    """一次流式对话：分段文件与 HLS 播放列表位于 static/streams/<session_id>/"""
+
+    def __init__(self, session_id, work_dir=None):
+        self.session_id = session_id
+        # 请求工作目录（分段音轨与特征），会话结束前不被清理
+        self.work_dir = work_dir
+        self.dir = os.path.join(STREAM_ROOT, session_id)
+        os.makedirs(self.dir, exist_ok=True)
+        self.playlist = os.path.join(self.dir, "playlist.m3u8")
+        self.segments = []  # [(文件名, 时长)]
+        self.reply_text = ''
+        self.finished = False
+        self.finished_at = None
+        self.error = None
+        self.created = time.time()
+        self.first_segment_latency = None
+        self.lock = threading.Lock()
+        self.write_playlist()
+
+    def write_playlist(self):
+        target = math.ceil(max(FIRST_SEGMENT_SECONDS, SEGMENT_SECONDS))
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-PLAYLIST-TYPE:EVENT",
+                 f"#EXT-X-TARGETDURATION:{target}", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for name, duration in self.segments:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+        tmp = self.playlist + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.playlist)
+
+    def add_segment(self, name, duration):
+        with self.lock:
+            self.segments.append((name, duration))
+            if self.first_segment_latency is None:
+                self.first_segment_latency = time.time() - self.created
+                print(f"[backend.stream_pipeline] 首个视频分段就绪，用时 {self.first_segment_latency:.2f}s")
+            self.write_playlist()
+
+    def finish(self, error=None):
+        with self.lock:
+            self.error = error
+            self.finished = True
+            self.finished_at = time.time()
+            self.write_playlist()
+
+    def status(self):
+        return {
+            'status': 'error' if self.error else ('finished' if self.finished else 'running'),
+            'message': self.error or '',
+            'reply_text': self.reply_text,
+            'segments': len(self.segments),
+            'first_segment_latency': self.first_segment_latency,
+            'playlist_url': "/" + self.playlist.replace("\\", "/"),
+        }
+
+
+def cleanup_stream_sessions(max_age_hours=STREAM_TTL_HOURS):
+    """删除结束超过保留时长的会话及其分段目录；不在内存中的目录（服务重启前的会话）按修改时间清理"""
+    if max_age_hours <= 0:
+        return
+    deadline = time.time() - max_age_hours * 3600
+    for session_id, session in list(stream_sessions.items()):
+        if session.finished and session.finished_at < deadline:
+            stream_sessions.pop(session_id, None)
+            shutil.rmtree(session.dir, ignore_errors=True)
+    if not os.path.isdir(STREAM_ROOT):
+        return
+    for name in os.listdir(STREAM_ROOT):
+        path = os.path.join(STREAM_ROOT, name)
+        try:
+            if name not in stream_sessions and os.path.isdir(path) and os.path.getmtime(path) < deadline:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def render_worker(session, jobs, render_args):
+    """渲染线程：音频段 → 常驻渲染服务 → MPEG-TS 分段 → 播放列表"""
+    offset = 0.0
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        index, wav_path, start_frame, num_frames, feature_file = job
+        duration = num_frames / FPS
+        if session.error:
+            continue
+        try:
+            seg_mp4 = os.path.join(session.dir, f"seg_{index:05d}.mp4")
+            video = render_with_server(wav_path, seg_mp4, start_frame=start_frame, feature_file=feature_file,
+                                       num_frames=num_frames, **render_args)
+            if video is None:
+                raise RuntimeError("渲染服务不可用或渲染失败")
+
+            seg_name = f"seg_{index:05d}.ts"
+            # 时间戳按累计时长偏移，分段拼接后音画连续
+            cmd = ["ffmpeg", "-y", "-i", seg_mp4, "-c", "copy",
+                   "-output_ts_offset", f"{offset:.3f}", "-muxdelay", "0",
+                   "-f", "mpegts", os.path.join(session.dir, seg_name)]
+            r = subprocess.run(cmd, capture_output=True, text=True)
+            if r.returncode != 0:
+                raise RuntimeError(f"ffmpeg 分段封装失败: {r.stderr}")
+            session.add_segment(seg_name, duration)
+            offset += duration
+        except Exception as e:
+            traceback.print_exc()
+            session.error = f"分段渲染失败: {e}"
+
+
+def run_stream(session, llm_input, api_choice, prompt_wav, language, speed, render_args):
+    """流水线主线程：LLM 流 → 分句 → TTS 流 → 帧对齐音频段 → 渲染队列"""
+    jobs = queue.Queue()
+    worker = threading.Thread(target=render_worker, args=(session, jobs, render_args), daemon=True)
+    worker.start()
+
+    pcm = bytearray()      # 尚未切成分段的音频
+    unfed = bytearray()    # 尚未送去提取特征的音频
+    waiting = []           # 已切好、等待特征定稿的分段 (index, wav_path, start_frame, num_frames)
+    sample_rate = None
+    index = 0
+    start_frame = 0
+    feed_index = 0
+    # 分段音轨与特征输入属于中间文件，放在请求工作目录而非公开的 static/streams
+    audio_dir = os.path.join(render_args['work_dir'], "stream")
+    os.makedirs(audio_dir, exist_ok=True)
+
+    def emit(pcm_bytes):
+        nonlocal index, start_frame
+        wav_path = os.path.join(audio_dir, f"seg_{index:05d}.wav")
+        write_wav(wav_path, bytes(pcm_bytes), sample_rate)
+        num_frames = len(pcm_bytes) // 2 // (sample_rate // FPS)
+        waiting.append((index, wav_path, start_frame, num_frames))
+        index += 1
+        start_frame += num_frames
+
+    def feed(final=False):
+        """送出新增音频；特征定稿到分段末尾之后 AUDIO_WINDOW_LOOKAHEAD 帧的分段交给渲染线程"""
+        nonlocal feed_index
+        wav_path = None
+        if unfed:
+            wav_path = os.path.join(audio_dir, f"feed_{feed_index:05d}.wav")
+            write_wav(wav_path, bytes(unfed), sample_rate)
+            unfed.clear()
+            feed_index += 1
+        feature_file, frames = update_features(session.session_id, wav_path, final, render_args)
+        while waiting and (final or waiting[0][2] + waiting[0][3] + AUDIO_WINDOW_LOOKAHEAD <= frames):
+            jobs.put(waiting.pop(0) + (feature_file,))
+
+    try:
+        reply = []
+
+        def llm_chunks():
+            for chunk in query_llm_stream(llm_input, api_choice):
+                reply.append(chunk)
+                session.reply_text = ''.join(reply)
+                yield chunk
+
+        for sentence in split_sentences(llm_chunks()):
+            print(f"[backend.stream_pipeline] 合成句子: {sentence}")
+            for sr, data in tts_stream(sentence, prompt_wav, language, speed):
+                sample_rate = sr
+                pcm.extend(data)
+                unfed.extend(data)
+                # 分段按整帧切分：每帧 sample_rate / FPS 个采样
+                frame_bytes = (sample_rate // FPS) * 2
+                seconds = FIRST_SEGMENT_SECONDS if index == 0 else SEGMENT_SECONDS
+                segment_bytes = round(seconds * FPS) * frame_bytes
+                while len(pcm) >= segment_bytes:
+                    emit(pcm[:segment_bytes])
+                    del pcm[:segment_bytes]
+                    segment_bytes = round(SEGMENT_SECONDS * FPS) * frame_bytes
+                if waiting and len(unfed) >= FEATURE_FEED_SECONDS * sample_rate * 2:
+                    feed()
+                if session.error:
+                    raise RuntimeError(session.error)
+
+        if sample_rate:
+            if pcm:
+                # 末段补静音到整帧
+                frame_bytes = (sample_rate // FPS) * 2
+                padding = b'\x00' * ((-len(pcm)) % frame_bytes)
+                pcm.extend(padding)
+                unfed.extend(padding)
+                emit(pcm)
+            feed(final=True)
+
+        # 保存回复文本到请求工作目录（与 chat_response 一致）
+        with open(os.path.join(render_args['work_dir'], "output.txt"), 'w', encoding='utf-8') as f:
+            f.write(session.reply_text)
+    except Exception as e:
+        traceback.print_exc()
+        session.error = session.error or f"流式合成失败: {e}"
+    finally:
+        jobs.put(None)
+        worker.join()
+        session.finish(session.error)
+        print(f"[backend.stream_pipeline] 会话结束 {session.session_id}: {len(session.segments)} 段, "
+              f"总用时 {time.time() - session.created:.2f}s")
+
+
+def start_chat_stream(data):
+    """
+    启动流式对话：完成 ASR 后立即返回 HLS 播放列表地址，其余阶段在后台线程中流水执行。
+    常驻服务未启动时返回 error，前端应回退到 /chat_system。
+    """
+    if not server_alive(COSYVOICE_SERVER) or not server_alive(TG_RENDER_SERVER):
+        return {'status': 'error', 'message': '流式模式需要先启动 CosyVoice 与 TalkingGaussian 常驻服务'}
+
+    workspace = data.get('workspace') or create_workspace('stream')
+    input_audio = data.get('input_audio') or "./static/audios/input.wav"
+    recognized_text = data.get('recognized_text')
+    if not recognized_text:
+        if not os.path.exists(input_audio):
+            return {'status': 'error', 'message': f'音频文件不存在: {input_audio}'}
+        recognized_text = audio_to_text(input_audio, os.path.join(workspace, "input.txt"))
+    if not recognized_text:
+        return {'status': 'error', 'message': '语音识别失败'}
+
+    prompt_wav = resolve_voice_clone_reference(data)
+    if prompt_wav is None:
+        return {'status': 'error', 'message': '语音克隆失败：参考音频不存在'}
+    prompt_wav = prepare_prompt_wav(prompt_wav)
+
+    is_valid, model_path, error_msg = validate_model_path(data.get('model_param') or 'output/talking_May')
+    if not is_valid:
+        return {'status': 'error', 'message': error_msg}
+    dataset_path = extract_relative_path(data.get('dataset_path', 'data/May'), required_folder='data') or 'data/May'
+
+    cosyvoice_params = data.get('cosyvoice_params', {})
+    language = cosyvoice_params.get('language', 'zh')
+    speed = cosyvoice_params.get('speed', 1.0)
+    if language == 'en':
+        llm_input = f"Please answer in English: {recognized_text}"
+    else:
+        llm_input = f"请用中文回答：{recognized_text}"
+
+    render_args = {
+        'model_path': model_path,
+        'dataset_path': dataset_path,
+        'audio_extractor': data.get('audio_extractor', 'deepspeech'),
+        'sh_degree': data.get('inference_params', {}).get('sh_degree', 2),
+        # 各分段的音频特征写入请求工作目录
+        'work_dir': workspace,
+    }
+
+    cleanup_stream_sessions()
+    session_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    session = StreamSession(session_id, workspace)
+    stream_sessions[session_id] = session
+    thread = threading.Thread(target=run_stream, daemon=True,
+                              args=(session, llm_input, data.get('api_choice', 'zhipu'), prompt_wav,
+                                    language, speed, render_args))
+    thread.start()
+
+    result = session.status()
+    result.update({'status': 'started', 'session_id': session_id, 'input_text': recognized_text})
+    return result
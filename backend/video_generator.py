@@ -1,9 +1,16 @@
 import os
+import json
 import time
 import subprocess
 import shutil
-import glob
+import urllib.request
+import urllib.error
 from pathlib import Path
+from backend.job_queue import report_progress, run_process
+from backend.workspace import create_workspace, workspace_id
+
+# TalkingGaussian 常驻渲染服务地址（bash run_talkinggaussian.sh serve 启动），置空则始终走脚本
+TG_RENDER_SERVER = os.environ.get('TG_RENDER_SERVER', 'http://127.0.0.1:5010')
 
 def extract_relative_path(path_str, required_folder=None):
     """
@@ -72,6 +79,54 @@ def validate_model_path(model_path):
     
     return True, normalized_path, None
 
+def render_with_server(audio_path, destination_path, model_path, dataset_path, audio_extractor, sh_degree, start_frame=0, work_dir=None,
+                       feature_file=None, num_frames=None):
+    """
+    调用常驻渲染服务生成视频，模型常驻显存，省去每次请求的环境启动与模型加载。
+    服务不可用时返回 None，由调用方回退到 run_talkinggaussian.sh。
+    start_frame: 流式分段渲染时本段的起始帧（保持相邻分段姿态连续）
+    work_dir: 音频特征等中间文件目录（请求工作目录），缺省为 TalkingGaussian/test_result
+    feature_file / num_frames: 流式分段使用服务端累积的整段特征，只渲染 [start_frame, start_frame + num_frames)，
+                               audio_path 仅作为本段音轨，不再逐段提取特征
+    """
+    if not TG_RENDER_SERVER:
+        return None
+
+    payload = {
+        'wav': os.path.abspath(audio_path),
+        'out': os.path.abspath(destination_path),
+        'model_path': model_path,
+        'dataset_path': dataset_path,
+        'audio_extractor': audio_extractor,
+        'sh_degree': sh_degree,
+        'start_frame': start_frame,
+    }
+    if work_dir:
+        payload['work_dir'] = os.path.abspath(work_dir)
+    if feature_file:
+        payload['feature_file'] = os.path.abspath(feature_file)
+        payload['num_frames'] = num_frames
+    req = urllib.request.Request(
+        f"{TG_RENDER_SERVER.rstrip('/')}/render",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=1800) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        print(f"[backend.video_generator] 渲染服务返回错误 {e.code}: {e.read().decode('utf-8', 'ignore')}")
+        return None
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        print(f"[backend.video_generator] 渲染服务不可用（{e}），回退到脚本方式")
+        return None
+
+    if result.get('status') == 'success' and os.path.exists(destination_path):
+        print(f"[backend.video_generator] 渲染服务完成 {result.get('frames')} 帧，路径：{destination_path}")
+        return destination_path
+    print(f"[backend.video_generator] 渲染服务失败: {result.get('message')}")
+    return None
+
 def generate_video(data):
     """
     模拟视频生成逻辑：接收来自前端的参数，并返回一个视频路径。
@@ -108,20 +163,30 @@ def generate_video(data):
             if not dataset_path:
                 dataset_path = 'data/May'  # 默认值
             
-            # 生成输出视频文件名
+            # 输出路径与工作目录由调用方显式给出；未给出时按请求生成唯一路径
+            workspace = data.get('workspace') or create_workspace('video')
             audio_name = os.path.splitext(os.path.basename(audio_path))[0]
-            video_filename = f"talkinggaussian_{audio_name}.mp4"
-            destination_path = os.path.join("static", "videos", video_filename)
+            destination_path = data.get('output_path') or os.path.join(
+                "static", "videos", f"talkinggaussian_{audio_name}_{workspace_id(workspace)}.mp4")
             
             # 确保输出目录存在
             os.makedirs(os.path.dirname(destination_path), exist_ok=True)
             
+            report_progress('渲染视频', 0.5)
+            # 优先使用常驻渲染服务（服务所在 GPU 由其启动时的 CUDA_VISIBLE_DEVICES 决定）
+            video_path = render_with_server(audio_path, destination_path, model_path, dataset_path,
+                                            audio_extractor, sh_degree, work_dir=workspace)
+            if video_path:
+                return video_path
+            
             # 构建命令 - 使用 run_talkinggaussian.sh 封装脚本
             # 注意：model_path 和 dataset_path 已经是统一后的相对路径格式
+            # --workdir：中间文件写入工作目录，最终视频直接写到 --out，不再按时间查找
             cmd = [
                 'bash', 'TalkingGaussian/run_talkinggaussian.sh', 'infer',
                 '--wav', audio_path,
                 '--out', destination_path,
+                '--workdir', os.path.abspath(workspace),
                 '--extractor', audio_extractor,
                 '--dataset', dataset_path,
                 '--model', model_path,
@@ -137,7 +202,7 @@ def generate_video(data):
                 env['CUDA_VISIBLE_DEVICES'] = gpu_id
             
             # 执行命令
-            result = subprocess.run(
+            result = run_process(
                 cmd,
                 capture_output=True,
                 text=True,
@@ -149,53 +214,9 @@ def generate_video(data):
             if result.stderr:
                 print("命令标准错误:", result.stderr)
             
-            # 检查输出文件是否存在（可能是不带时间戳的）
-            if os.path.exists(destination_path):
-                # 检查文件时间，确保是新生成的（允许10秒误差）
-                file_mtime = os.path.getmtime(destination_path)
-                current_time = time.time()
-                if current_time - file_mtime <= 60:  # 1分钟内生成的文件
-                    print(f"[backend.video_generator] 视频生成完成，路径：{destination_path}")
-                    return destination_path
-            
-            # 查找实际生成的带时间戳的文件
-            audio_basename = os.path.splitext(os.path.basename(audio_path))[0]
-            video_dir = os.path.dirname(destination_path)
-            video_basename = os.path.splitext(os.path.basename(destination_path))[0]
-            
-            # 查找匹配的带时间戳的文件
-            pattern = os.path.join(video_dir, f"{video_basename}_*.mp4")
-            matching_files = glob.glob(pattern)
-            
-            if matching_files:
-                # 找到最新的文件（按修改时间）
-                latest_file = max(matching_files, key=os.path.getmtime)
-                latest_mtime = os.path.getmtime(latest_file)
-                current_time = time.time()
-                
-                # 检查是否是新生成的文件（1分钟内）
-                if current_time - latest_mtime <= 60:
-                    print(f"[backend.video_generator] 找到新生成的视频文件: {latest_file}")
-                    return latest_file
-                else:
-                    print(f"[backend.video_generator] 找到文件但时间过旧: {latest_file}")
-            
-            # 尝试查找 test_result 目录中的文件
-            test_result_dir = "TalkingGaussian/test_result"
-            if os.path.exists(test_result_dir):
-                # 查找最新的 final.mp4 文件
-                final_files = [f for f in os.listdir(test_result_dir) 
-                             if f.startswith(audio_basename) and f.endswith('_final.mp4')]
-                if final_files:
-                    latest_file = max(final_files, key=lambda f: os.path.getmtime(os.path.join(test_result_dir, f)))
-                    source_path = os.path.join(test_result_dir, latest_file)
-                    # 复制到目标位置（带时间戳）
-                    ts = time.strftime('%Y%m%d_%H%M%S')
-                    video_name, video_ext = os.path.splitext(os.path.basename(destination_path))
-                    timestamped_path = os.path.join(video_dir, f"{video_name}_{ts}{video_ext}")
-                    shutil.copy(source_path, timestamped_path)
-                    print(f"[backend.video_generator] 从test_result复制到: {timestamped_path}")
-                    return timestamped_path
+            if result.returncode == 0 and os.path.exists(destination_path):
+                print(f"[backend.video_generator] 视频生成完成，路径：{destination_path}")
+                return destination_path
                 
             print(f"[backend.video_generator] 视频文件不存在: {destination_path}")
             return os.path.join("static", "videos", "out.mp4")
@@ -212,19 +233,27 @@ def generate_video(data):
     
     elif data['model_name'] == "SyncTalk":
         try:
-            
-            # 构建命令
+            # 与 TalkingGaussian 分支一致：输出路径由调用方显式给出，未给出时按请求生成唯一路径
+            model_dir_name = os.path.basename(os.path.normpath(data['model_param']))
+            audio_name = os.path.splitext(os.path.basename(data['ref_audio']))[0]
+            workspace = data.get('workspace') or create_workspace('video')
+            destination_path = data.get('output_path') or os.path.join(
+                "static", "videos", f"{model_dir_name}_{audio_name}_{workspace_id(workspace)}.mp4")
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+
+            # 构建命令：--output 让 run_synctalk.sh 使用本次推理独立的结果目录，并把视频直接写到目标路径
             cmd = [
                 './SyncTalk/run_synctalk.sh', 'infer',
                 '--model_dir', data['model_param'],
                 '--audio_path', data['ref_audio'],
-                '--gpu', data['gpu_choice']
+                '--gpu', data['gpu_choice'],
+                '--output', os.path.abspath(destination_path)
             ]
 
             print(f"[backend.video_generator] 执行命令: {' '.join(cmd)}")
 
             # 执行命令
-            result = subprocess.run(
+            result = run_process(
                 cmd,
                 capture_output=True,
                 text=True
@@ -235,31 +264,12 @@ def generate_video(data):
             if result.stderr:
                 print("命令标准错误:", result.stderr)
             
-            # 文件原路径与目的路径 
-            model_dir_name = os.path.basename(data['model_param'])
-            source_path = os.path.join("SyncTalk", "model", model_dir_name, "results", "test_audio.mp4")
-            audio_name = os.path.splitext(os.path.basename(data['ref_audio']))[0]
-            video_filename = f"{model_dir_name}_{audio_name}.mp4"
-            destination_path = os.path.join("static", "videos", video_filename)
-            # 检查文件是否存在
-            if os.path.exists(source_path):
-                shutil.copy(source_path, destination_path)
+            if result.returncode == 0 and os.path.exists(destination_path):
                 print(f"[backend.video_generator] 视频生成完成，路径：{destination_path}")
                 return destination_path
-            else:
-                print(f"[backend.video_generator] 视频文件不存在: {source_path}")
-                # 尝试查找任何新生成的mp4文件
-                results_dir = os.path.join("SyncTalk", "model", model_dir_name, "results")
-                if os.path.exists(results_dir):
-                    mp4_files = [f for f in os.listdir(results_dir) if f.endswith('.mp4')]
-                    if mp4_files:
-                        latest_file = max(mp4_files, key=lambda f: os.path.getctime(os.path.join(results_dir, f)))
-                        source_path = os.path.join(results_dir, latest_file)
-                        shutil.copy(source_path, destination_path)
-                        print(f"[backend.video_generator] 找到最新视频文件: {destination_path}")
-                        return destination_path
-                
-                return os.path.join("static", "videos", "out.mp4")
+
+            print(f"[backend.video_generator] 视频文件不存在: {destination_path}")
+            return os.path.join("static", "videos", "out.mp4")
             
         except subprocess.CalledProcessError as e:
             print(f"[backend.video_generator] 命令执行失败: {e}")
@@ -0,0 +1,69 @@
+"""
+请求级工作目录
+
+每个请求的中间文件（录音快照、ASR/LLM 文本、TTS 音频、音频特征）都放在独立目录
+workspaces/<workspace_id>/ 下，各阶段之间显式传递路径，
+不再共用 static/audios/input.wav、static/text/output.txt、test_result/<name>_final.mp4 等固定文件，
+多个请求可以并行执行而不互相覆盖。
+
+工作目录不在 static/ 下：Flask 会原样公开 static/ 中的所有文件，录音与对话文本不能通过 URL 访问。
+对外只提供最终视频，由调用方通过 output_path 直接写到 static/videos/。
+"""
+
+import os
+import time
+import uuid
+import shutil
+
+WORKSPACE_ROOT = os.environ.get('WORKSPACE_ROOT', 'workspaces')
+# 超过该时长（小时）未使用的工作目录由 cleanup_workspaces 清理（app.py 在创建新目录时调用）
+WORKSPACE_TTL_HOURS = float(os.environ.get('WORKSPACE_TTL_HOURS', 24))
+
+
+def create_workspace(prefix='req'):
+    """创建新的工作目录，返回其相对路径"""
+    workspace_id = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    path = os.path.join(WORKSPACE_ROOT, workspace_id)
+    os.makedirs(path)
+    return path
+
+
+def touch_workspace(path):
+    """更新工作目录的修改时间（写入子目录不会更新它），任务开始与结束时调用，过期时间从最近一次使用算起"""
+    try:
+        os.utime(path)
+    except (OSError, TypeError):
+        pass
+
+
+def workspace_id(path):
+    return os.path.basename(os.path.normpath(path))
+
+
+def cleanup_workspaces(max_age_hours=WORKSPACE_TTL_HOURS, keep=()):
+    """删除过期的工作目录；keep 为仍在使用的工作目录（排队中或运行中的任务），不论新旧都保留"""
+    if max_age_hours <= 0 or not os.path.isdir(WORKSPACE_ROOT):
+        return
+    keep = {workspace_id(path) for path in keep if path}
+    deadline = time.time() - max_age_hours * 3600
+    for name in os.listdir(WORKSPACE_ROOT):
+        path = os.path.join(WORKSPACE_ROOT, name)
+        if name in keep:
+            continue
+        try:
+            if os.path.isdir(path) and os.path.getmtime(path) < deadline:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def snapshot_input_audio(workspace, input_audio):
+    """
+    把录音复制到工作目录，排队中的请求不会读到之后的新录音。
+    返回工作目录中的路径，源文件不存在时返回 None。
+    """
+    if not input_audio or not os.path.exists(input_audio):
+        return None
+    target = os.path.join(workspace, "input" + (os.path.splitext(input_audio)[1] or ".wav"))
+    shutil.copy2(input_audio, target)
+    return target
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 测试从仓库根目录导入 backend 包（与 app.py 相同）
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,83 @@
+"""
+backend/job_queue.py：训练与渲染分线路排队，取消运行中的任务时终止其子进程
+"""
+
+import sys
+import time
+import threading
+
+import pytest
+
+from backend import job_queue as jq
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return jq.JobQueue(db_path=str(tmp_path / "jobs.db"), workers_per_gpu=1)
+
+
+def test_chat_not_blocked_by_training(queue):
+    release = threading.Event()
+    queue.register('training', lambda data: release.wait(10) and {'status': 'success'})
+    queue.register('chat', lambda data: {'status': 'success', 'video_path': data['name']})
+
+    training = queue.submit('training', {}, gpu='GPU0')
+    assert wait_for(lambda: queue.get(training)['status'] == jq.RUNNING)
+
+    chat = queue.submit('chat', {'name': 'a.mp4'}, gpu='GPU0')
+    assert wait_for(lambda: queue.get(chat)['status'] == jq.SUCCESS)
+    assert queue.get(training)['status'] == jq.RUNNING
+    release.set()
+    assert wait_for(lambda: queue.get(training)['status'] == jq.SUCCESS)
+
+
+def test_render_jobs_share_a_lane_per_gpu(queue):
+    release = threading.Event()
+    queue.register('video_generation', lambda data: release.wait(10) and {})
+    queue.register('chat', lambda data: {})
+
+    video = queue.submit('video_generation', {}, gpu='GPU0')
+    assert wait_for(lambda: queue.get(video)['status'] == jq.RUNNING)
+    chat = queue.submit('chat', {}, gpu='GPU0')
+    time.sleep(0.3)
+    job = queue.get(chat)
+    assert job['status'] == jq.QUEUED
+    assert job['position'] == 1
+    release.set()
+    assert wait_for(lambda: queue.get(chat)['status'] == jq.SUCCESS)
+
+
+def test_cancel_terminates_running_process(queue):
+    started = threading.Event()
+
+    def handler(data):
+        started.set()
+        jq.run_process([sys.executable, "-c", "import time; time.sleep(60)"])
+        return {'status': 'success'}
+
+    queue.register('training', handler)
+    job_id = queue.submit('training', {}, gpu='GPU0')
+    assert started.wait(10)
+    assert wait_for(lambda: job_id in queue.processes)
+    proc = queue.processes[job_id]
+
+    start = time.time()
+    queue.cancel(job_id)
+    assert wait_for(lambda: queue.get(job_id)['status'] == jq.CANCELLED)
+    assert proc.poll() is not None
+    assert time.time() - start < 10
+
+
+def test_run_process_outside_job_matches_subprocess_run():
+    result = jq.run_process([sys.executable, "-c", "print('ok')"], capture_output=True, text=True)
+    assert result.returncode == 0
+    assert result.stdout.strip() == 'ok'
@@ -0,0 +1,137 @@
+"""
+backend/llm_service.py：用本地 OpenAI 兼容桩服务验证客户端复用、配置热加载、流式输出与回复缓存
+"""
+
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+from backend import llm_service
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 长连接，用于确认客户端复用连接池
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append({"path": self.path, "auth": self.headers.get("Authorization"), **body})
+        reply = f"{body['model']}: {body['messages'][-1]['content']}"
+        if body.get("stream"):
+            chunks = [reply[:4], reply[4:]]
+            lines = [{"id": "c", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                      "choices": [{"index": 0, "delta": {"content": c}, "finish_reason": None}]} for c in chunks]
+            data = "".join(f"data: {json.dumps(line)}\n\n" for line in lines) + "data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            data = json.dumps({"id": "c", "object": "chat.completion", "created": 0, "model": body["model"],
+                               "choices": [{"index": 0, "finish_reason": "stop",
+                                            "message": {"role": "assistant", "content": reply}}]})
+            content_type = "application/json"
+        data = data.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def write_config(path, base_url, model, api_key="sk-test"):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"deepseek": {"api_key": api_key, "base_url": base_url, "model": model, "enabled": True}}, f)
+
+
+@pytest.fixture
+def service(tmp_path, stub_server, monkeypatch):
+    for key in llm_service.PROVIDERS:
+        for suffix in ("API_KEY", "BASE_URL", "MODEL"):
+            monkeypatch.delenv(f"{key.upper()}_{suffix}", raising=False)
+    config_file = str(tmp_path / "api_config.json")
+    write_config(config_file, f"http://127.0.0.1:{stub_server.server_port}/v1", "stub-1")
+    monkeypatch.setattr(llm_service, "CONFIG_FILE", config_file)
+    monkeypatch.setattr(llm_service, "_config_sig", None)
+    monkeypatch.setattr(llm_service, "_clients", {})
+    monkeypatch.setattr(llm_service, "_reply_cache", llm_service.OrderedDict())
+    monkeypatch.setattr(llm_service, "LLM_REPLY_CACHE_SIZE", 0)
+    return config_file
+
+
+def test_client_reused_across_calls(service, stub_server):
+    assert llm_service.query_llm("你好", "deepseek") == "stub-1: 你好"
+    client = next(iter(llm_service._clients.values()))
+    assert llm_service.query_llm("再见", "deepseek") == "stub-1: 再见"
+
+    assert list(llm_service._clients.values()) == [client]
+    assert len(stub_server.requests) == 2
+    # 第二次请求走同一条长连接
+    assert stub_server.connections == 1
+
+
+def test_config_reloaded_after_touch(service, stub_server):
+    assert llm_service.query_llm("你好", "deepseek") == "stub-1: 你好"
+
+    write_config(service, f"http://127.0.0.1:{stub_server.server_port}/v1", "stub-2", api_key="sk-other")
+    mtime = os.path.getmtime(service) + 10
+    os.utime(service, (mtime, mtime))
+
+    assert llm_service.query_llm("你好", "deepseek") == "stub-2: 你好"
+    assert stub_server.requests[-1]["auth"] == "Bearer sk-other"
+    # 密钥变化后按新的 (base_url, api_key) 建立客户端
+    assert len(llm_service._clients) == 2
+
+
+def test_config_not_reloaded_when_unchanged(service, stub_server, monkeypatch):
+    llm_service.get_api_config()
+    calls = []
+    monkeypatch.setattr(llm_service, "load_api_config", lambda: calls.append(1))
+    llm_service.query_llm("你好", "deepseek")
+    assert calls == []
+
+
+def test_query_llm_stream_yields_tokens(service, stub_server):
+    tokens = list(llm_service.query_llm_stream("讲个笑话", "deepseek"))
+
+    assert len(tokens) == 2
+    assert "".join(tokens) == "stub-1: 讲个笑话"
+    assert stub_server.requests[-1]["stream"] is True
+
+
+def test_reply_cache_hit_on_normalized_prompt(service, stub_server, monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_REPLY_CACHE_SIZE", 2)
+
+    first = llm_service.query_llm("Hello  World!", "deepseek")
+    assert len(stub_server.requests) == 1
+    # 大小写、空白与句末标点不同的同一问题命中缓存，不再请求服务
+    assert llm_service.query_llm("  hello world。", "deepseek") == first
+    assert list(llm_service.query_llm_stream("HELLO WORLD", "deepseek")) == [first]
+    assert len(stub_server.requests) == 1
+
+    # 超过容量时淘汰最久未使用的回复
+    llm_service.query_llm("问题二", "deepseek")
+    llm_service.query_llm("问题三", "deepseek")
+    llm_service.query_llm("hello world", "deepseek")
+    assert len(stub_server.requests) == 4
@@ -0,0 +1,41 @@
+"""
+backend/workspace.py：过期工作目录清理跳过仍在使用的目录
+"""
+
+import os
+import time
+
+from backend import workspace
+
+
+def make_old(path, hours):
+    mtime = time.time() - hours * 3600
+    os.utime(path, (mtime, mtime))
+
+
+def test_cleanup_keeps_in_use_workspaces(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "WORKSPACE_ROOT", str(tmp_path))
+    queued = workspace.create_workspace("chat")
+    expired = workspace.create_workspace("chat")
+    fresh = workspace.create_workspace("chat")
+    # 写入子目录不会更新工作目录本身的修改时间
+    os.makedirs(os.path.join(queued, "stream"))
+    for path in (queued, expired):
+        make_old(path, 48)
+
+    workspace.cleanup_workspaces(max_age_hours=24, keep={queued})
+
+    assert os.path.isdir(queued)
+    assert not os.path.exists(expired)
+    assert os.path.isdir(fresh)
+
+
+def test_touch_restarts_ttl(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "WORKSPACE_ROOT", str(tmp_path))
+    path = workspace.create_workspace("chat")
+    make_old(path, 48)
+    workspace.touch_workspace(path)
+
+    workspace.cleanup_workspaces(max_age_hours=24)
+
+    assert os.path.isdir(path)